@@ -86,6 +86,30 @@ DATABASES = {
     )
 }
 
+# Redis（レートリミット・キャッシュをワーカー間で共有する）
+# 未設定の場合はプロセス内メモリにフォールバック（ローカル開発・テスト用）
+REDIS_URL = os.environ.get("REDIS_URL", "")
+REDIS_SOCKET_TIMEOUT = float(os.environ.get("REDIS_SOCKET_TIMEOUT", "0.5"))
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# 2段キャッシュ（phrases.cache）: プロセス内L1の件数上限とTTL（秒）
+CACHE_L1_MAXSIZE = int(os.environ.get("CACHE_L1_MAXSIZE", "2048"))
+CACHE_L1_TTL = float(os.environ.get("CACHE_L1_TTL", "30"))
+CACHE_INVALIDATION_CHANNEL = os.environ.get("CACHE_INVALIDATION_CHANNEL", "phrases:cache:invalidate")
+
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
     {"NAME": "django.contrib.auth.password_validation.MinimumLengthValidator"},
@@ -122,6 +146,19 @@ REST_FRAMEWORK = {
     ),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.CursorPagination",
     "PAGE_SIZE": int(os.environ.get("API_PAGE_SIZE", 20)),
+    # クライアントIP（未ログイン時のレート制限の単位）を X-Forwarded-For の右から何番目で判定するか
+    # Render のロードバランサーが1段あり、その追加した値（右端）だけが信頼できる。
+    # 未設定だとクライアントが送った X-Forwarded-For 全体が使われ、値を変えるだけで制限を回避できる
+    "NUM_PROXIES": int(os.environ.get("NUM_PROXIES", "1")),
+}
+
+# エンドポイントごとのレート制限（phrases.ratelimit.SlidingWindowThrottle）
+RATE_LIMITS = {
+    "login": os.environ.get("RATE_LIMIT_LOGIN", "10/min"),
+    "signup": os.environ.get("RATE_LIMIT_SIGNUP", "5/hour"),
+    "password_reset": os.environ.get("RATE_LIMIT_PASSWORD_RESET", "5/hour"),
+    "playback_log": os.environ.get("RATE_LIMIT_PLAYBACK_LOG", "120/min"),
+    "contact": os.environ.get("RATE_LIMIT_CONTACT", "5/hour"),
 }
 
 SIMPLE_JWT = {
@@ -169,6 +206,68 @@ R2_BUCKET_NAME = os.environ.get("R2_BUCKET_NAME", "phrases")
 R2_SIGNED_URL_TTL = int(os.environ.get("R2_SIGNED_URL_TTL", "600"))  # デフォルト10分
 # 公開コンテンツ用のCache-Control設定
 R2_CACHE_CONTROL_PUBLIC = "public, max-age=31536000, immutable"  # 1年キャッシュ
+# アップロード設定: コネクションプール数とマルチパートの閾値・パートサイズ（MB）・並列数
+R2_MAX_POOL_CONNECTIONS = int(os.environ.get("R2_MAX_POOL_CONNECTIONS", "32"))
+R2_MULTIPART_THRESHOLD_MB = int(os.environ.get("R2_MULTIPART_THRESHOLD_MB", "16"))
+R2_MULTIPART_CHUNKSIZE_MB = int(os.environ.get("R2_MULTIPART_CHUNKSIZE_MB", "16"))
+R2_UPLOAD_CONCURRENCY = int(os.environ.get("R2_UPLOAD_CONCURRENCY", "8"))
+
+# メディア処理（ffmpeg）: 同時に動かすffmpegプロセス数と1ジョブのタイムアウト（秒）
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+FFPROBE_BINARY = os.environ.get("FFPROBE_BINARY", "ffprobe")
+MEDIA_FFMPEG_WORKERS = int(os.environ.get("MEDIA_FFMPEG_WORKERS", "2"))
+MEDIA_FFMPEG_TIMEOUT = int(os.environ.get("MEDIA_FFMPEG_TIMEOUT", "120"))
+MEDIA_TRANSCODE_TIMEOUT = int(os.environ.get("MEDIA_TRANSCODE_TIMEOUT", "900"))
+
+# 管理画面アップロードのバックグラウンド処理（MediaJob）
+# アップロードはwebプロセスのホストのステージング領域に置き、保存したプロセス内のワーカースレッドで処理する。
+# このプロセスで処理しないときや再試行するときはR2のステージング用プレフィックスに移し、
+# process_media_jobs ワーカー（再試行・取り残されたジョブの回収）で処理する
+# R2のライフサイクルルールで tmp/ 以下を数日で消すようにしておく
+MEDIA_JOB_STAGING_DIR = os.environ.get("MEDIA_JOB_STAGING_DIR", str(BASE_DIR / "media_staging"))
+MEDIA_JOB_STAGING_PREFIX = os.environ.get("MEDIA_JOB_STAGING_PREFIX", "tmp/media-jobs")
+MEDIA_JOBS_IN_PROCESS = os.environ.get("MEDIA_JOBS_IN_PROCESS", "true").lower() == "true"
+MEDIA_JOB_WORKERS = int(os.environ.get("MEDIA_JOB_WORKERS", "2"))
+MEDIA_JOB_MAX_ATTEMPTS = int(os.environ.get("MEDIA_JOB_MAX_ATTEMPTS", "3"))
+# アップロードしたメディアを内容のハッシュ（SHA-256）のキーで保存するか
+# 同じファイルを何度アップロードしてもR2のオブジェクトとCDNのキャッシュは1つで済む
+MEDIA_CONTENT_ADDRESSED_KEYS = os.environ.get("MEDIA_CONTENT_ADDRESSED_KEYS", "true").lower() == "true"
+
+# バッチ処理（バックフィル等）の再開用チェックポイントの保存先
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", str(BASE_DIR / ".checkpoints"))
+
+# 動画のレンディション（ビットレート別のMP4）
+# 高さ(px)と映像/音声のビットレート(kbps)。元動画より大きくはしない
+VIDEO_RENDITIONS = {
+    "low": {"height": 360, "video_kbps": 400, "audio_kbps": 64},
+    "mid": {"height": 540, "video_kbps": 1000, "audio_kbps": 96},
+    "high": {"height": 720, "video_kbps": 2500, "audio_kbps": 128},
+}
+# クライアントが申告するネットワーク種別（PlaybackLog.network_type と同じ値）→ レンディション
+# 申告が無い・未知の値の場合は元動画を返す
+NETWORK_RENDITIONS = {
+    "slow-2g": "low",
+    "2g": "low",
+    "3g": "low",
+    "cellular": "low",
+    "4g": "mid",
+    "5g": "high",
+    "wifi": "high",
+    "ethernet": "high",
+}
+# 管理画面から動画をアップロードしたときにレンディションも作成するか
+VIDEO_RENDITIONS_ON_UPLOAD = os.environ.get("VIDEO_RENDITIONS_ON_UPLOAD", "true").lower() == "true"
+
+# 動画から作る音声のみのトラック（リスニングモード用、AAC/.m4a）
+AUDIO_TRACK_KBPS = int(os.environ.get("AUDIO_TRACK_KBPS", "48"))
+AUDIO_TRACK_CHANNELS = int(os.environ.get("AUDIO_TRACK_CHANNELS", "1"))
+# audio_key が空の対象に動画をアップロードしたとき、音声トラックも作るか
+AUDIO_TRACK_ON_UPLOAD = os.environ.get("AUDIO_TRACK_ON_UPLOAD", "true").lower() == "true"
+
+# シーン画像のレスポンシブ用バリアント（幅px・フォーマット・品質）
+IMAGE_VARIANT_WIDTHS = [320, 480, 720, 1080]
+IMAGE_VARIANT_FORMATS = ["webp", "jpeg"]
+IMAGE_VARIANT_QUALITY = {"webp": 75, "jpeg": 80}
 
 # Email Configuration
 # SendGrid API Key (preferred method)
@@ -194,6 +293,17 @@ else:
     EMAIL_TIMEOUT = 30  # SMTP接続タイムアウト（秒）
 
 DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", "noreply@eitango.club")
+
+# メール送信キュー（EmailOutbox）: リクエスト内では送信せず send_outbox_emails ワーカーが送る
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get("EMAIL_OUTBOX_BATCH_SIZE", "50"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", "6"))
+EMAIL_OUTBOX_RETRY_BASE_SECONDS = int(os.environ.get("EMAIL_OUTBOX_RETRY_BASE_SECONDS", "30"))
+EMAIL_OUTBOX_RETRY_MAX_SECONDS = int(os.environ.get("EMAIL_OUTBOX_RETRY_MAX_SECONDS", "3600"))
+# プロバイダごとの同時送信数
+EMAIL_OUTBOX_CONCURRENCY = {
+    "sendgrid": int(os.environ.get("EMAIL_OUTBOX_SENDGRID_CONCURRENCY", "4")),
+    "smtp": int(os.environ.get("EMAIL_OUTBOX_SMTP_CONCURRENCY", "1")),
+}
 FRONTEND_URL = os.environ.get("FRONTEND_URL", "http://localhost:8081")
 # Deep link scheme for mobile apps (used in email verification links)
 APP_DEEP_LINK_SCHEME = os.environ.get("APP_DEEP_LINK_SCHEME", "")
@@ -204,7 +314,20 @@ ADMIN_EMAIL = os.environ.get("ADMIN_EMAIL", DEFAULT_FROM_EMAIL)
 GOOGLE_CLIENT_ID_IOS = os.environ.get("GOOGLE_CLIENT_ID_IOS", "")
 GOOGLE_CLIENT_ID_WEB = os.environ.get("GOOGLE_CLIENT_ID_WEB", "")
 GOOGLE_CLIENT_ID_ANDROID = os.environ.get("GOOGLE_CLIENT_ID_ANDROID", "")
+# IDトークン検証で許可するaudience（リクエスト毎に組み立てない）
+GOOGLE_CLIENT_IDS = [
+    client_id
+    for client_id in (GOOGLE_CLIENT_ID_IOS, GOOGLE_CLIENT_ID_WEB, GOOGLE_CLIENT_ID_ANDROID)
+    if client_id
+]
 
 # Apple Sign In Configuration
 APPLE_BUNDLE_ID = os.environ.get("APPLE_BUNDLE_ID", "jp.aiworks.eitango")
+# AppleのJWKS（ローカルのスタブサーバーで検証する場合は上書き）
+APPLE_JWKS_URL = os.environ.get("APPLE_JWKS_URL", "https://appleid.apple.com/auth/keys")
+
+# ソーシャルログインの鍵取得タイムアウト（秒）
+OAUTH_HTTP_TIMEOUT = float(os.environ.get("OAUTH_HTTP_TIMEOUT", "5"))
+# 起動時に鍵を事前取得する（オフライン環境ではfalseに）
+OAUTH_PREWARM = os.environ.get("OAUTH_PREWARM", "true").lower() == "true"
 
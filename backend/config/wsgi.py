@@ -8,9 +8,17 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 """
 
 import os
+import threading
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# ソーシャルログインの鍵を事前取得（起動をブロックしないようバックグラウンドで）
+if settings.OAUTH_PREWARM:
+    from phrases import auth_keys
+
+    threading.Thread(target=auth_keys.prewarm, name="oauth-prewarm", daemon=True).start()
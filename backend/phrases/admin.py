@@ -1,7 +1,8 @@
 from django import forms
 from django.contrib import admin
+from django.db.models import OuterRef, Subquery
 import uuid
-from . import models, services
+from . import media_jobs, models
 
 
 class ExpressionAdminForm(forms.ModelForm):
@@ -17,21 +18,23 @@ class ExpressionAdminForm(forms.ModelForm):
     def save(self, commit=True):
         instance = super().save(commit=False)
 
+        # アップロードはここではR2に送らず、保存後にバックグラウンドのジョブとして処理する
+        # （ModelAdmin.save_model で media_jobs.enqueue() に渡す）
+        self.pending_uploads = []
+
         # 画像ファイルのアップロード
         if self.cleaned_data.get('image_upload'):
             image_file = self.cleaned_data['image_upload']
             ext = image_file.name.split('.')[-1]
             key = f"expressions/images/{uuid.uuid4()}.{ext}"
-            services.upload_to_r2(image_file, key)
-            instance.image_key = key
+            self.pending_uploads.append(media_jobs.PendingUpload('image', image_file, key))
 
         # 音声ファイルのアップロード
         if self.cleaned_data.get('audio_upload'):
             audio_file = self.cleaned_data['audio_upload']
             ext = audio_file.name.split('.')[-1]
             key = f"expressions/audio/{uuid.uuid4()}.{ext}"
-            services.upload_to_r2(audio_file, key)
-            instance.audio_key = key
+            self.pending_uploads.append(media_jobs.PendingUpload('audio', audio_file, key))
 
         # 動画ファイルのアップロード
         if self.cleaned_data.get('video_upload'):
@@ -39,30 +42,49 @@ class ExpressionAdminForm(forms.ModelForm):
             ext = video_file.name.split('.')[-1]
             key = f"expressions/videos/{uuid.uuid4()}.{ext}"
 
-            # 先にサムネイル生成（ファイルが閉じられる前に）
-            thumbnail_key = f"expressions/thumbnails/{uuid.uuid4()}.jpg"
-            generated_thumbnail = services.generate_video_thumbnail(video_file, thumbnail_key)
-            if generated_thumbnail:
-                instance.scene_image_key = generated_thumbnail
-
-            # その後、動画をアップロード
-            video_file.seek(0)
-            services.upload_to_r2(video_file, key)
-            instance.video_key = key
+            # シーン画像が一緒にアップロードされていなければ、動画からサムネイルを生成する
+            thumbnail_key = ""
+            if not self.cleaned_data.get('scene_image_upload'):
+                thumbnail_key = f"expressions/thumbnails/{uuid.uuid4()}.jpg"
+            self.pending_uploads.append(media_jobs.PendingUpload('video', video_file, key, thumbnail_key))
 
         # シーン画像のアップロード
         if self.cleaned_data.get('scene_image_upload'):
             scene_image_file = self.cleaned_data['scene_image_upload']
             ext = scene_image_file.name.split('.')[-1]
             key = f"expressions/scene_images/{uuid.uuid4()}.{ext}"
-            services.upload_to_r2(scene_image_file, key)
-            instance.scene_image_key = key
+            self.pending_uploads.append(media_jobs.PendingUpload('scene_image', scene_image_file, key))
 
         if commit:
             instance.save()
         return instance
 
 
+class MediaJobAdminMixin:
+    """保存時にアップロードをMediaJobとして登録し、一覧に処理状況を表示する"""
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        uploads = getattr(form, 'pending_uploads', [])
+        if uploads:
+            media_jobs.enqueue(obj, uploads)
+            self.message_user(request, f"{len(uploads)}件のメディアをバックグラウンドで処理しています")
+
+    def get_queryset(self, request):
+        latest_job = models.MediaJob.objects.filter(
+            target_type=self.model._meta.model_name,
+            target_id=OuterRef('pk'),
+        ).order_by('-id')
+        return super().get_queryset(request).annotate(
+            latest_media_status=Subquery(latest_job.values('status')[:1])
+        )
+
+    def media_status(self, obj):
+        return getattr(obj, 'latest_media_status', None) or '-'
+    media_status.short_description = 'メディア処理'
+    media_status.admin_order_field = 'latest_media_status'
+
+
 class ExpressionPhraseInline(admin.TabularInline):
     model = models.PhraseExpression
     extra = 1
@@ -71,9 +93,9 @@ class ExpressionPhraseInline(admin.TabularInline):
 
 
 @admin.register(models.Expression)
-class ExpressionAdmin(admin.ModelAdmin):
+class ExpressionAdmin(MediaJobAdminMixin, admin.ModelAdmin):
     form = ExpressionAdminForm
-    list_display = ("id", "type", "text", "order", "created_at", "has_audio", "has_image", "has_video")
+    list_display = ("id", "type", "text", "order", "created_at", "has_audio", "has_image", "has_video", "media_status")
     search_fields = ("text", "meaning")
     list_filter = ("type",)
     inlines = [ExpressionPhraseInline]
@@ -83,7 +105,7 @@ class ExpressionAdmin(admin.ModelAdmin):
         }),
         ('メディアアップロード', {
             'fields': ('image_upload', 'audio_upload', 'video_upload', 'scene_image_upload'),
-            'description': 'ファイルをアップロードすると、自動的にR2に保存されます。動画をアップロードすると、サムネイルも自動生成されます'
+            'description': 'ファイルはバックグラウンドでR2に保存されます（処理状況は「Media jobs」で確認できます）。動画をアップロードすると、サムネイルも自動生成されます'
         }),
         ('メディアキー（手動設定）', {
             'fields': ('image_key', 'audio_key', 'video_key', 'scene_image_key'),
@@ -145,38 +167,34 @@ class PhraseAdminForm(forms.ModelForm):
     def save(self, commit=True):
         instance = super().save(commit=False)
 
+        # アップロードはここではR2に送らず、保存後にバックグラウンドのジョブとして処理する
+        self.pending_uploads = []
+
         # 動画ファイルのアップロード
         if self.cleaned_data.get('video_file'):
             video_file = self.cleaned_data['video_file']
             ext = video_file.name.split('.')[-1]
             key = f"videos/{uuid.uuid4()}.{ext}"
 
-            # 先にサムネイル生成（ファイルが閉じられる前に）
-            thumbnail_key = f"thumbnails/{uuid.uuid4()}.jpg"
-            generated_thumbnail = services.generate_video_thumbnail(video_file, thumbnail_key)
-            if generated_thumbnail:
-                instance.scene_image_key = generated_thumbnail
-
-            # その後、動画をアップロード
-            video_file.seek(0)
-            services.upload_to_r2(video_file, key)
-            instance.video_key = key
+            # シーン画像が一緒にアップロードされていなければ、動画からサムネイルを生成する
+            thumbnail_key = ""
+            if not self.cleaned_data.get('scene_image_file'):
+                thumbnail_key = f"thumbnails/{uuid.uuid4()}.jpg"
+            self.pending_uploads.append(media_jobs.PendingUpload('video', video_file, key, thumbnail_key))
 
         # 音声ファイルのアップロード
         if self.cleaned_data.get('audio_file'):
             audio_file = self.cleaned_data['audio_file']
             ext = audio_file.name.split('.')[-1]
             key = f"audio/{uuid.uuid4()}.{ext}"
-            services.upload_to_r2(audio_file, key)
-            instance.audio_key = key
+            self.pending_uploads.append(media_jobs.PendingUpload('audio', audio_file, key))
 
         # シーン画像のアップロード
         if self.cleaned_data.get('scene_image_file'):
             scene_image_file = self.cleaned_data['scene_image_file']
             ext = scene_image_file.name.split('.')[-1]
             key = f"images/{uuid.uuid4()}.{ext}"
-            services.upload_to_r2(scene_image_file, key)
-            instance.scene_image_key = key
+            self.pending_uploads.append(media_jobs.PendingUpload('scene_image', scene_image_file, key))
 
         if commit:
             instance.save()
@@ -184,9 +202,9 @@ class PhraseAdminForm(forms.ModelForm):
 
 
 @admin.register(models.Phrase)
-class PhraseAdmin(admin.ModelAdmin):
+class PhraseAdmin(MediaJobAdminMixin, admin.ModelAdmin):
     form = PhraseAdminForm
-    list_display = ("id", "text", "topic", "difficulty", "duration_sec", "has_video")
+    list_display = ("id", "text", "topic", "difficulty", "duration_sec", "has_video", "media_status")
     search_fields = ("text", "meaning")
     list_filter = ("topic", "difficulty")
     inlines = [PhraseExpressionInline]
@@ -196,7 +214,7 @@ class PhraseAdmin(admin.ModelAdmin):
         }),
         ('メディアアップロード', {
             'fields': ('video_file', 'audio_file', 'scene_image_file'),
-            'description': 'ファイルをアップロードすると、自動的にR2に保存されます'
+            'description': 'ファイルはバックグラウンドでR2に保存されます（処理状況は「Media jobs」で確認できます）'
         }),
         ('メディアキー（手動設定）', {
             'fields': ('video_key', 'audio_key', 'scene_image_key'),
@@ -247,4 +265,40 @@ class PasswordResetTokenAdmin(admin.ModelAdmin):
     list_display = ("user", "is_used", "expires_at", "used_at", "created_at")
     list_filter = ("is_used",)
     readonly_fields = ("token", "used_at", "expires_at")
-    ordering = ("-created_at",)
\ No newline at end of file
+    ordering = ("-created_at",)
+
+
+@admin.register(models.EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ("id", "to_email", "subject", "provider", "status", "attempts", "next_attempt_at", "sent_at")
+    list_filter = ("status", "provider")
+    search_fields = ("to_email", "subject")
+    readonly_fields = ("attempts", "locked_until", "sent_at", "last_error", "created_at", "updated_at")
+    ordering = ("-created_at",)
+    actions = ["retry_now"]
+
+    @admin.action(description="選択したメールを今すぐ再送する")
+    def retry_now(self, request, queryset):
+        from django.utils import timezone
+
+        updated = queryset.exclude(status="sent").update(
+            status="pending", next_attempt_at=timezone.now(), locked_until=None
+        )
+        self.message_user(request, f"{updated}件を再送キューに戻しました")
+
+
+@admin.register(models.MediaJob)
+class MediaJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "target_type", "target_id", "kind", "key", "status", "attempts", "created_at", "finished_at")
+    list_filter = ("status", "kind", "target_type")
+    search_fields = ("key",)
+    readonly_fields = (
+        "target_type", "target_id", "kind", "key", "staged_path", "staged_key", "options", "attempts",
+        "next_attempt_at", "locked_until", "finished_at", "timings", "last_error", "created_at", "updated_at",
+    )
+    actions = ["retry_now"]
+
+    @admin.action(description="選択したジョブを今すぐ再実行する")
+    def retry_now(self, request, queryset):
+        retried = media_jobs.retry(queryset)
+        self.message_user(request, f"{retried}件のジョブを再実行します")
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PhrasesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'phrases'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,64 @@
+"""
+動画から音声のみのトラック（AAC/.m4a）を作る
+
+リスニングモードでは動画の代わりにこのトラックを再生するため、転送量は動画の数%で済む。
+キーは動画のキーと変換設定から決まる（audio/derived/<動画のキー>.<kbps>k<ch>ch.m4a）ので、
+同じ動画を何度処理しても同じキーになり、1年キャッシュさせても問題ない。
+動画が差し替えられた・AUDIO_TRACK_KBPS などを変えた場合はキーが変わるので、
+以前のキーの音声（is_stale）は作り直す。
+"""
+from __future__ import annotations
+
+import os
+import posixpath
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+
+from . import media, services
+
+
+DERIVED_PREFIX = "audio/derived/"
+
+
+def derived_key(video_key: str) -> str:
+    stem, _ = posixpath.splitext(video_key.lstrip("/"))
+    return f"{DERIVED_PREFIX}{stem}.{settings.AUDIO_TRACK_KBPS}k{settings.AUDIO_TRACK_CHANNELS}ch.m4a"
+
+
+def is_stale(audio_key: str, video_key: str) -> bool:
+    """動画から作った音声だが、今の動画・変換設定のものではないか（アップロードされた音声は対象外）"""
+    return audio_key.startswith(DERIVED_PREFIX) and audio_key != derived_key(video_key)
+
+
+def needs_track(audio_key: str, video_key: str) -> bool:
+    """音声トラックを作る（作り直す）必要があるか"""
+    return not audio_key or is_stale(audio_key, video_key)
+
+
+def build_audio_track(source, video_key: str) -> tuple[str, int]:
+    """
+    音声トラックを作成してアップロードし、(キー, バイト数) を返す
+
+    ffmpegはこのスレッドで実行するので、同時実行数を抑えたい場合は media.get_ffmpeg_pool() から呼ぶ。
+
+    Args:
+        source: 元動画のパス・URL（services.get_media_source() の戻り値など）
+        video_key: 元動画のキー
+    """
+    key = derived_key(video_key)
+    with tempfile.TemporaryDirectory(prefix="audio-") as tmp_dir:
+        output_path = os.path.join(tmp_dir, "audio.m4a")
+        media.extract_audio(
+            source,
+            output_path,
+            kbps=settings.AUDIO_TRACK_KBPS,
+            channels=settings.AUDIO_TRACK_CHANNELS,
+        )
+        size = os.path.getsize(output_path)
+        with open(output_path, "rb") as f:
+            staged_file = File(f, name="audio.m4a")
+            staged_file.content_type = "audio/mp4"
+            services.upload_to_r2(staged_file, key)
+    return key, size
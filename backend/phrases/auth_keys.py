@@ -0,0 +1,215 @@
+"""
+ソーシャルログイン（Apple / Google）のIDトークン検証で使う公開鍵のキャッシュ
+
+ログインのたびに鍵を取得し直すとリモート往復がログインのレイテンシに乗るため、
+プロセス単位で鍵をキャッシュし、コネクションプール付きのセッションを使い回す。
+"""
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from typing import Any
+
+import jwt
+import requests
+from django.conf import settings
+from google.auth import transport
+from google.auth.transport import requests as google_requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+# google.oauth2.id_token.verify_oauth2_token() が参照する証明書URL
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+
+
+def build_pooled_session(pool_maxsize: int = 10) -> requests.Session:
+    """Keep-Aliveでコネクションを使い回すrequests.Sessionを作成"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize, max_retries=1)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def parse_max_age(headers, default: int) -> int:
+    """Cache-Controlヘッダーのmax-ageを秒で返す（無ければdefault）"""
+    cache_control = headers.get("Cache-Control", "") if headers else ""
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = _MAX_AGE_RE.search(cache_control)
+    if match:
+        return int(match.group(1))
+    return default
+
+
+class JWKSCache:
+    """
+    JWKS（JSON Web Key Set）をkid単位でキャッシュする
+
+    - パース済みのRSA公開鍵をkidごとに保持
+    - Cache-Controlのmax-ageまでキャッシュを有効とする
+    - 未知のkidが来た場合のみ再取得（スレッド間でシングルフライト）
+    - 未知のkidによる再取得はmin_refetch_interval秒に1回までに制限
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        timeout: float = 5.0,
+        default_max_age: int = 3600,
+        min_refetch_interval: float = 60.0,
+        session: requests.Session | None = None,
+    ) -> None:
+        self.url = url
+        self.timeout = timeout
+        self.default_max_age = default_max_age
+        self.min_refetch_interval = min_refetch_interval
+        self._session = session or build_pooled_session()
+        self._keys: dict[str, Any] = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_key(self, kid: str) -> Any:
+        """kidに対応する公開鍵を返す。見つからない場合はValueError"""
+        now = time.monotonic()
+        key = self._keys.get(kid)
+        if key is not None and now < self._expires_at:
+            return key
+
+        with self._lock:
+            # ロック待ちの間に他スレッドが取得済みなら再取得しない
+            now = time.monotonic()
+            key = self._keys.get(kid)
+            expired = now >= self._expires_at
+            if key is None or expired:
+                recently_fetched = now - self._fetched_at < self.min_refetch_interval
+                if expired or not recently_fetched:
+                    self._refresh()
+                key = self._keys.get(kid)
+
+        if key is None:
+            raise ValueError("Apple public key not found")
+        return key
+
+    def prewarm(self) -> None:
+        """起動時に鍵を取得しておく（失敗してもログのみ）"""
+        try:
+            with self._lock:
+                self._refresh()
+        except Exception as e:
+            logger.warning(f"JWKS prewarm failed for {self.url}: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys = {}
+            self._expires_at = 0.0
+            self._fetched_at = 0.0
+
+    def _refresh(self) -> None:
+        """JWKSを取得して鍵を差し替える（呼び出し側でロックを保持すること）"""
+        started = time.monotonic()
+        response = self._session.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+
+        keys = {}
+        for jwk in response.json().get("keys", []):
+            kid = jwk.get("kid")
+            if not kid or jwk.get("kty") != "RSA":
+                continue
+            try:
+                keys[kid] = jwt.algorithms.RSAAlgorithm.from_jwk(jwk)
+            except (jwt.InvalidKeyError, ValueError, KeyError) as e:
+                logger.warning(f"Skipping invalid JWK {kid}: {e}")
+
+        now = time.monotonic()
+        self._keys = keys
+        self._fetched_at = now
+        self._expires_at = now + parse_max_age(response.headers, self.default_max_age)
+        logger.info(
+            f"Fetched JWKS from {self.url}: {len(keys)} keys "
+            f"in {(now - started) * 1000:.0f}ms"
+        )
+
+
+class CachingGoogleRequest(transport.Request):
+    """
+    google-authのトランスポートにGETレスポンスのキャッシュを追加したもの
+
+    id_token.verify_oauth2_token() は検証のたびに証明書URLをGETするため、
+    HTTPのmax-ageの間はレスポンスを使い回し、期限切れ時のみ
+    プール済みセッションで再取得する（同一URLの再取得はシングルフライト）。
+    """
+
+    def __init__(
+        self,
+        *,
+        timeout: float = 5.0,
+        default_max_age: int = 300,
+        session: requests.Session | None = None,
+    ) -> None:
+        self.timeout = timeout
+        self.default_max_age = default_max_age
+        self._request = google_requests.Request(session=session or build_pooled_session())
+        self._cache: dict[str, tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs):
+        if method != "GET" or body is not None:
+            return self._request(
+                url, method=method, body=body, headers=headers,
+                timeout=timeout or self.timeout, **kwargs,
+            )
+
+        cached = self._cache.get(url)
+        if cached and time.monotonic() < cached[0]:
+            return cached[1]
+
+        with self._lock:
+            cached = self._cache.get(url)
+            if cached and time.monotonic() < cached[0]:
+                return cached[1]
+
+            response = self._request(
+                url, method="GET", headers=headers,
+                timeout=timeout or self.timeout, **kwargs,
+            )
+            if response.status == 200:
+                # レスポンス本体を読み切ってからキャッシュする
+                response.data
+                max_age = parse_max_age(response.headers, self.default_max_age)
+                age = int(response.headers.get("Age", 0) or 0)
+                self._cache[url] = (time.monotonic() + max(max_age - age, 0), response)
+            return response
+
+    def prewarm(self, url: str = GOOGLE_CERTS_URL) -> None:
+        """起動時に証明書を取得してTLS接続を確立しておく（失敗してもログのみ）"""
+        try:
+            self(url, method="GET")
+        except Exception as e:
+            logger.warning(f"Google certs prewarm failed: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache = {}
+
+
+def prewarm() -> None:
+    """Apple / Googleの鍵を事前取得する（wsgi起動時にバックグラウンドで実行）"""
+    if settings.GOOGLE_CLIENT_IDS:
+        google_request.prewarm()
+    apple_jwks.prewarm()
+
+
+google_request = CachingGoogleRequest(timeout=settings.OAUTH_HTTP_TIMEOUT)
+
+apple_jwks = JWKSCache(
+    settings.APPLE_JWKS_URL,
+    timeout=settings.OAUTH_HTTP_TIMEOUT,
+)
@@ -0,0 +1,327 @@
+"""
+2段キャッシュ（プロセス内L1 + 共有L2）
+
+- L1: ワーカープロセス内のLRU（件数上限・TTL付き）
+- L2: REDIS_URL が設定されていれば Redis、未設定ならプロセス内のスタンドイン
+- 無効化は L2 を削除したうえで Pub/Sub で全ワーカーに通知し、各プロセスの L1 も破棄する
+- キャッシュミス時は同じキーの再計算を1スレッドに絞る（シングルフライト）
+- L2 には JSON で保存する（pickle だと、Redis に書き込める者がワーカーで任意のコードを実行できる）。
+  値は JSON にできるもの（dict / list / str / 数値 / bool / None）に限る。タプルはリストとして返る
+
+使い方:
+    from phrases.cache import get_cache
+
+    total = get_cache().get_or_set("catalog:phrase_count", lambda: Phrase.objects.count(), ttl=300)
+    get_cache().invalidate("catalog:phrase_count")
+"""
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from django.conf import settings
+
+from . import services
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LRUCache:
+    """件数上限とTTLを持つスレッドセーフなLRU"""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class LocalBackend:
+    """
+    L2のスタンドイン（プロセス内の辞書 + プロセス内Pub/Sub）
+
+    Redisの無いローカル開発やテストで使う。複数のTwoTierCacheで共有すれば
+    複数ワーカー間の無効化通知も再現できる。
+    """
+
+    def __init__(self) -> None:
+        self._data: dict[str, tuple[float, bytes]] = {}
+        self._subscribers: list[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._data[key]
+                return None
+            return item[1]
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def publish(self, message: str) -> None:
+        for callback in list(self._subscribers):
+            callback(message)
+
+    def subscribe(self, callback: Callable[[str], None]) -> None:
+        self._subscribers.append(callback)
+
+
+class RedisBackend:
+    """RedisをL2とし、無効化通知にPub/Subを使う"""
+
+    def __init__(self, client, channel: str) -> None:
+        self._client = client
+        self._channel = channel
+
+    def get(self, key: str) -> bytes | None:
+        return self._client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._client.set(key, value, px=max(int(ttl * 1000), 1))
+
+    def delete(self, key: str) -> None:
+        self._client.delete(key)
+
+    def publish(self, message: str) -> None:
+        self._client.publish(self._channel, message)
+
+    def subscribe(self, callback: Callable[[str], None]) -> None:
+        def listen():
+            # 接続が切れても再購読し続ける
+            while True:
+                try:
+                    pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(self._channel)
+                    while True:
+                        item = pubsub.get_message(timeout=1.0)
+                        if item and item.get("type") == "message":
+                            data = item["data"]
+                            callback(data.decode() if isinstance(data, bytes) else data)
+                except Exception as e:
+                    logger.warning(f"Cache invalidation listener disconnected: {e}")
+                    time.sleep(1)
+
+        threading.Thread(target=listen, name="cache-invalidation", daemon=True).start()
+
+
+@dataclass
+class CacheStats:
+    l1_hits: int = 0
+    l2_hits: int = 0
+    misses: int = 0
+    l2_errors: int = 0
+    coalesced: int = 0
+    load_count: int = 0
+    load_seconds: float = 0.0
+    l2_seconds: float = 0.0
+    l2_calls: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def incr(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            lookups = self.l1_hits + self.l2_hits + self.misses
+            return {
+                "l1_hits": self.l1_hits,
+                "l2_hits": self.l2_hits,
+                "misses": self.misses,
+                "hit_rate": (self.l1_hits + self.l2_hits) / lookups if lookups else 0.0,
+                "l2_errors": self.l2_errors,
+                "coalesced": self.coalesced,
+                "avg_load_ms": self.load_seconds / self.load_count * 1000 if self.load_count else 0.0,
+                "avg_l2_ms": self.l2_seconds / self.l2_calls * 1000 if self.l2_calls else 0.0,
+            }
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.value: Any = _MISSING
+        self.error: BaseException | None = None
+
+
+class TwoTierCache:
+    def __init__(
+        self,
+        backend,
+        *,
+        prefix: str = "cache:",
+        l1_maxsize: int = 1024,
+        l1_ttl: float = 30.0,
+    ) -> None:
+        self.backend = backend
+        self.prefix = prefix
+        self.l1 = LRUCache(l1_maxsize)
+        self.l1_ttl = l1_ttl
+        self.stats = CacheStats()
+        # 自分が送った無効化通知を区別するためのID
+        self._origin = uuid.uuid4().hex
+        self._flights: dict[str, _Flight] = {}
+        self._flights_lock = threading.Lock()
+        backend.subscribe(self._on_invalidation)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self.l1.set(key, value, min(ttl, self.l1_ttl))
+        self._l2_call(self.backend.set, self.prefix + key, json.dumps(value).encode(), ttl)
+
+    def get_or_set(self, key: str, loader: Callable[[], Any], ttl: float) -> Any:
+        """キャッシュから取得し、無ければloaderで計算して保存する"""
+        value = self._lookup(key)
+        if value is not _MISSING:
+            return value
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            # 他スレッドが計算中なので結果を待つ
+            self.stats.incr("coalesced")
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            started = time.perf_counter()
+            value = loader()
+            self.stats.incr("load_count")
+            self.stats.incr("load_seconds", time.perf_counter() - started)
+            self.set(key, value, ttl)
+            flight.value = value
+            return value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def invalidate(self, key: str) -> None:
+        """全ワーカーのL1と共有L2からキーを削除する"""
+        self.l1.delete(key)
+        self._l2_call(self.backend.delete, self.prefix + key)
+        self._l2_call(self.backend.publish, f"{self._origin}:{key}")
+
+    def metrics(self) -> dict[str, float]:
+        data = self.stats.snapshot()
+        data["l1_size"] = len(self.l1)
+        return data
+
+    def _lookup(self, key: str) -> Any:
+        value = self.l1.get(key)
+        if value is not _MISSING:
+            self.stats.incr("l1_hits")
+            return value
+
+        raw = self._l2_call(self.backend.get, self.prefix + key)
+        if raw is not None:
+            try:
+                value = json.loads(raw)
+            except ValueError:
+                # 壊れた値（以前の形式で保存されたものなど）はミスとして扱う
+                value = _MISSING
+            if value is not _MISSING:
+                self.stats.incr("l2_hits")
+                self.l1.set(key, value, self.l1_ttl)
+                return value
+
+        self.stats.incr("misses")
+        return _MISSING
+
+    def _l2_call(self, func, *args):
+        """L2の障害時はL1のみで動作を続ける"""
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        except Exception as e:
+            self.stats.incr("l2_errors")
+            logger.warning(f"L2 cache error ({func.__name__}): {e}")
+            return None
+        finally:
+            self.stats.incr("l2_calls")
+            self.stats.incr("l2_seconds", time.perf_counter() - started)
+
+    def _on_invalidation(self, message: str) -> None:
+        origin, _, key = message.partition(":")
+        if origin != self._origin:
+            self.l1.delete(key)
+
+
+_cache: TwoTierCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> TwoTierCache:
+    """プロセス共通のTwoTierCacheを返す"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                client = services.get_redis_client()
+                if client is not None:
+                    backend = RedisBackend(client, settings.CACHE_INVALIDATION_CHANNEL)
+                else:
+                    backend = LocalBackend()
+                _cache = TwoTierCache(
+                    backend,
+                    l1_maxsize=settings.CACHE_L1_MAXSIZE,
+                    l1_ttl=settings.CACHE_L1_TTL,
+                )
+    return _cache
@@ -0,0 +1,233 @@
+"""
+バッチ処理の再開用チェックポイントと、それを使うバックフィルの共通ループ
+
+処理済みの位置（最後に処理したIDなど）をJSONファイルに保存する。
+書き込みは一時ファイル経由の置き換えで行うため、途中で止まっても壊れない。
+
+BatchRunner はIDの昇順にバッチで読み、1件ずつの処理（process）を並列に実行して
+バッチごとに bulk_update し、チェックポイントを保存する。失敗したIDも保存し、
+--resume のときは続きの前にやり直す。
+
+使い方:
+    checkpoint = Checkpoint.for_command("probe_media")
+    runner = BatchRunner(self, "phrase", queryset, checkpoint, process, executor=executor)
+    result = runner.run()
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+from django.conf import settings
+
+
+class Checkpoint:
+    def __init__(self, path: str | os.PathLike) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._data: dict[str, Any] = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                self._data = json.load(f)
+
+    @classmethod
+    def for_command(cls, name: str) -> "Checkpoint":
+        return cls(Path(settings.CHECKPOINT_DIR) / f"{name}.json")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            return self._data.get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        """値を更新してすぐにファイルへ保存する"""
+        with self._lock:
+            self._data[key] = value
+            self._write()
+
+    def update(self, values: dict[str, Any]) -> None:
+        """複数の値をまとめて更新して保存する"""
+        with self._lock:
+            self._data.update(values)
+            self._write()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data = {}
+            if self.path.exists():
+                self.path.unlink()
+
+    def _write(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+@dataclass
+class BatchResult:
+    scanned: int = 0
+    updated: int = 0
+    skipped: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+
+class BatchRunner:
+    """
+    queryset をIDの昇順に batch_size 件ずつ処理する
+
+    - process(obj) を executor で並列に実行する。書き込むフィールドの辞書を返し（None なら何もしない）、
+      例外は失敗として数える
+    - 結果はバッチごとに bulk_update する。guard_fields の値が読み込んだときから変わった行
+      （処理中に管理画面から差し替えられたなど）には書き込まない
+    - group_by を渡すと、同じ値（共有しているメディアのキーなど）の行は1回だけ処理して結果を共有する
+    - バッチが終わるたびに最後のIDと失敗したIDをチェックポイントに保存する。
+      次の実行では、続きを処理する前に前回失敗した行をやり直す
+    """
+
+    def __init__(
+        self,
+        command,
+        name: str,
+        queryset,
+        checkpoint: Checkpoint,
+        process: Callable,
+        *,
+        executor,
+        guard_fields: tuple[str, ...] = (),
+        group_by: Callable | None = None,
+        batch_size: int = 200,
+        limit: int | None = None,
+        label: str = "updated",
+        on_written: Callable | None = None,
+    ) -> None:
+        self.command = command
+        self.name = name
+        self.queryset = queryset
+        self.checkpoint = checkpoint
+        self.process = process
+        self.executor = executor
+        self.guard_fields = tuple(guard_fields)
+        self.group_by = group_by
+        self.batch_size = max(batch_size, 1)
+        self.limit = limit
+        self.label = label
+        self.on_written = on_written
+
+    @property
+    def failed_key(self) -> str:
+        return f"{self.name}.failed"
+
+    def run(self) -> BatchResult:
+        last_id = self.checkpoint.get(self.name, 0)
+        retry_ids = sorted(self.checkpoint.get(self.failed_key, []))
+        # まだやり直していない・今回失敗したID（チェックポイントに残す）
+        self.untried = set(retry_ids)
+        self.failed_ids: set[int] = set()
+
+        remaining = len(retry_ids) + self.queryset.filter(id__gt=last_id).count()
+        if self.limit is not None:
+            remaining = min(remaining, self.limit)
+        self.command.stdout.write(
+            f"{self.name}: {remaining} rows to process (after id {last_id}"
+            + (f", retrying {len(retry_ids)} failed" if retry_ids else "")
+            + ")"
+        )
+
+        result = BatchResult()
+        started = time.perf_counter()
+        # 前回失敗した行（その後に条件から外れたものは queryset で除かれる）
+        for start in range(0, len(retry_ids), self.batch_size):
+            ids = retry_ids[start:start + min(self.batch_size, remaining - result.scanned)]
+            if not ids:
+                break
+            self.untried.difference_update(ids)
+            self.run_batch(list(self.queryset.filter(pk__in=ids).order_by("id")), result)
+            result.scanned += len(ids)
+            self.save(last_id)
+            self.report(result, remaining, started)
+
+        while result.scanned < remaining:
+            size = min(self.batch_size, remaining - result.scanned)
+            batch = list(self.queryset.filter(id__gt=last_id).order_by("id")[:size])
+            if not batch:
+                break
+            self.run_batch(batch, result)
+            result.scanned += len(batch)
+            last_id = batch[-1].id
+            self.save(last_id)
+            self.report(result, remaining, started)
+
+        result.seconds = time.perf_counter() - started
+        return result
+
+    def run_batch(self, batch: list, result: BatchResult) -> None:
+        if not batch:
+            return
+        guards = {obj.pk: tuple(getattr(obj, field) for field in self.guard_fields) for obj in batch}
+        groups: dict[Any, list] = {}
+        for obj in batch:
+            groups.setdefault(self.group_by(obj) if self.group_by else obj.pk, []).append(obj)
+        futures = {self.executor.submit(self.process, objs[0]): objs for objs in groups.values()}
+
+        written = []
+        fields: set[str] = set()
+        for future in as_completed(futures):
+            objs = futures[future]
+            try:
+                updates = future.result()
+            except Exception as e:
+                result.failed += len(objs)
+                self.failed_ids.update(obj.pk for obj in objs)
+                self.command.stderr.write(f"{self.name}:{','.join(str(obj.pk) for obj in objs)} failed: {e}")
+                continue
+            if not updates:
+                result.skipped += len(objs)
+                continue
+            for obj in objs:
+                for field, value in updates.items():
+                    setattr(obj, field, value)
+            fields.update(updates)
+            written.extend(objs)
+
+        if written and self.guard_fields:
+            # 処理中に guard_fields が変わったものは書き込まない
+            current = set(
+                self.queryset.model.objects.filter(pk__in=[obj.pk for obj in written])
+                .values_list("pk", *self.guard_fields)
+            )
+            unchanged = [obj for obj in written if (obj.pk, *guards[obj.pk]) in current]
+            result.skipped += len(written) - len(unchanged)
+            written = unchanged
+        if written:
+            self.queryset.model.objects.bulk_update(written, sorted(fields))
+            result.updated += len(written)
+            if self.on_written:
+                self.on_written(written)
+
+    def save(self, last_id: int) -> None:
+        self.checkpoint.update({self.name: last_id, self.failed_key: sorted(self.failed_ids | self.untried)})
+
+    def report(self, result: BatchResult, remaining: int, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        rate = result.scanned / elapsed if elapsed else 0
+        eta = (remaining - result.scanned) / rate if rate else 0
+        self.command.stdout.write(
+            f"{self.name}: {result.scanned}/{remaining} ({result.updated} {self.label}, "
+            f"{result.skipped} skipped, {result.failed} failed) {rate:.1f}/s, ETA {eta:.0f}s"
+        )
+
+    def summary(self, result: BatchResult) -> str:
+        return (
+            f"{self.name}: done in {result.seconds:.1f}s "
+            f"({result.updated} {self.label}, {result.skipped} skipped, {result.failed} failed)"
+        )
@@ -0,0 +1,220 @@
+"""
+シーン画像のレスポンシブ用バリアント（WebP/JPEG・複数幅）
+
+scene_image_variants フィールドの形式:
+    {
+        "source": "images/xxx.jpg",      # 作成元の scene_image_key（変わったら無効）
+        "width": 1280, "height": 720,    # 元画像のサイズ
+        "bytes": 345678,                 # 元画像のバイト数
+        "placeholder": "data:image/webp;base64,...",  # 画像の読み込み前に表示する約200バイトの縮小画像
+        "variants": {
+            "webp": {"320": {"key": "variants/<hash>.webp", "bytes": 9876}, ...},
+            "jpeg": {...},
+        },
+    }
+
+キーは出力画像の内容のハッシュなので、同じ画像を何度処理しても同じキーになる
+（CDNに1年キャッシュさせても差し替えで古い画像が返ることはない）。
+
+クライアントは ?image_width=<表示幅px> または Width ヘッダー（Client Hints）で
+表示幅を申告すると、それ以上で最小のバリアントが scene_image_url に返る。
+scene_image_srcset には srcset 形式の文字列がフォーマットごとに入る。
+フィードの scene_image_placeholder（LQIP）はレスポンスに埋め込まれるので、追加のリクエストなしで
+画像の読み込み中にぼかして表示できる。
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from . import services
+
+CONTENT_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+# プレースホルダーの幅（px）と品質。16pxのWebPで150〜200バイト程度になる
+PLACEHOLDER_WIDTH = 16
+PLACEHOLDER_QUALITY = 40
+
+
+@dataclass(slots=True)
+class RenderedImage:
+    format: str
+    width: int
+    height: int
+    data: bytes
+
+
+@dataclass(slots=True)
+class RenderedVariants:
+    width: int
+    height: int
+    images: list[RenderedImage]
+    placeholder: str
+
+
+def _placeholder(image) -> str:
+    """縮小したWebPを data URI にする"""
+    from PIL import Image
+
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    tiny = image.convert("RGB").resize((PLACEHOLDER_WIDTH, height), Image.Resampling.BOX)
+    buffer = io.BytesIO()
+    tiny.save(buffer, "WEBP", quality=PLACEHOLDER_QUALITY)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def render_placeholder(data: bytes) -> str:
+    """画像からプレースホルダーだけを作る（既存バリアントへの追加用）"""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as opened:
+        opened.draft("RGB", (PLACEHOLDER_WIDTH * 4, PLACEHOLDER_WIDTH * 4))
+        return _placeholder(ImageOps.exif_transpose(opened))
+
+
+def render_variants(
+    data: bytes,
+    widths: list[int],
+    formats: list[str],
+    quality: dict[str, int],
+) -> RenderedVariants:
+    """
+    画像を各幅・各フォーマットに縮小・エンコードし、プレースホルダーも作る
+
+    Djangoの設定に依存しない純粋な関数なので、ProcessPoolExecutor の子プロセスでも実行できる。
+    元画像より大きい幅は作らない。
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as opened:
+        # JPEGは縮小前提でデコードすると速い（最大幅の2倍までの解像度でデコード）
+        source_width, source_height = opened.size
+        max_width = min(max(widths), source_width)
+        opened.draft("RGB", (max_width * 2, round(source_height * max_width * 2 / source_width)))
+        image = ImageOps.exif_transpose(opened)
+        if (image.width > image.height) != (source_width > source_height):
+            # EXIFの回転で縦横が入れ替わった
+            source_width, source_height = source_height, source_width
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+        rendered = []
+        smallest = None
+        for width in sorted({min(width, source_width) for width in widths}):
+            height = max(1, round(source_height * width / source_width))
+            resized = image if (width, height) == image.size else image.resize(
+                (width, height), Image.Resampling.LANCZOS, reducing_gap=3.0
+            )
+            smallest = smallest or resized
+            for fmt in formats:
+                buffer = io.BytesIO()
+                if fmt == "jpeg":
+                    resized.convert("RGB").save(
+                        buffer, "JPEG", quality=quality.get(fmt, 80), optimize=True, progressive=True
+                    )
+                else:
+                    resized.save(buffer, "WEBP", quality=quality.get(fmt, 75), method=4)
+                rendered.append(RenderedImage(fmt, width, height, buffer.getvalue()))
+
+        # 最小のバリアントから作れば元画像を縮小し直すより速い
+        placeholder = _placeholder(smallest or image)
+
+    return RenderedVariants(source_width, source_height, rendered, placeholder)
+
+
+def variant_key(image: RenderedImage) -> str:
+    digest = hashlib.sha256(image.data).hexdigest()[:32]
+    return f"variants/{digest}.{EXTENSIONS[image.format]}"
+
+
+def upload_variants(source_key: str, rendered: RenderedVariants, source_bytes: int | None = None) -> dict:
+    """バリアントをアップロードし、scene_image_variants の値を返す"""
+    variants: dict[str, dict] = {}
+    for image in rendered.images:
+        key = variant_key(image)
+        services.upload_to_r2(services.in_memory_file(image.data, key, CONTENT_TYPES[image.format]), key)
+        variants.setdefault(image.format, {})[str(image.width)] = {"key": key, "bytes": len(image.data)}
+    return {
+        "source": source_key,
+        "width": rendered.width,
+        "height": rendered.height,
+        "bytes": source_bytes,
+        "placeholder": rendered.placeholder,
+        "variants": variants,
+    }
+
+
+def build_variants(source_key: str, data: bytes | None = None) -> dict:
+    """画像（省略時はストレージから読み込む）のバリアントを作成・アップロードする"""
+    if data is None:
+        data = services.download_media(source_key)
+    rendered = render_variants(
+        data,
+        settings.IMAGE_VARIANT_WIDTHS,
+        settings.IMAGE_VARIANT_FORMATS,
+        settings.IMAGE_VARIANT_QUALITY,
+    )
+    return upload_variants(source_key, rendered, source_bytes=len(data))
+
+
+def is_current(obj) -> bool:
+    """scene_image_variants が今の scene_image_key から作られたものか"""
+    return bool(obj.scene_image_key) and (obj.scene_image_variants or {}).get("source") == obj.scene_image_key
+
+
+def _requested_width(request) -> int | None:
+    if request is None:
+        return None
+    value = request.query_params.get("image_width") if hasattr(request, "query_params") else None
+    value = value or request.headers.get("Width")
+    try:
+        return int(float(value)) if value else None
+    except ValueError:
+        return None
+
+
+def _requested_format(request) -> str:
+    if request is not None:
+        value = request.query_params.get("image_format") if hasattr(request, "query_params") else None
+        if value in CONTENT_TYPES:
+            return value
+        if "image/webp" in request.headers.get("Accept", ""):
+            return "webp"
+    return "jpeg"
+
+
+def select_scene_image_key(obj, request=None) -> str:
+    """申告された表示幅に合ったバリアントのキーを返す（申告が無ければ元画像）"""
+    width = _requested_width(request)
+    if width is None or not is_current(obj):
+        return obj.scene_image_key
+    by_width = obj.scene_image_variants.get("variants", {}).get(_requested_format(request))
+    if not by_width:
+        return obj.scene_image_key
+    widths = sorted(int(w) for w in by_width)
+    chosen = next((w for w in widths if w >= width), widths[-1])
+    return by_width[str(chosen)]["key"]
+
+
+def build_srcset(obj) -> dict[str, str] | None:
+    """フォーマットごとの srcset 文字列（"url 320w, url 640w"）"""
+    if not is_current(obj):
+        return None
+    return {
+        fmt: ", ".join(
+            f"{services.build_media_url(variant['key'], sign=False)} {width}w"
+            for width, variant in sorted(by_width.items(), key=lambda item: int(item[0]))
+        )
+        for fmt, by_width in obj.scene_image_variants.get("variants", {}).items()
+    }
+
+
+def get_placeholder(obj) -> str | None:
+    if not is_current(obj):
+        return None
+    return obj.scene_image_variants.get("placeholder")
@@ -0,0 +1,89 @@
+"""
+動画はあるがシーン画像（scene_image_key）が無いフレーズ・表現のサムネイルを一括生成する
+
+- サムネイルはffmpegプール（1スレッド = 1 ffmpegプロセス）で生成する。
+  ffmpegは署名付きURLから最初のキーフレームまでしか読まないため、動画全体は落とさない
+- 生成できたものから同じスレッドで続けてアップロードする（ffmpegの枠は生成が終わったらすぐ空く）
+- IDの昇順にバッチで処理し、バッチごとに bulk_update してチェックポイントを保存する（checkpoint.BatchRunner）。
+  失敗した行は --resume でやり直す
+
+使い方:
+    python manage.py backfill_thumbnails                 # 全件
+    python manage.py backfill_thumbnails --resume        # 前回止まったところから
+    python manage.py backfill_thumbnails --model expression --upload-workers 16
+"""
+from __future__ import annotations
+
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from phrases import media, media_jobs, services
+from phrases.checkpoint import BatchRunner, Checkpoint
+
+CHECKPOINT_NAME = "backfill_thumbnails"
+
+# 管理画面からのアップロードと同じ場所に置く
+THUMBNAIL_PREFIXES = {
+    "phrase": "thumbnails",
+    "expression": "expressions/thumbnails",
+}
+
+
+def generate_and_upload(target: str, video_key: str, width: int) -> str:
+    """ffmpegプールでサムネイルを生成し、このスレッドでアップロードしてキーを返す"""
+    result = media.get_ffmpeg_pool().submit(
+        media.extract_thumbnail, services.get_media_source(video_key), width=width
+    ).result()
+    key = f"{THUMBNAIL_PREFIXES[target]}/{uuid.uuid4()}.jpg"
+    return services.upload_to_r2(
+        services.in_memory_file(result.data, key, "image/jpeg"),
+        key,
+        content_addressed=settings.MEDIA_CONTENT_ADDRESSED_KEYS,
+    )
+
+
+class Command(BaseCommand):
+    help = "scene_image_key が無い動画のサムネイルを並列に生成してバックフィルする"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=["phrase", "expression", "all"], default="all")
+        parser.add_argument("--batch-size", type=int, default=200, help="1回に読み込み・更新する件数")
+        parser.add_argument("--upload-workers", type=int, default=8, help="同時アップロード数")
+        parser.add_argument("--width", type=int, default=720, help="サムネイルの幅（px）")
+        parser.add_argument("--resume", action="store_true", help="チェックポイントの続きから処理する")
+        parser.add_argument("--limit", type=int, default=None, help="処理する最大件数（モデルごと）")
+
+    def handle(self, *args, **options):
+        checkpoint = Checkpoint.for_command(CHECKPOINT_NAME)
+        if not options["resume"]:
+            checkpoint.clear()
+
+        targets = ["phrase", "expression"] if options["model"] == "all" else [options["model"]]
+        self.stdout.write(
+            f"Using {settings.MEDIA_FFMPEG_WORKERS} ffmpeg workers, {options['upload_workers']} upload workers"
+        )
+        # アップロード中も他のスレッドがffmpegを使えるよう、ffmpegの数より多くしておく
+        workers = max(options["upload_workers"], 1) + settings.MEDIA_FFMPEG_WORKERS
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload") as uploads:
+            for target in targets:
+                self.process_model(target, uploads, checkpoint, options)
+
+    def process_model(self, target: str, uploads, checkpoint: Checkpoint, options) -> None:
+        model = media_jobs.TARGET_MODELS[target]
+        runner = BatchRunner(
+            self,
+            target,
+            model.objects.exclude(video_key="").filter(scene_image_key="").only("id", "video_key", "scene_image_key"),
+            checkpoint,
+            lambda obj: {"scene_image_key": generate_and_upload(target, obj.video_key, options["width"])},
+            executor=uploads,
+            # 処理中に管理画面からシーン画像が設定された・動画が差し替えられたものは上書きしない
+            guard_fields=("video_key", "scene_image_key"),
+            batch_size=options["batch_size"],
+            limit=options["limit"],
+            label="generated",
+        )
+        self.stdout.write(self.style.SUCCESS(runner.summary(runner.run())))
@@ -0,0 +1,164 @@
+"""
+スナップショットのインポート（migrate_to_postgres.py --import）の速度を計測するベンチマーク
+
+疑似的な PlaybackLog のレコードをその場で作り、
+- 従来の方式（1件ずつ update_or_create）: --legacy-rows 件だけ計測して全件分を推定
+- バルク方式（snapshot.load_table。PostgreSQLは COPY FROM STDIN、それ以外は bulk_create）: 全件
+を同じDBに入れて件数/秒を比べる。計測は1トランザクション内で行い、--keep を付けない限りロールバックする。
+
+使い方:
+    DATABASE_URL=postgresql://... python manage.py benchmark_bulk_import --rows 1000000
+    python manage.py benchmark_bulk_import --rows 100000 --legacy-rows 2000 --output bulk_import.json
+"""
+from __future__ import annotations
+
+import datetime
+import json
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+
+from phrases import snapshot
+from phrases.models import Phrase, PlaybackLog
+
+DEVICE_TYPES = ["ios", "android", "desktop"]
+NETWORK_TYPES = ["wifi", "4g", "5g", ""]
+SOURCES = [choice for choice, _ in PlaybackLog.SOURCE_CHOICES]
+
+
+def synthetic_logs(count: int, first_id: int, user_ids: list[int], phrase_ids: list[int], seed: int = 0):
+    """エクスポートと同じ形（日時はISO形式の文字列）の PlaybackLog レコードを1件ずつ作る"""
+    rng = random.Random(seed)
+    started_at = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    for offset in range(count):
+        yield {
+            "id": first_id + offset,
+            "user_id": rng.choice(user_ids),
+            "phrase_id": rng.choice(phrase_ids),
+            "play_ms": rng.randint(500, 20000),
+            "completed": rng.random() < 0.6,
+            "source": rng.choice(SOURCES),
+            "device_type": rng.choice(DEVICE_TYPES),
+            "network_type": rng.choice(NETWORK_TYPES),
+            "created_at": (started_at + datetime.timedelta(seconds=offset * 7)).isoformat(),
+        }
+
+
+def legacy_import(records) -> int:
+    """移行スクリプトの従来の実装と同じく1件ずつ update_or_create する"""
+    count = 0
+    for data in records:
+        PlaybackLog.objects.update_or_create(
+            id=data["id"],
+            defaults={
+                "user_id": data["user_id"],
+                "phrase_id": data["phrase_id"],
+                "play_ms": data["play_ms"],
+                "completed": data["completed"],
+                "source": data["source"],
+                "device_type": data["device_type"],
+                "network_type": data["network_type"],
+            },
+        )
+        count += 1
+    return count
+
+
+class Command(BaseCommand):
+    help = "スナップショットのインポートを従来方式（update_or_create）とバルク方式（COPY / bulk_create）で比べる"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000, help="バルク方式で入れる件数")
+        parser.add_argument("--legacy-rows", type=int, default=5000, help="従来方式で計測する件数（0で省略）")
+        parser.add_argument("--batch-size", type=int, default=snapshot.DEFAULT_BATCH_SIZE, help="1回に入れる件数")
+        parser.add_argument(
+            "--mode", choices=["upsert", "insert"], default="upsert",
+            help="upsert: 既存のIDは上書き（--import と同じ）、insert: 空のテーブルに入れる（--sync と同じ）",
+        )
+        parser.add_argument("--keep", action="store_true", help="入れたデータをロールバックせずに残す")
+        parser.add_argument("--output", default=None, help="結果をJSONで保存するパス")
+
+    def handle(self, *args, **options):
+        spec = snapshot.TABLES_BY_NAME["playback_logs"]
+        method = "COPY FROM STDIN" if connection.vendor == "postgresql" else "bulk_create"
+        self.stdout.write(f"Database: {connection.vendor} ({method}), batch size {options['batch_size']}")
+
+        results = {
+            "vendor": connection.vendor,
+            "method": method,
+            "mode": options["mode"],
+            "batch_size": options["batch_size"],
+        }
+        with transaction.atomic():
+            user_ids, phrase_ids = self.ensure_references()
+            first_id = (PlaybackLog.objects.aggregate(max_id=Max("id"))["max_id"] or 0) + 1
+
+            if options["legacy_rows"]:
+                started = time.perf_counter()
+                count = legacy_import(synthetic_logs(options["legacy_rows"], first_id, user_ids, phrase_ids))
+                elapsed = time.perf_counter() - started
+                rate = count / elapsed if elapsed else 0
+                results["legacy"] = {
+                    "rows": count,
+                    "seconds": round(elapsed, 3),
+                    "rows_per_s": round(rate),
+                    "estimated_seconds_for_all_rows": round(options["rows"] / rate, 1) if rate else None,
+                }
+                self.stdout.write(
+                    f"legacy: {count} rows in {elapsed:.2f}s ({rate:,.0f} rows/s); "
+                    f"{options['rows']} rows would take ~{options['rows'] / rate if rate else 0:.0f}s"
+                )
+                first_id += count
+
+            records = synthetic_logs(options["rows"], first_id, user_ids, phrase_ids, seed=1)
+            started = time.perf_counter()
+            count = snapshot.load_table(
+                spec,
+                records,
+                batch_size=options["batch_size"],
+                upsert=options["mode"] == "upsert",
+                progress=self.report_progress(options["rows"], started),
+            )
+            snapshot.reset_sequences([PlaybackLog])
+            elapsed = time.perf_counter() - started
+            rate = count / elapsed if elapsed else 0
+            results["bulk"] = {"rows": count, "seconds": round(elapsed, 3), "rows_per_s": round(rate)}
+            self.stdout.write(f"bulk: {count} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+            if results.get("legacy", {}).get("rows_per_s"):
+                results["speedup"] = round(rate / results["legacy"]["rows_per_s"], 1)
+                self.stdout.write(self.style.SUCCESS(f"bulk is {results['speedup']}x faster than update_or_create"))
+
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Saved results to {options['output']}")
+
+    def ensure_references(self) -> tuple[list[int], list[int]]:
+        """参照先のユーザーとフレーズ（無ければ作る）"""
+        user_ids = list(get_user_model().objects.order_by("id").values_list("id", flat=True)[:100])
+        if not user_ids:
+            user_ids = [get_user_model().objects.create(username="benchmark-bulk-import").id]
+        phrase_ids = list(Phrase.objects.order_by("id").values_list("id", flat=True)[:1000])
+        if not phrase_ids:
+            phrase_ids = [Phrase.objects.create(text="benchmark", meaning="benchmark").id]
+        return user_ids, phrase_ids
+
+    def report_progress(self, total: int, started: float):
+        step = max(total // 10, 1)
+        next_report = [step]
+
+        def progress(count: int) -> None:
+            if count >= next_report[0] or count == total:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"  {count}/{total} ({count / elapsed if elapsed else 0:,.0f} rows/s)")
+                while next_report[0] <= count:
+                    next_report[0] += step
+
+        return progress
@@ -0,0 +1,521 @@
+"""
+主要なAPIエンドポイントのレイテンシ・SQLクエリ・レスポンスサイズを計測するベンチマーク
+
+/api/feed（未ログイン・ログイン）, /api/favorites, /api/progress, /api/mastery-rate, /api/logs/play を
+- client: Django のテストクライアント（ネットワークを通さない、アプリ本体のコスト）
+- server: このプロセス内で起動したマルチスレッドのWSGIサーバーにHTTPで（--base-url で外部のサーバーも可）
+の両方で呼び、p50/p95/p99 のレイテンシ、1リクエストあたりのSQLの件数と時間、レスポンスのバイト数を記録する。
+
+ログインが必要なエンドポイントは、学習状況の多いユーザーと全体から均等に選んだユーザーを
+交互に切り替えて呼ぶ（/logs/play のレート制限にかからないようにするため）。
+/logs/play で書き込んだ再生ログと学習状況はモード（client / server）ごとに元に戻す
+（次のモード・次の計測のクエリ数が変わらないように）。
+1つのエンドポイントに --max-seconds 秒以上かかったら、そこまでの結果で打ち切る（truncated）。
+
+データは generate_synthetic_data で作っておく:
+    python manage.py generate_synthetic_data
+    python manage.py benchmark_endpoints --output benchmarks/endpoints.json
+    python manage.py benchmark_endpoints --baseline benchmarks/endpoints.json --fail-on-regression
+
+--baseline に前回の --output のJSONを渡すと、エンドポイントごとに比べて悪化したものを表示する。
+- 前回と同じユーザーでリクエストする（/progress などはユーザーの学習状況の件数でクエリ数が変わるため）
+- クエリ数・バイト数はユーザーごとの平均を、両方で計測したユーザーについて比べる
+- レイテンシはサンプルが少ないと揺れが大きいので、両方とも --min-samples 件以上あり、
+  そのパーセンタイルより遅いサンプルが TAIL_SAMPLES 件以上あるときだけ比べる
+  （デフォルトの --requests 1000 なら p50/p95/p99 とも比べる）。
+  どのエンドポイントのレイテンシも比べられなかった場合は、それ自体を悪化として報告する
+"""
+from __future__ import annotations
+
+import datetime
+import json
+import math
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import zip_longest
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.db.models import Count, Max
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from phrases.models import Expression, Phrase, PlaybackLog, UserProgress
+
+REQUEST_ID_HEADER = "X-Benchmark-Id"
+# パーセンタイルを比べるのに必要な、それより遅いサンプルの数（p99 なら 1000 件以上）
+TAIL_SAMPLES = 10
+PERCENTILES = {"p50_ms": 0.50, "p95_ms": 0.95, "p99_ms": 0.99}
+# /logs/play が書き換える UserProgress のフィールド
+PROGRESS_FIELDS = ["completed", "replay_count", "last_reviewed", "updated_at"]
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    name: str
+    method: str
+    path: str
+    authenticated: bool = True
+
+
+ENDPOINTS = [
+    Endpoint("feed_anonymous", "GET", "/api/feed", authenticated=False),
+    Endpoint("feed", "GET", "/api/feed"),
+    Endpoint("favorites", "GET", "/api/favorites"),
+    Endpoint("progress", "GET", "/api/progress"),
+    Endpoint("mastery_rate", "GET", "/api/mastery-rate"),
+    Endpoint("logs_play", "POST", "/api/logs/play"),
+]
+
+
+@dataclass
+class Sample:
+    seconds: float
+    status: int
+    bytes: int
+    queries: int | None = None
+    query_seconds: float | None = None
+    user: int | None = None
+
+
+class QueryStats:
+    """connection.execute_wrapper に渡して、実行したSQLの件数と時間を数える"""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class QueryCountingApplication:
+    """リクエストごとのSQLの件数と時間を記録するWSGIアプリ（サーバーのリクエストスレッドで数える）"""
+
+    def __init__(self, application) -> None:
+        self.application = application
+        self.stats: dict[str, QueryStats] = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        stats = QueryStats()
+        try:
+            with connection.execute_wrapper(stats):
+                response = self.application(environ, start_response)
+                # 遅延評価でレスポンスを返すときに実行されるSQLも数える
+                body = b"".join(response)
+                if hasattr(response, "close"):
+                    response.close()
+        finally:
+            connections.close_all()
+        request_id = environ.get("HTTP_" + REQUEST_ID_HEADER.upper().replace("-", "_"))
+        if request_id:
+            with self.lock:
+                self.stats[request_id] = stats
+        return [body]
+
+    def pop(self, request_id: str) -> QueryStats | None:
+        with self.lock:
+            return self.stats.pop(request_id, None)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    # ヘッダーと本文が別々に送られるので、Nagle が有効だと遅延ACKで毎回 40ms ほど待たされる（gunicorn と同じく無効にする）
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """線形補間のパーセンタイル（sorted_values は昇順）"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(samples: list[Sample], wall_seconds: float) -> dict:
+    latencies = sorted(sample.seconds * 1000 for sample in samples)
+    statuses: dict[str, int] = {}
+    for sample in samples:
+        statuses[str(sample.status)] = statuses.get(str(sample.status), 0) + 1
+    counted = [sample for sample in samples if sample.queries is not None]
+    by_user: dict[str, list[Sample]] = {}
+    for sample in samples:
+        by_user.setdefault(str(sample.user) if sample.user is not None else "anonymous", []).append(sample)
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if sample.status >= 400),
+        "statuses": statuses,
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        "requests_per_s": round(len(samples) / wall_seconds, 1) if wall_seconds else 0.0,
+        "queries_mean": round(statistics.fmean(s.queries for s in counted), 2) if counted else None,
+        "queries_max": max(s.queries for s in counted) if counted else None,
+        "query_ms_mean": round(statistics.fmean(s.query_seconds * 1000 for s in counted), 2) if counted else None,
+        "bytes_mean": round(statistics.fmean(s.bytes for s in samples)) if samples else 0,
+        # ユーザーごとの平均（前回との比較用）
+        "by_user": {
+            user: {
+                "requests": len(user_samples),
+                "queries_mean": (
+                    round(statistics.fmean(s.queries for s in user_samples), 2)
+                    if all(s.queries is not None for s in user_samples) else None
+                ),
+                "bytes_mean": round(statistics.fmean(s.bytes for s in user_samples)),
+            }
+            for user, user_samples in by_user.items()
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = "主要なAPIエンドポイントの p50/p95/p99 レイテンシ・SQLクエリ数・レスポンスサイズを計測する"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--endpoints", default=",".join(endpoint.name for endpoint in ENDPOINTS),
+            help="計測するエンドポイント（カンマ区切り）",
+        )
+        parser.add_argument("--mode", choices=["client", "server", "both"], default="both")
+        parser.add_argument("--requests", type=int, default=1000, help="エンドポイントごとのリクエスト数")
+        parser.add_argument("--warmup", type=int, default=10, help="計測前に捨てるリクエスト数")
+        parser.add_argument("--users", type=int, default=20, help="切り替えて使うユーザー数")
+        parser.add_argument("--concurrency", type=int, default=1, help="server モードで同時に送るリクエスト数")
+        parser.add_argument(
+            "--max-seconds", type=float, default=60.0, help="1つのエンドポイントの計測にかける最大の秒数",
+        )
+        parser.add_argument("--base-url", default=None, help="既に起動しているサーバー（gunicornなど）を計測する")
+        parser.add_argument("--output", default=None, help="結果をJSONで保存するパス")
+        parser.add_argument("--baseline", default=None, help="比較する前回の結果（--output のJSON）")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="悪化とみなすレイテンシ・バイト数の増加率")
+        parser.add_argument(
+            "--min-samples", type=int, default=200, help="レイテンシを比べるのに必要なリクエスト数（両方とも）",
+        )
+        parser.add_argument("--fail-on-regression", action="store_true", help="悪化があれば失敗で終了する")
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options["endpoints"].split(",") if name.strip()]
+        by_name = {endpoint.name: endpoint for endpoint in ENDPOINTS}
+        unknown = [name for name in names if name not in by_name]
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(unknown)}")
+        endpoints = [by_name[name] for name in names]
+        # --output と同じファイルでも比べられるよう、先に読んでおく
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as f:
+                baseline = json.load(f)
+        self.phrase_ids = list(Phrase.objects.order_by("id").values_list("id", flat=True)[:1000])
+        if not self.phrase_ids:
+            raise CommandError("No phrases; run generate_synthetic_data first")
+
+        # 前回と同じユーザーを使う（いなくなっていれば選び直す）
+        baseline_users = (baseline or {}).get("users") or []
+        self.user_ids = self.select_users(options["users"], baseline_users)
+        if baseline_users and self.user_ids != baseline_users:
+            self.stdout.write(self.style.WARNING("Baseline users no longer exist; comparing with a new user set"))
+        self.tokens = self.build_tokens(self.user_ids)
+        dataset = {
+            "phrases": Phrase.objects.count(),
+            "expressions": Expression.objects.count(),
+            "users": get_user_model().objects.count(),
+            "user_progress": UserProgress.objects.count(),
+            "playback_logs": PlaybackLog.objects.count(),
+        }
+        self.stdout.write(
+            f"Dataset: {', '.join(f'{count} {name}' for name, count in dataset.items())} ({connection.vendor})"
+        )
+
+        modes = ["client", "server"] if options["mode"] == "both" else [options["mode"]]
+        results: dict[str, dict] = {}
+        last_log_id = PlaybackLog.objects.aggregate(max_id=Max("id"))["max_id"] or 0
+        last_progress_id = UserProgress.objects.aggregate(max_id=Max("id"))["max_id"] or 0
+        touched_progress = self.touched_progress() if "logs_play" in names else []
+        hosts = [*settings.ALLOWED_HOSTS, "testserver", "127.0.0.1", "localhost"]
+        with override_settings(ALLOWED_HOSTS=hosts):
+            for mode in modes:
+                try:
+                    results[mode] = self.run_mode(mode, endpoints, options)
+                finally:
+                    if "logs_play" in names:
+                        # 次のモードの /progress などのクエリ数が変わらないよう、モードごとに戻す
+                        self.restore_writes(last_log_id, last_progress_id, touched_progress)
+
+        report = {
+            "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "database": connection.vendor,
+            "dataset": dataset,
+            "options": {
+                key: options[key]
+                for key in ("requests", "warmup", "users", "concurrency", "max_seconds", "base_url")
+            },
+            "users": self.user_ids,
+            "results": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Saved results to {options['output']}")
+
+        if baseline is not None:
+            regressions = self.compare(report, baseline, options["tolerance"], options["min_samples"])
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"{len(regressions)} regressions against {options['baseline']}")
+
+    # --- 準備 ---
+
+    def select_users(self, count: int, preferred: list[int]) -> list[int]:
+        """
+        計測に使うユーザーID（preferred が全員いればそのまま使う）
+
+        学習状況の多いユーザー半分と、ID順に均等に選んだユーザー半分を交互に並べる。
+        """
+        User = get_user_model()
+        if preferred and User.objects.filter(pk__in=preferred).count() == len(set(preferred)):
+            return list(preferred)
+        count = max(count, 1)
+        active = list(
+            User.objects.annotate(progress_count=Count("progress"))
+            .order_by("-progress_count", "id")
+            .values_list("id", flat=True)[:max(count // 2, 1)]
+        )
+        all_ids = list(User.objects.order_by("id").values_list("id", flat=True))
+        if not all_ids:
+            raise CommandError("No users; run generate_synthetic_data first")
+        step = max(len(all_ids) // max(count - len(active), 1), 1)
+        spread = [pk for pk in all_ids[::step] if pk not in active][:count - len(active)]
+        return [pk for pair in zip_longest(active, spread) for pk in pair if pk is not None]
+
+    def touched_progress(self) -> list[UserProgress]:
+        """/logs/play で更新されうる学習状況（計測後に元に戻す）"""
+        return list(
+            UserProgress.objects.filter(
+                user_id__in=self.user_ids, phrase_id__in=self.phrase_ids, expression__isnull=True
+            ).only("id", *PROGRESS_FIELDS)
+        )
+
+    def restore_writes(self, last_log_id: int, last_progress_id: int, touched_progress: list[UserProgress]) -> None:
+        """計測で書き込んだ再生ログと、それで作られた・更新された学習状況を元に戻す"""
+        PlaybackLog.objects.filter(id__gt=last_log_id).delete()
+        UserProgress.objects.filter(id__gt=last_progress_id).delete()
+        UserProgress.objects.bulk_update(touched_progress, PROGRESS_FIELDS, batch_size=1000)
+
+    def build_tokens(self, user_ids: list[int]) -> list[str]:
+        users = get_user_model().objects.in_bulk(user_ids)
+        return [str(RefreshToken.for_user(users[pk]).access_token) for pk in user_ids]
+
+    def user_for(self, endpoint: Endpoint, i: int) -> int | None:
+        """i 番目のリクエストのユーザーID（未ログインならNone）"""
+        return self.user_ids[i % len(self.user_ids)] if endpoint.authenticated else None
+
+    def request_for(self, endpoint: Endpoint, i: int) -> tuple[dict, dict | None, dict]:
+        """i 番目のリクエストの (クエリパラメータ, JSONボディ, ヘッダー)"""
+        headers = {}
+        if endpoint.authenticated:
+            headers["Authorization"] = f"Bearer {self.tokens[i % len(self.tokens)]}"
+        if endpoint.name == "logs_play":
+            body = {
+                "phrase_id": self.phrase_ids[i % len(self.phrase_ids)],
+                "play_ms": 1000 + (i * 37) % 15000,
+                "completed": i % 3 != 0,
+                "source": "feed",
+                "device_type": "ios",
+                "network_type": "wifi",
+            }
+            return {}, body, headers
+        if endpoint.name in ("feed", "feed_anonymous", "favorites"):
+            return {"seed": i % 10000, "limit": 20}, None, headers
+        return {}, None, headers
+
+    # --- 計測 ---
+
+    def run_mode(self, mode: str, endpoints: list[Endpoint], options) -> dict:
+        server = None
+        if mode == "server" and not options["base_url"]:
+            application = QueryCountingApplication(get_wsgi_application())
+            server = ThreadedWSGIServer(("127.0.0.1", 0), QuietRequestHandler, allow_reuse_address=False)
+            server.set_app(application)
+            threading.Thread(target=server.serve_forever, name="benchmark-wsgi", daemon=True).start()
+            self.base_url = f"http://127.0.0.1:{server.server_port}"
+            self.application = application
+        elif mode == "server":
+            self.base_url = options["base_url"].rstrip("/")
+            self.application = None
+
+        results = {}
+        try:
+            self.stdout.write(f"\n[{mode}]" + (f" {self.base_url}" if mode == "server" else ""))
+            for endpoint in endpoints:
+                run = self.run_client if mode == "client" else self.run_server
+                samples, wall = run(endpoint, options)
+                result = summarize(samples, wall)
+                result["truncated"] = len(samples) < options["requests"]
+                results[endpoint.name] = result
+                queries = (
+                    f"{result['queries_mean']:5.1f} queries ({result['query_ms_mean']:6.1f} ms)"
+                    if result["queries_mean"] is not None else "queries n/a"
+                )
+                self.stdout.write(
+                    f"  {endpoint.name:<15} p50 {result['p50_ms']:7.1f}  p95 {result['p95_ms']:7.1f}  "
+                    f"p99 {result['p99_ms']:7.1f} ms  {queries}  {result['bytes_mean'] / 1024:7.1f} KB  "
+                    f"{result['requests_per_s']:6.1f} req/s  errors {result['errors']}"
+                    + (f"  (stopped after {result['requests']} requests)" if result["truncated"] else "")
+                )
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+        return results
+
+    def run_client(self, endpoint: Endpoint, options) -> tuple[list[Sample], float]:
+        client = Client()
+        samples = []
+        started_all = None
+        deadline = time.perf_counter() + options["max_seconds"]
+        for i in range(options["warmup"] + options["requests"]):
+            measuring = i >= options["warmup"]
+            if i == options["warmup"]:
+                started_all = time.perf_counter()
+                deadline = started_all + options["max_seconds"]
+            if time.perf_counter() > deadline:
+                # 時間切れならウォームアップは飛ばし、計測は（最低1回送ってから）打ち切る
+                if not measuring:
+                    continue
+                if samples:
+                    break
+            query, body, headers = self.request_for(endpoint, i)
+            stats = QueryStats()
+            started = time.perf_counter()
+            with connection.execute_wrapper(stats):
+                if endpoint.method == "GET":
+                    response = client.get(endpoint.path, query, headers=headers)
+                else:
+                    response = client.post(
+                        endpoint.path, json.dumps(body), content_type="application/json", headers=headers
+                    )
+            elapsed = time.perf_counter() - started
+            if measuring:
+                samples.append(Sample(
+                    elapsed, response.status_code, len(response.content), stats.count, stats.seconds,
+                    self.user_for(endpoint, i),
+                ))
+        return samples, time.perf_counter() - (started_all or time.perf_counter())
+
+    def run_server(self, endpoint: Endpoint, options) -> tuple[list[Sample], float]:
+        import requests
+
+        local = threading.local()
+        deadline = time.perf_counter() + options["max_seconds"]
+
+        def send(i: int) -> Sample | None:
+            # 時間切れなら送らない（計測は最低1回送る）
+            if time.perf_counter() > deadline and i != options["warmup"]:
+                return None
+            session = getattr(local, "session", None)
+            if session is None:
+                session = local.session = requests.Session()
+            query, body, headers = self.request_for(endpoint, i)
+            request_id = f"{endpoint.name}-{i}"
+            started = time.perf_counter()
+            response = session.request(
+                endpoint.method, self.base_url + endpoint.path, params=query, json=body,
+                headers={**headers, REQUEST_ID_HEADER: request_id}, timeout=60,
+            )
+            elapsed = time.perf_counter() - started
+            stats = self.application.pop(request_id) if self.application else None
+            return Sample(
+                elapsed, response.status_code, len(response.content),
+                stats.count if stats else None, stats.seconds if stats else None,
+                self.user_for(endpoint, i),
+            )
+
+        for i in range(options["warmup"]):
+            send(i)
+        started = time.perf_counter()
+        deadline = started + options["max_seconds"]
+        indexes = range(options["warmup"], options["warmup"] + options["requests"])
+        with ThreadPoolExecutor(max_workers=max(options["concurrency"], 1)) as pool:
+            samples = [sample for sample in pool.map(send, indexes) if sample is not None]
+        return samples, time.perf_counter() - started
+
+    # --- 比較 ---
+
+    def compare(self, report: dict, baseline: dict, tolerance: float, min_samples: int) -> list[str]:
+        """前回の結果と比べ、悪化した項目を表示して返す"""
+        self.stdout.write(f"\nCompared with baseline from {baseline.get('generated_at', '?')}:")
+        regressions = []
+        latency_compared = False
+        for mode, endpoints in report["results"].items():
+            for name, result in endpoints.items():
+                base = baseline.get("results", {}).get(mode, {}).get(name)
+                if not base:
+                    continue
+                problems = []
+                notes = []
+                requests = min(result["requests"], base["requests"])
+                skipped = []
+                for metric, fraction in PERCENTILES.items():
+                    if requests < max(min_samples, math.ceil(TAIL_SAMPLES / (1 - fraction))):
+                        skipped.append(metric.removesuffix("_ms"))
+                        continue
+                    latency_compared = True
+                    if base[metric] and result[metric] > base[metric] * (1 + tolerance):
+                        problems.append(f"{metric} {base[metric]} -> {result[metric]}")
+                if skipped:
+                    notes.append(f"{'/'.join(skipped)} not compared ({requests} requests)")
+
+                # クエリ数・バイト数はユーザーの学習状況で変わるので、同じユーザーどうしで比べる
+                users = sorted(set(result.get("by_user", {})) & set(base.get("by_user", {})))
+                if users:
+                    current = [result["by_user"][user] for user in users]
+                    previous = [base["by_user"][user] for user in users]
+                    if all(row["queries_mean"] is not None for row in current + previous):
+                        before = statistics.fmean(row["queries_mean"] for row in previous)
+                        after = statistics.fmean(row["queries_mean"] for row in current)
+                        # 同じユーザー・同じデータならクエリ数は変わらないはずなので、増えたら N+1 などを疑う
+                        if after > before + 0.5:
+                            problems.append(f"queries per request {before:.1f} -> {after:.1f} ({len(users)} users)")
+                    before = statistics.fmean(row["bytes_mean"] for row in previous)
+                    after = statistics.fmean(row["bytes_mean"] for row in current)
+                    if before and after > before * (1 + tolerance):
+                        problems.append(f"bytes {before:.0f} -> {after:.0f} ({len(users)} users)")
+                else:
+                    notes.append("no common users; queries and bytes not compared")
+
+                change = (result["p95_ms"] / base["p95_ms"] - 1) if base["p95_ms"] else 0.0
+                line = f"  {mode:>6} {name:<15} p95 {base['p95_ms']:7.1f} -> {result['p95_ms']:7.1f} ms ({change:+.0%})"
+                if notes:
+                    line += f"  [{'; '.join(notes)}]"
+                if problems:
+                    regressions.extend(f"{mode}/{name}: {problem}" for problem in problems)
+                    self.stdout.write(self.style.ERROR(f"{line}  REGRESSION: {'; '.join(problems)}"))
+                else:
+                    self.stdout.write(line)
+        if not latency_compared:
+            # 「悪化なし」と表示するとレイテンシの悪化を見逃すので、比べられなかったこと自体を報告する
+            problem = f"latency: not compared for any endpoint (fewer than {min_samples} requests; use a larger --requests)"
+            regressions.append(problem)
+            self.stdout.write(self.style.ERROR(f"  {problem}"))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS("No regressions"))
+        return regressions
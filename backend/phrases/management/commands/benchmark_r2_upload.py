@@ -0,0 +1,185 @@
+"""
+R2（S3互換）へのアップロード速度を計測するベンチマーク
+
+ローカルのS3互換サーバーに対して実行できる（本番バケットを汚さない）:
+    moto_server -p 5000   # または MinIO など
+    python manage.py benchmark_r2_upload --endpoint http://127.0.0.1:5000 \\
+        --bucket bench --access-key test --secret-key test --create-bucket
+
+--compare-legacy を付けると、従来の方式（アップロードごとに設定なしの boto3.client を作り直し、
+マルチパートを使わずに1回のPUTで送る）も同じサイズで計測する。
+"""
+from __future__ import annotations
+
+import io
+import json
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from phrases import services
+
+MB = 1024 * 1024
+
+# 従来方式でマルチパートにしないための閾値（S3の1回のPUTの上限は5GB）
+SINGLE_PUT_THRESHOLD = 5 * 1024 * MB
+
+R2_HOST_SUFFIX = ".r2.cloudflarestorage.com"
+
+
+def build_legacy_client(endpoint_url: str | None, access_key: str | None, secret_key: str | None):
+    """最適化前の upload_to_r2 と同じく、デフォルトのセッションと設定でクライアントを作る"""
+    import boto3
+
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint_url or services.get_r2_endpoint(),
+        aws_access_key_id=access_key or settings.R2_ACCESS_KEY,
+        aws_secret_access_key=secret_key or settings.R2_SECRET_KEY,
+        region_name="auto",
+    )
+
+
+def single_put_transfer_config():
+    """マルチパートを使わない TransferConfig（従来方式の計測用）"""
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(multipart_threshold=SINGLE_PUT_THRESHOLD)
+
+
+def create_bucket(client, bucket: str, endpoint_url: str | None, access_key: str | None, secret_key: str | None):
+    """
+    バケットを作成する
+
+    LocationConstraint の "auto" はR2専用の値なので、R2以外（moto / MinIO など）では付けない。
+    その場合はリージョン "auto" のクライアントだと拒否されるため、us-east-1 のクライアントで作る。
+    """
+    endpoint = endpoint_url or services.get_r2_endpoint()
+    if R2_HOST_SUFFIX in endpoint:
+        client.create_bucket(Bucket=bucket, CreateBucketConfiguration={"LocationConstraint": "auto"})
+        return
+
+    import boto3
+
+    boto3.session.Session().client(
+        "s3",
+        endpoint_url=endpoint,
+        aws_access_key_id=access_key or settings.R2_ACCESS_KEY,
+        aws_secret_access_key=secret_key or settings.R2_SECRET_KEY,
+        region_name="us-east-1",
+    ).create_bucket(Bucket=bucket)
+
+
+class SyntheticFile(io.RawIOBase):
+    """指定サイズの疑似ランダムデータを返すファイル（メモリには1MBだけ保持）"""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.position = 0
+        self.block = os.urandom(MB)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.size + offset
+        return self.position
+
+    def read(self, n: int = -1) -> bytes:
+        remaining = self.size - self.position
+        if remaining <= 0:
+            return b""
+        n = remaining if n is None or n < 0 else min(n, remaining)
+        chunks = []
+        while n > 0:
+            start = self.position % MB
+            piece = self.block[start:start + n]
+            chunks.append(piece)
+            self.position += len(piece)
+            n -= len(piece)
+        return b"".join(chunks)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class Command(BaseCommand):
+    help = "R2（S3互換）へのアップロードスループット（MB/s）を計測する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="10,50,100,500", help="計測するファイルサイズ（MB, カンマ区切り）")
+        parser.add_argument("--repeat", type=int, default=3, help="サイズごとの試行回数")
+        parser.add_argument("--endpoint", default=None, help="S3互換エンドポイント（省略時はR2設定）")
+        parser.add_argument("--bucket", default=None, help="バケット名（省略時はR2_BUCKET_NAME）")
+        parser.add_argument("--access-key", default=None)
+        parser.add_argument("--secret-key", default=None)
+        parser.add_argument("--create-bucket", action="store_true", help="バケットが無ければ作成する")
+        parser.add_argument("--compare-legacy", action="store_true", help="従来方式（毎回クライアント生成）も計測")
+        parser.add_argument("--output", default=None, help="結果をJSONで保存するパス")
+
+    def handle(self, *args, **options):
+        bucket = options["bucket"] or settings.R2_BUCKET_NAME
+        client_args = (options["endpoint"], options["access_key"], options["secret_key"])
+        if not (options["access_key"] or settings.R2_ACCESS_KEY):
+            raise CommandError("R2_ACCESS_KEY か --access-key を指定してください")
+
+        client = services.build_r2_client(*client_args)
+        if options["create_bucket"]:
+            try:
+                client.head_bucket(Bucket=bucket)
+            except Exception:
+                create_bucket(client, bucket, *client_args)
+
+        sizes = [int(size) for size in options["sizes"].split(",") if size.strip()]
+        modes = [("pooled", lambda: client, services.get_r2_transfer_config())]
+        if options["compare_legacy"]:
+            modes.append(("legacy", lambda: build_legacy_client(*client_args), single_put_transfer_config()))
+
+        results = []
+        for size_mb in sizes:
+            for mode, get_client, transfer_config in modes:
+                timings = []
+                for _ in range(options["repeat"]):
+                    key = f"benchmarks/{uuid.uuid4()}.bin"
+                    started = time.perf_counter()
+                    upload_client = get_client()
+                    upload_client.upload_fileobj(SyntheticFile(size_mb * MB), bucket, key, Config=transfer_config)
+                    timings.append(time.perf_counter() - started)
+                    client.delete_object(Bucket=bucket, Key=key)
+
+                best = min(timings)
+                avg = sum(timings) / len(timings)
+                result = {
+                    "mode": mode,
+                    "size_mb": size_mb,
+                    "best_seconds": round(best, 3),
+                    "avg_seconds": round(avg, 3),
+                    "best_mb_per_s": round(size_mb / best, 1),
+                    "avg_mb_per_s": round(size_mb / avg, 1),
+                }
+                results.append(result)
+                self.stdout.write(
+                    f"{mode:>6} {size_mb:>5} MB: {result['avg_mb_per_s']:>7} MB/s avg, "
+                    f"{result['best_mb_per_s']:>7} MB/s best ({options['repeat']} runs)"
+                )
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Saved results to {options['output']}")
@@ -0,0 +1,120 @@
+"""
+シーン画像のレスポンシブ用バリアント（WebP/JPEG・複数幅）を一括作成する
+
+- 縮小・エンコードはCPUを使うため ProcessPoolExecutor（--processes）で並列に行う
+- 画像のダウンロードとバリアントのアップロードはスレッド（--io-workers）で並列に行う
+- 作成済み（scene_image_variants.source が今のキーと一致）のものはスキップし、
+  IDの昇順にバッチごと bulk_update してチェックポイントを保存する（checkpoint.BatchRunner）。
+  失敗した行は --resume でやり直す
+- 作成済みでもプレースホルダー（LQIP）が無いものは、最小のバリアントから追加する
+
+使い方:
+    python manage.py build_image_variants
+    python manage.py build_image_variants --resume
+    python manage.py build_image_variants --model phrase --processes 4 --force
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from phrases import images, media_jobs, services
+from phrases.checkpoint import BatchRunner, Checkpoint
+
+CHECKPOINT_NAME = "build_image_variants"
+
+
+def build_one(key: str, process_pool: ProcessPoolExecutor) -> dict:
+    """ダウンロード → 子プロセスで縮小・エンコード → アップロード"""
+    try:
+        data = services.download_media(key)
+        rendered = process_pool.submit(
+            images.render_variants,
+            data,
+            settings.IMAGE_VARIANT_WIDTHS,
+            settings.IMAGE_VARIANT_FORMATS,
+            settings.IMAGE_VARIANT_QUALITY,
+        ).result()
+        return images.upload_variants(key, rendered, source_bytes=len(data))
+    finally:
+        close_old_connections()
+
+
+def add_placeholder(value: dict, process_pool: ProcessPoolExecutor) -> dict:
+    """プレースホルダーが無い既存のバリアントに追加する（最小のバリアントから作る）"""
+    by_width = next(iter(value["variants"].values()))
+    smallest = by_width[min(by_width, key=int)]["key"]
+    placeholder = process_pool.submit(images.render_placeholder, services.download_media(smallest)).result()
+    return {**value, "placeholder": placeholder}
+
+
+def build_row(obj, process_pool: ProcessPoolExecutor, force: bool = False) -> dict | None:
+    """バリアント（またはプレースホルダー）を作り、書き込むフィールドを返す（作成済みならNone）"""
+    if force or not images.is_current(obj):
+        return {"scene_image_variants": build_one(obj.scene_image_key, process_pool)}
+    if not obj.scene_image_variants.get("placeholder") and obj.scene_image_variants.get("variants"):
+        return {"scene_image_variants": add_placeholder(obj.scene_image_variants, process_pool)}
+    return None
+
+
+class Command(BaseCommand):
+    help = "シーン画像のWebP/JPEGバリアント（複数幅）を並列に作成してバックフィルする"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=["phrase", "expression", "all"], default="all")
+        parser.add_argument("--batch-size", type=int, default=200, help="1回に読み込み・更新する件数")
+        parser.add_argument("--processes", type=int, default=os.cpu_count() or 2, help="画像処理のプロセス数")
+        parser.add_argument("--io-workers", type=int, default=8, help="ダウンロード・アップロードの並列数")
+        parser.add_argument("--resume", action="store_true", help="チェックポイントの続きから処理する")
+        parser.add_argument("--force", action="store_true", help="作成済みのものも作り直す")
+        parser.add_argument("--limit", type=int, default=None, help="処理する最大件数（モデルごと）")
+
+    def handle(self, *args, **options):
+        checkpoint = Checkpoint.for_command(CHECKPOINT_NAME)
+        if not options["resume"]:
+            checkpoint.clear()
+
+        targets = ["phrase", "expression"] if options["model"] == "all" else [options["model"]]
+        # スレッド（boto3など）を持ったプロセスをforkしないよう spawn で起動する
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max(options["processes"], 1), mp_context=context) as process_pool, \
+                ThreadPoolExecutor(max_workers=max(options["io_workers"], 1), thread_name_prefix="image-io") as io_pool:
+            for target in targets:
+                self.process_model(target, process_pool, io_pool, checkpoint, options)
+
+    def process_model(self, target: str, process_pool, io_pool, checkpoint: Checkpoint, options) -> None:
+        model = media_jobs.TARGET_MODELS[target]
+        totals = {"source": 0, "variant": 0}
+
+        def count_bytes(objs) -> None:
+            for obj in objs:
+                by_width = obj.scene_image_variants["variants"].get("webp", {})
+                if by_width and obj.scene_image_variants.get("bytes"):
+                    totals["variant"] += by_width[min(by_width, key=int)]["bytes"]
+                    totals["source"] += obj.scene_image_variants["bytes"]
+
+        runner = BatchRunner(
+            self,
+            target,
+            model.objects.exclude(scene_image_key="").only("id", "scene_image_key", "scene_image_variants"),
+            checkpoint,
+            lambda obj: build_row(obj, process_pool, force=options["force"]),
+            executor=io_pool,
+            # 処理中にシーン画像が差し替えられたものは書き込まない
+            guard_fields=("scene_image_key",),
+            # 同じ画像を共有しているものは1回だけ処理する
+            group_by=lambda obj: obj.scene_image_key,
+            batch_size=options["batch_size"],
+            limit=options["limit"],
+            label="built",
+            on_written=count_bytes,
+        )
+        summary = runner.summary(runner.run())
+        if totals["source"]:
+            summary += f"; smallest WebP is {totals['variant'] / totals['source']:.0%} of the original bytes"
+        self.stdout.write(self.style.SUCCESS(summary))
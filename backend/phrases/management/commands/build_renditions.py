@@ -0,0 +1,98 @@
+"""
+既存の動画からレンディション（low / mid / high のMP4）を作成する
+
+元動画は署名付きURLからffmpegが直接読むため、ダウンロードしてから変換する必要はない。
+作成済み（renditions.source が今の video_key と一致）のものはスキップするので、
+途中で止めても再実行すれば続きから処理される。
+
+使い方:
+    python manage.py build_renditions                    # フレーズと表現の全動画
+    python manage.py build_renditions --model phrase --ids 1 2 3
+    python manage.py build_renditions --force            # 作成済みも作り直す
+"""
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from phrases import media_jobs, renditions, services
+
+
+def build_for(model, pk: int, video_key: str) -> dict:
+    try:
+        value = renditions.build_renditions(
+            services.get_media_source(video_key),
+            video_key,
+            source_bytes=services.get_media_size(video_key),
+        )
+        # 処理中に動画が差し替えられていたら書き込まない
+        model.objects.filter(pk=pk, video_key=video_key).update(renditions=value)
+        return value
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "フレーズ・表現の動画からビットレート別のレンディションを作成する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=["phrase", "expression", "all"], default="all")
+        parser.add_argument("--ids", type=int, nargs="*", help="対象のID（省略時は全件）")
+        parser.add_argument("--force", action="store_true", help="作成済みのものも作り直す")
+        parser.add_argument("--limit", type=int, default=None, help="処理する最大件数")
+        parser.add_argument(
+            "--workers", type=int, default=settings.MEDIA_FFMPEG_WORKERS,
+            help="同時に処理する動画数（ffmpegの同時実行数は MEDIA_FFMPEG_WORKERS で制限される）",
+        )
+
+    def handle(self, *args, **options):
+        targets = ["phrase", "expression"] if options["model"] == "all" else [options["model"]]
+
+        tasks = []
+        for target in targets:
+            model = media_jobs.TARGET_MODELS[target]
+            queryset = model.objects.exclude(video_key="").only("id", "video_key", "renditions").order_by("id")
+            if options["ids"]:
+                queryset = queryset.filter(id__in=options["ids"])
+            for obj in queryset.iterator(chunk_size=1000):
+                if options["force"] or not renditions.is_current(obj):
+                    tasks.append((model, obj.pk, obj.video_key))
+        if options["limit"] is not None:
+            tasks = tasks[:options["limit"]]
+
+        self.stdout.write(f"Building renditions for {len(tasks)} videos")
+        started = time.perf_counter()
+        rendition_bytes = 0
+        failed = 0
+        with ThreadPoolExecutor(max_workers=max(options["workers"], 1)) as executor:
+            futures = {
+                executor.submit(build_for, model, pk, video_key): (model, pk)
+                for model, pk, video_key in tasks
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                model, pk = futures[future]
+                label = f"{model._meta.model_name}:{pk}"
+                try:
+                    value = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"[{done}/{len(tasks)}] {label} failed: {e}")
+                    continue
+                sizes = {name: variant["bytes"] for name, variant in value["variants"].items()}
+                rendition_bytes += sum(sizes.values())
+                self.stdout.write(
+                    f"[{done}/{len(tasks)}] {label}: "
+                    + ", ".join(f"{name}={size // 1024}KB" for name, size in sizes.items())
+                )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done: {len(tasks) - failed} built, {failed} failed in {elapsed:.1f}s "
+                f"({rendition_bytes / 1024 / 1024:.1f} MB of renditions)"
+            )
+        )
@@ -0,0 +1,103 @@
+"""
+動画はあるが音声（audio_key）が無いフレーズ・表現に、動画から作った音声のみのトラックを一括で設定する
+
+動画の差し替えや AUDIO_TRACK_KBPS などの変更で古くなった音声トラック（audio/derived/ 以下）も作り直す。
+
+- 変換はffmpegプール（1スレッド = 1 ffmpegプロセス）で行う。
+  ffmpegは署名付きURLを直接読み、映像を再エンコードしないので軽い
+- アップロードは変換と同じワーカーで続けて行う（出力は数百KB程度）
+- media_info で音声トラックが無いと分かっている動画はスキップする
+- IDの昇順にバッチで処理し、バッチごとに bulk_update してチェックポイントを保存する（checkpoint.BatchRunner）。
+  失敗した行は --resume でやり直す
+
+使い方:
+    python manage.py extract_audio_tracks                 # 全件
+    python manage.py extract_audio_tracks --resume        # 前回止まったところから
+    python manage.py extract_audio_tracks --model phrase --limit 100
+"""
+from __future__ import annotations
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from phrases import audio_tracks, media, media_jobs, services
+from phrases.checkpoint import BatchRunner, Checkpoint
+
+CHECKPOINT_NAME = "extract_audio_tracks"
+
+
+def extract_and_upload(video_key: str) -> tuple[str, int]:
+    """音声トラックを作ってアップロードする（ffmpegプール上で呼ばれる）"""
+    return audio_tracks.build_audio_track(services.get_media_source(video_key), video_key)
+
+
+def has_no_audio(obj) -> bool:
+    """ffprobe済みで、音声トラックが無いと分かっている動画か"""
+    video_info = (obj.media_info or {}).get("video", {})
+    return video_info.get("source") == obj.video_key and "audio_codec" in video_info and not video_info["audio_codec"]
+
+
+class Command(BaseCommand):
+    help = "audio_key が無い（または古い）動画から音声のみのトラック（AAC/.m4a）を並列に作成してバックフィルする"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=["phrase", "expression", "all"], default="all")
+        parser.add_argument("--batch-size", type=int, default=200, help="1回に読み込み・更新する件数")
+        parser.add_argument("--resume", action="store_true", help="チェックポイントの続きから処理する")
+        parser.add_argument("--limit", type=int, default=None, help="処理する最大件数（モデルごと）")
+
+    def handle(self, *args, **options):
+        checkpoint = Checkpoint.for_command(CHECKPOINT_NAME)
+        if not options["resume"]:
+            checkpoint.clear()
+
+        targets = ["phrase", "expression"] if options["model"] == "all" else [options["model"]]
+        self.stdout.write(
+            f"Using {settings.MEDIA_FFMPEG_WORKERS} ffmpeg workers, "
+            f"{settings.AUDIO_TRACK_KBPS}kbps x {settings.AUDIO_TRACK_CHANNELS}ch AAC"
+        )
+        for target in targets:
+            self.process_model(target, checkpoint, options)
+
+    def process_model(self, target: str, checkpoint: Checkpoint, options) -> None:
+        model = media_jobs.TARGET_MODELS[target]
+        sizes: dict[str, int] = {}
+        totals = {"video": 0, "audio": 0}
+
+        def extract_row(obj) -> dict | None:
+            # 今の動画から作った音声が既にあるもの・音声トラックが無いと分かっている動画はスキップする
+            if not audio_tracks.needs_track(obj.audio_key, obj.video_key) or has_no_audio(obj):
+                return None
+            key, sizes[obj.video_key] = extract_and_upload(obj.video_key)
+            return {"audio_key": key}
+
+        def count_bytes(objs) -> None:
+            for obj in objs:
+                source_bytes = (obj.media_info or {}).get("video", {}).get("bytes")
+                if source_bytes:
+                    totals["video"] += source_bytes
+                    totals["audio"] += sizes[obj.video_key]
+
+        runner = BatchRunner(
+            self,
+            target,
+            model.objects.exclude(video_key="")
+            .filter(Q(audio_key="") | Q(audio_key__startswith=audio_tracks.DERIVED_PREFIX))
+            .only("id", "video_key", "audio_key", "media_info"),
+            checkpoint,
+            extract_row,
+            executor=media.get_ffmpeg_pool(),
+            # 処理中に管理画面から音声が設定された・動画が差し替えられたものは書き込まない
+            guard_fields=("video_key", "audio_key"),
+            # 同じ動画を共有しているものは1回だけ変換する（キーは動画のキーから決まる）
+            group_by=lambda obj: obj.video_key,
+            batch_size=options["batch_size"],
+            limit=options["limit"],
+            label="extracted",
+            on_written=count_bytes,
+        )
+        summary = runner.summary(runner.run())
+        if totals["video"]:
+            summary += f"; audio tracks are {totals['audio'] / totals['video']:.1%} of the video bytes"
+        self.stdout.write(self.style.SUCCESS(summary))
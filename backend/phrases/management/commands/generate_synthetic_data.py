@@ -0,0 +1,343 @@
+"""
+負荷試験・クエリ検証用の大規模な合成データを作る
+
+- カタログ: フレーズ・表現（親子関係あり）・フレーズと表現のリンク
+- ユーザー: ユーザー・設定・学習状況（UserProgress）・再生ログ（PlaybackLog）
+- 人気（どのフレーズが見られるか）とユーザーの活動量は Zipf 分布で、
+  ごく一部のフレーズ・ユーザーにアクセスが集中する実際の分布に近づける
+- 乱数は NumPy でまとめて生成し、snapshot.load_model でバッチごとに一括INSERT（PostgreSQLは COPY）する
+- 同じ --seed と件数なら同じデータになる（テーブルごとに独立した乱数列を使うので、
+  例えば --logs だけ変えてもカタログは変わらない）。IDは既存の最大IDの次から振る
+
+NumPy が必要（pip install -r requirements-dev.txt。本番の requirements.txt には含めていない）。
+
+使い方:
+    python manage.py generate_synthetic_data                      # 10万フレーズ・10万ユーザー
+    python manage.py generate_synthetic_data --phrases 1000 --expressions 1000 --users 1000 --logs 10000
+    python manage.py generate_synthetic_data --seed 7 --zipf 1.1 --logs 5000000
+"""
+from __future__ import annotations
+
+import datetime
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from phrases import snapshot
+from phrases.cache import get_cache
+from phrases.models import Expression, Phrase, PhraseExpression, PlaybackLog, UserProgress, UserSetting
+from phrases.signals import CATALOG_PHRASE_COUNT_KEY
+
+# 乱数を生成する単位（件数。結果が --batch-size に左右されないよう固定）
+GENERATE_CHUNK = 100_000
+# 日時はこの日から SPAN_DAYS 日の間に散らす（実行日によって変わらないよう固定）
+EPOCH = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+SPAN_DAYS = 180
+
+WORDS = (
+    "I you we they could would should please let me know how what where when why this that the a an "
+    "meeting hotel ticket station coffee office project report schedule window table menu bill price "
+    "tomorrow today later again quickly really maybe sure great nice busy open close check book try take "
+    "make send call help find wait start finish need want like think remember forget"
+).split()
+JAPANESE_WORDS = "会議 ホテル 切符 駅 コーヒー 事務所 報告 予定 窓 席 メニュー 会計 値段 明日 今日 もう一度".split()
+TAGS = ["greeting", "question", "request", "polite", "casual", "idiom", "phone", "shopping", "meeting", "travel"]
+EXPRESSION_TYPES = (["phrase", "word", "idiom", "sentence"], [0.3, 0.45, 0.1, 0.15])
+TOPICS = (["daily", "business", "travel"], [0.5, 0.3, 0.2])
+DIFFICULTIES = (["easy", "normal", "hard"], [0.3, 0.5, 0.2])
+SOURCES = (["feed", "favorites", "search"], [0.8, 0.12, 0.08])
+DEVICE_TYPES = (["ios", "android", "desktop"], [0.55, 0.35, 0.1])
+NETWORK_TYPES = (["wifi", "4g", "5g", ""], [0.6, 0.25, 0.1, 0.05])
+
+# テーブルごとの乱数列の番号
+STREAMS = {
+    "expressions": 1, "phrases": 2, "phrase_expressions": 3, "users": 4,
+    "user_settings": 5, "user_progress": 6, "playback_logs": 7, "ranks": 8,
+}
+
+
+def import_numpy():
+    try:
+        import numpy as np
+    except ImportError as e:
+        raise CommandError("generate_synthetic_data requires NumPy (pip install -r requirements-dev.txt)") from e
+    return np
+
+
+class Command(BaseCommand):
+    help = "負荷試験用の大規模な合成データ（カタログ・ユーザー・学習状況・再生ログ）を一括で作る"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--phrases", type=int, default=100_000)
+        parser.add_argument("--expressions", type=int, default=100_000)
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--progress", type=int, default=1_000_000, help="学習状況の件数（目安。重複は除く）")
+        parser.add_argument("--logs", type=int, default=1_000_000, help="再生ログの件数")
+        parser.add_argument("--zipf", type=float, default=1.1, help="Zipf分布の指数（大きいほど一部に集中する）")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=snapshot.DEFAULT_BATCH_SIZE, help="1回に入れる件数")
+
+    def handle(self, *args, **options):
+        self.np = import_numpy()
+        self.options = options
+        self.seed = options["seed"]
+        self.username_prefix = f"synthetic-{self.seed}-"
+        User = get_user_model()
+        if User.objects.filter(username__startswith=self.username_prefix).exists():
+            raise CommandError(
+                f"Synthetic data for seed {self.seed} already exists; use a fresh database or another --seed"
+            )
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            self.first_ids = {
+                model: (model.objects.aggregate(max_id=Max("id"))["max_id"] or 0) + 1
+                for model in (Expression, Phrase, PhraseExpression, User, UserSetting, UserProgress, PlaybackLog)
+            }
+            # 人気の順位 → ID の対応（IDの順に人気があるわけではないよう並べ替える）
+            ranks = self.rng("ranks")
+            self.phrase_by_rank = ranks.permutation(options["phrases"]) + self.first_ids[Phrase]
+            self.expression_by_rank = ranks.permutation(options["expressions"]) + self.first_ids[Expression]
+            self.user_by_rank = ranks.permutation(options["users"]) + self.first_ids[User]
+            self.zipf_weights = {}
+
+            self.load("expressions", Expression, self.expression_records())
+            self.load("phrases", Phrase, self.phrase_records())
+            self.load("phrase_expressions", PhraseExpression, self.link_records())
+            self.load("users", User, self.user_records())
+            self.load("user_settings", UserSetting, self.setting_records())
+            self.load("user_progress", UserProgress, self.progress_records())
+            self.load("playback_logs", PlaybackLog, self.log_records())
+            snapshot.reset_sequences([Expression, Phrase, PhraseExpression, User, UserSetting, UserProgress, PlaybackLog])
+
+        # bulk_create では post_save が呼ばれないので、件数のキャッシュはここで消す
+        get_cache().invalidate(CATALOG_PHRASE_COUNT_KEY)
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.1f}s (seed {self.seed})"))
+
+    # --- 共通 ---
+
+    def rng(self, stream: str):
+        return self.np.random.default_rng([self.seed, STREAMS[stream]])
+
+    def load(self, name: str, model, records) -> None:
+        started = time.perf_counter()
+        count = snapshot.load_model(model, records, batch_size=self.options["batch_size"], upsert=False)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"  {name}: {count} rows in {elapsed:.1f}s ({count / elapsed if elapsed else 0:,.0f} rows/s)")
+
+    def chunks(self, total: int):
+        """(開始位置, 件数) を GENERATE_CHUNK 件ずつ返す"""
+        for start in range(0, total, GENERATE_CHUNK):
+            yield start, min(GENERATE_CHUNK, total - start)
+
+    def zipf_ranks(self, rng, n: int, size: int):
+        """1..n の順位を Zipf 分布で size 個選ぶ（0始まりの順位を返す）"""
+        if n not in self.zipf_weights:
+            weights = 1.0 / self.np.arange(1, n + 1) ** self.options["zipf"]
+            self.zipf_weights[n] = weights / weights.sum()
+        return rng.choice(n, size=size, p=self.zipf_weights[n])
+
+    def categorical(self, rng, choices, size: int) -> list:
+        values, probabilities = choices
+        return [values[i] for i in rng.choice(len(values), size=size, p=probabilities)]
+
+    def timestamps(self, rng, size: int) -> list:
+        seconds = rng.integers(0, SPAN_DAYS * 86400, size=size)
+        return [EPOCH + datetime.timedelta(seconds=int(value)) for value in seconds]
+
+    def sentences(self, rng, size: int, min_words: int, max_words: int) -> list[str]:
+        np = self.np
+        lengths = rng.integers(min_words, max_words + 1, size=size)
+        words = np.array(WORDS)[rng.integers(0, len(WORDS), size=(size, max_words))]
+        return [" ".join(row[:length]).capitalize() for row, length in zip(words.tolist(), lengths.tolist())]
+
+    def meanings(self, rng, size: int) -> list[str]:
+        np = self.np
+        words = np.array(JAPANESE_WORDS)[rng.integers(0, len(JAPANESE_WORDS), size=(size, 2))]
+        return [f"{a}の{b}（合成）" for a, b in words.tolist()]
+
+    # --- カタログ ---
+
+    def expression_records(self):
+        rng = self.rng("expressions")
+        first_id = self.first_ids[Expression]
+        for start, size in self.chunks(self.options["expressions"]):
+            ids = range(first_id + start, first_id + start + size)
+            types = self.categorical(rng, EXPRESSION_TYPES, size)
+            texts = self.sentences(rng, size, 1, 5)
+            meanings = self.meanings(rng, size)
+            created = self.timestamps(rng, size)
+            # 1割ほどは、それより前に作った表現を親に持つ（循環しない）
+            has_parent = rng.random(size) < 0.1
+            parent_offsets = rng.integers(1, 50, size=size)
+            orders = rng.integers(0, 10, size=size)
+            for i, pk in enumerate(ids):
+                parent_id = pk - int(parent_offsets[i]) if has_parent[i] else None
+                yield {
+                    "id": pk,
+                    "type": types[i],
+                    "text": texts[i],
+                    "meaning": meanings[i],
+                    "audio_key": f"synthetic/expressions/{pk}.m4a",
+                    "parent_id": parent_id if parent_id is not None and parent_id >= first_id else None,
+                    "order": int(orders[i]),
+                    "created_at": created[i],
+                    "updated_at": created[i],
+                }
+
+    def phrase_records(self):
+        rng = self.rng("phrases")
+        first_id = self.first_ids[Phrase]
+        for start, size in self.chunks(self.options["phrases"]):
+            texts = self.sentences(rng, size, 4, 12)
+            meanings = self.meanings(rng, size)
+            topics = self.categorical(rng, TOPICS, size)
+            difficulties = self.categorical(rng, DIFFICULTIES, size)
+            durations = rng.integers(3, 31, size=size)
+            tag_counts = rng.integers(0, 4, size=size)
+            tag_indexes = rng.integers(0, len(TAGS), size=(size, 3))
+            created = self.timestamps(rng, size)
+            for i in range(size):
+                pk = first_id + start + i
+                tags = sorted({TAGS[j] for j in tag_indexes[i, :tag_counts[i]].tolist()})
+                yield {
+                    "id": pk,
+                    "text": texts[i] + "?",
+                    "meaning": meanings[i],
+                    "topic": topics[i],
+                    "tags": tags,
+                    "audio_key": f"synthetic/phrases/{pk}.m4a",
+                    "video_key": f"synthetic/phrases/{pk}.mp4",
+                    "duration_sec": int(durations[i]),
+                    "difficulty": difficulties[i],
+                    "created_at": created[i],
+                    "updated_at": created[i],
+                }
+
+    def link_records(self):
+        """フレーズごとに0〜3個の表現（人気の偏りあり）をつなぐ"""
+        np = self.np
+        rng = self.rng("phrase_expressions")
+        if not self.options["expressions"]:
+            return
+        pk = self.first_ids[PhraseExpression]
+        for start, size in self.chunks(self.options["phrases"]):
+            counts = rng.integers(0, 4, size=size)
+            phrase_ids = np.repeat(self.first_ids[Phrase] + start + np.arange(size), counts)
+            expression_ids = self.expression_by_rank[
+                self.zipf_ranks(rng, self.options["expressions"], len(phrase_ids))
+            ]
+            # (フレーズ, 表現) の重複を除く
+            pairs = np.unique(np.stack([phrase_ids, expression_ids], axis=1), axis=0)
+            orders = rng.integers(0, 5, size=len(pairs))
+            for (phrase_id, expression_id), order in zip(pairs.tolist(), orders.tolist()):
+                yield {"id": pk, "phrase_id": phrase_id, "expression_id": expression_id, "order": order}
+                pk += 1
+
+    # --- ユーザー ---
+
+    def user_records(self):
+        rng = self.rng("users")
+        first_id = self.first_ids[get_user_model()]
+        for start, size in self.chunks(self.options["users"]):
+            joined = self.timestamps(rng, size)
+            for i in range(size):
+                username = f"{self.username_prefix}{start + i}"
+                yield {
+                    "id": first_id + start + i,
+                    "username": username,
+                    "email": f"{username}@example.com",
+                    # ログインできないパスワード（set_unusable_password と同じ形）
+                    "password": "!synthetic",
+                    "is_active": True,
+                    "date_joined": joined[i],
+                }
+
+    def setting_records(self):
+        rng = self.rng("user_settings")
+        first_id = self.first_ids[UserSetting]
+        first_user_id = self.first_ids[get_user_model()]
+        for start, size in self.chunks(self.options["users"]):
+            speeds = rng.choice([0.75, 1.0, 1.0, 1.0, 1.25, 1.5], size=size)
+            repeats = rng.integers(1, 6, size=size)
+            show_japanese = rng.random(size) < 0.7
+            created = self.timestamps(rng, size)
+            for i in range(size):
+                yield {
+                    "id": first_id + start + i,
+                    "user_id": first_user_id + start + i,
+                    "playback_speed": f"{speeds[i]:.2f}",
+                    "volume": "0.80",
+                    "show_japanese": bool(show_japanese[i]),
+                    "repeat_count": int(repeats[i]),
+                    "created_at": created[i],
+                    "updated_at": created[i],
+                }
+
+    def progress_records(self):
+        """活動量（ユーザー）と人気（フレーズ）がどちらも Zipf 分布に従う学習状況"""
+        np = self.np
+        rng = self.rng("user_progress")
+        users, phrases = self.options["users"], self.options["phrases"]
+        if not users or not phrases:
+            return
+        seen = set()
+        pk = self.first_ids[UserProgress]
+        for _, size in self.chunks(self.options["progress"]):
+            user_ids = self.user_by_rank[self.zipf_ranks(rng, users, size)]
+            phrase_ids = self.phrase_by_rank[self.zipf_ranks(rng, phrases, size)]
+            completed = rng.random(size) < 0.6
+            replays = rng.geometric(0.3, size=size) - 1
+            favorite = rng.random(size) < 0.1
+            mastered = completed & (rng.random(size) < 0.2)
+            reviewed = self.timestamps(rng, size)
+            keys = user_ids.astype(np.int64) * (phrases + self.first_ids[Phrase]) + phrase_ids
+            for i, key in enumerate(keys.tolist()):
+                # (ユーザー, フレーズ) は一意
+                if key in seen:
+                    continue
+                seen.add(key)
+                yield {
+                    "id": pk,
+                    "user_id": int(user_ids[i]),
+                    "phrase_id": int(phrase_ids[i]),
+                    "completed": bool(completed[i]),
+                    "replay_count": int(replays[i]),
+                    "last_reviewed": reviewed[i],
+                    "is_favorite": bool(favorite[i]),
+                    "is_mastered": bool(mastered[i]),
+                    "created_at": reviewed[i],
+                    "updated_at": reviewed[i],
+                }
+                pk += 1
+
+    def log_records(self):
+        rng = self.rng("playback_logs")
+        users, phrases = self.options["users"], self.options["phrases"]
+        if not users or not phrases:
+            return
+        first_id = self.first_ids[PlaybackLog]
+        for start, size in self.chunks(self.options["logs"]):
+            user_ids = self.user_by_rank[self.zipf_ranks(rng, users, size)].tolist()
+            phrase_ids = self.phrase_by_rank[self.zipf_ranks(rng, phrases, size)].tolist()
+            play_ms = rng.lognormal(8.5, 0.7, size=size).astype(int).tolist()
+            completed = (rng.random(size) < 0.55).tolist()
+            sources = self.categorical(rng, SOURCES, size)
+            devices = self.categorical(rng, DEVICE_TYPES, size)
+            networks = self.categorical(rng, NETWORK_TYPES, size)
+            created = self.timestamps(rng, size)
+            for i in range(size):
+                yield {
+                    "id": first_id + start + i,
+                    "user_id": user_ids[i],
+                    "phrase_id": phrase_ids[i],
+                    "play_ms": play_ms[i],
+                    "completed": completed[i],
+                    "source": sources[i],
+                    "device_type": devices[i],
+                    "network_type": networks[i],
+                    "created_at": created[i],
+                }
@@ -0,0 +1,286 @@
+"""
+表現（Expression）・親子関係・フレーズとのリンク（PhraseExpression）を一括でインポートする
+
+入力は CSV / JSON（配列）/ JSONL（.gz 圧縮も可）。data_export/ の expressions.json・
+phrase_expressions.json はそのまま読める。
+
+表現のカラム:
+    id（省略可）, type, text, meaning, phonetic, image_key, audio_key, video_key, scene_image_key, order,
+    parent_id（ファイル内またはDBの表現のID）または parent_text + parent_type（自然キー）
+リンクのカラム:
+    phrase_id または phrase_text, expression_id または expression_text + expression_type, order
+
+- 参照の解決（自然キー → ID）はDBから一度だけ読み込んだ対応表とファイルの内容でメモリ上で行う
+- 親が先に入るよう、親子関係の深さごとにまとめて bulk_create(update_conflicts=True) する
+  （id が既にあれば更新、自然キー（type, text）が一致する表現があればそのIDで更新する）
+- リンクは (phrase, expression) の組で upsert する
+- 全体を1トランザクションで実行するので、途中で失敗したら何も書き込まれない
+
+使い方:
+    python manage.py import_expression_graph --expressions data_export/expressions.json \\
+        --links data_export/phrase_expressions.json
+    python manage.py import_expression_graph --expressions new_words.csv --ignore-ids
+"""
+from __future__ import annotations
+
+import csv
+import gzip
+import json
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from phrases.models import Expression, Phrase, PhraseExpression
+
+EXPRESSION_FIELDS = [
+    "type", "text", "meaning", "phonetic", "image_key", "audio_key", "video_key", "scene_image_key", "order",
+]
+DEFAULT_TYPE = "phrase"
+
+
+def read_records(path: str):
+    """CSV / JSON（配列）/ JSONL を辞書として順に返す"""
+    opener = gzip.open if path.endswith(".gz") else open
+    name = path[:-3] if path.endswith(".gz") else path
+    with opener(path, "rt", encoding="utf-8", newline="") as f:
+        if name.endswith(".csv"):
+            yield from csv.DictReader(f)
+        elif name.endswith((".jsonl", ".ndjson")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+def optional_int(value) -> int | None:
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def expression_key(type_: str | None, text: str) -> tuple[str, str]:
+    return (type_ or DEFAULT_TYPE, text.strip())
+
+
+class Command(BaseCommand):
+    help = "表現とその親子関係・フレーズとのリンクを依存順のバッチで一括インポートする"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--expressions", help="表現のファイル（CSV / JSON / JSONL）")
+        parser.add_argument("--links", help="フレーズと表現のリンクのファイル（CSV / JSON / JSONL）")
+        parser.add_argument("--batch-size", type=int, default=1000, help="1回のINSERTの件数")
+        parser.add_argument(
+            "--ignore-ids", action="store_true",
+            help="ファイルのIDをDBのIDとして使わない（ファイル内の参照にだけ使い、自然キーで照合する）",
+        )
+
+    def handle(self, *args, **options):
+        if not options["expressions"] and not options["links"]:
+            raise CommandError("Specify --expressions and/or --links")
+
+        started = time.perf_counter()
+        # 自然キー → ID の対応表はここで一度だけ読み込む
+        self.expression_ids: dict[tuple[str, str], int] = {}
+        self.existing_expression_pks: set[int] = set()
+        for pk, type_, text in Expression.objects.order_by("id").values_list("id", "type", "text"):
+            self.expression_ids.setdefault(expression_key(type_, text), pk)
+            self.existing_expression_pks.add(pk)
+        self.by_source_id: dict[int, dict] = {}
+        self.ignore_ids = options["ignore_ids"]
+        self.stdout.write(f"Loaded {len(self.existing_expression_pks)} existing expressions")
+
+        with transaction.atomic():
+            if options["expressions"]:
+                self.import_expressions(options["expressions"], options)
+            if options["links"]:
+                self.import_links(options["links"], options)
+
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.2f}s"))
+
+    # --- 表現 ---
+
+    def import_expressions(self, path: str, options) -> None:
+        started = time.perf_counter()
+        records = []
+        by_key: dict[tuple[str, str], dict] = {}
+        for raw in read_records(path):
+            record = {field: raw.get(field) for field in EXPRESSION_FIELDS}
+            record["type"] = record["type"] or DEFAULT_TYPE
+            record["text"] = (record["text"] or "").strip()
+            if not record["text"]:
+                raise CommandError(f"Expression without text: {raw}")
+            record["order"] = optional_int(record["order"]) or 0
+            for field in EXPRESSION_FIELDS:
+                if record[field] is None:
+                    record[field] = ""
+            record["source_id"] = optional_int(raw.get("id"))
+            record["parent_source_id"] = optional_int(raw.get("parent_id"))
+            record["parent_key"] = (
+                expression_key(raw.get("parent_type"), raw["parent_text"]) if raw.get("parent_text") else None
+            )
+
+            key = expression_key(record["type"], record["text"])
+            if record["source_id"] is not None and not self.ignore_ids:
+                record["pk"] = record["source_id"]
+            else:
+                record["pk"] = self.expression_ids.get(key)
+            if record["source_id"] is not None:
+                self.by_source_id[record["source_id"]] = record
+            by_key[key] = record
+            records.append(record)
+
+        levels = self.topological_levels(records, by_key)
+        self.stdout.write(f"Read {len(records)} expressions in {len(levels)} levels from {path}")
+
+        update_fields = [*EXPRESSION_FIELDS, "parent", "updated_at"]
+        created = updated = 0
+        for depth, level in enumerate(levels):
+            objs = []
+            for record in level:
+                parent = record.get("parent_record")
+                parent_pk = parent["pk"] if parent is not None else record.get("parent_pk")
+                objs.append(
+                    Expression(
+                        pk=record["pk"],
+                        parent_id=parent_pk,
+                        **{field: record[field] for field in EXPRESSION_FIELDS},
+                    )
+                )
+            with_pk = [obj for obj in objs if obj.pk is not None]
+            without_pk = [obj for obj in objs if obj.pk is None]
+            existing = sum(1 for obj in with_pk if obj.pk in self.existing_expression_pks)
+            updated += existing
+            created += len(objs) - existing
+
+            for group in (with_pk, without_pk):
+                if not group:
+                    continue
+                Expression.objects.bulk_create(
+                    group,
+                    batch_size=options["batch_size"],
+                    update_conflicts=True,
+                    unique_fields=["id"],
+                    update_fields=update_fields,
+                )
+                if group is with_pk:
+                    # IDを指定して入れた後は、自動採番されるIDが重ならないようシーケンスを進めてから残りを入れる
+                    self.reset_sequences([Expression])
+            for record, obj in zip(level, objs):
+                record["pk"] = obj.pk
+                self.expression_ids[expression_key(record["type"], record["text"])] = obj.pk
+                self.existing_expression_pks.add(obj.pk)
+            self.stdout.write(f"  level {depth}: {len(objs)} expressions")
+
+        self.stdout.write(
+            f"Expressions: {created} created, {updated} updated in {time.perf_counter() - started:.2f}s"
+        )
+
+    def topological_levels(self, records: list[dict], by_key: dict) -> list[list[dict]]:
+        """親子関係の深さごとに分ける（親がファイル外＝既存なら深さ0）"""
+        for record in records:
+            parent = None
+            if record["parent_source_id"] is not None:
+                parent = self.by_source_id.get(record["parent_source_id"])
+                if parent is None:
+                    # --ignore-ids ではファイル外のIDはDBのIDとして扱えない
+                    if self.ignore_ids or record["parent_source_id"] not in self.existing_expression_pks:
+                        raise CommandError(
+                            f"Unknown parent_id {record['parent_source_id']} for expression {record['text']!r}"
+                        )
+                    record["parent_pk"] = record["parent_source_id"]
+            elif record["parent_key"] is not None:
+                parent = by_key.get(record["parent_key"])
+                if parent is None:
+                    record["parent_pk"] = self.expression_ids.get(record["parent_key"])
+                    if record["parent_pk"] is None:
+                        raise CommandError(
+                            f"Unknown parent {record['parent_key']} for expression {record['text']!r}"
+                        )
+            if parent is record:
+                raise CommandError(f"Expression {record['text']!r} is its own parent")
+            record["parent_record"] = parent
+
+        depths: dict[int, int] = {}
+        for record in records:
+            # 親をたどって深さを求める（循環していればエラー）
+            chain = []
+            on_chain = set()
+            current = record
+            while current is not None and id(current) not in depths:
+                if id(current) in on_chain:
+                    raise CommandError(f"Parent cycle involving expression {current['text']!r}")
+                chain.append(current)
+                on_chain.add(id(current))
+                current = current["parent_record"]
+            depth = depths[id(current)] if current is not None else -1
+            for item in reversed(chain):
+                depth += 1
+                depths[id(item)] = depth
+
+        levels: dict[int, list[dict]] = defaultdict(list)
+        for record in records:
+            levels[depths[id(record)]].append(record)
+        return [levels[depth] for depth in sorted(levels)]
+
+    # --- リンク ---
+
+    def import_links(self, path: str, options) -> None:
+        started = time.perf_counter()
+        phrase_pks = set(Phrase.objects.values_list("id", flat=True))
+        phrase_ids_by_text: dict[str, int] = {}
+        for pk, text in Phrase.objects.order_by("id").values_list("id", "text"):
+            phrase_ids_by_text.setdefault(text.strip(), pk)
+
+        links: dict[tuple[int, int], PhraseExpression] = {}
+        unresolved = 0
+        for raw in read_records(path):
+            phrase_id = optional_int(raw.get("phrase_id"))
+            if raw.get("phrase_text"):
+                phrase_id = phrase_ids_by_text.get(raw["phrase_text"].strip())
+            elif phrase_id not in phrase_pks:
+                phrase_id = None
+
+            expression_id = self.resolve_expression(raw)
+            if phrase_id is None or expression_id is None:
+                unresolved += 1
+                if unresolved <= 20:
+                    self.stderr.write(f"  unresolved link: {raw}")
+                continue
+            links[(phrase_id, expression_id)] = PhraseExpression(
+                phrase_id=phrase_id, expression_id=expression_id, order=optional_int(raw.get("order")) or 0
+            )
+
+        PhraseExpression.objects.bulk_create(
+            list(links.values()),
+            batch_size=options["batch_size"],
+            update_conflicts=True,
+            unique_fields=["phrase", "expression"],
+            update_fields=["order"],
+        )
+        self.stdout.write(
+            f"Links: {len(links)} upserted, {unresolved} unresolved in {time.perf_counter() - started:.2f}s"
+        )
+
+    def resolve_expression(self, raw: dict) -> int | None:
+        if raw.get("expression_text"):
+            return self.expression_ids.get(expression_key(raw.get("expression_type"), raw["expression_text"]))
+        source_id = optional_int(raw.get("expression_id"))
+        if source_id is None:
+            return None
+        # 同じ実行で読み込んだ表現ならそのID（--ignore-ids で振り直された場合も追える）
+        if source_id in self.by_source_id:
+            return self.by_source_id[source_id]["pk"]
+        if self.ignore_ids:
+            return None
+        return source_id if source_id in self.existing_expression_pks else None
+
+    def reset_sequences(self, models: list) -> None:
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
@@ -0,0 +1,78 @@
+"""
+フレーズ・表現のメディアをffprobeで調べ、duration_sec と media_info を埋める
+
+- ffprobeは署名付きURLを直接読む（ヘッダー部分のRange読み込みだけでファイル全体は落とさない）
+- IDの昇順にバッチで処理し、バッチごとに bulk_update してチェックポイントを保存する（checkpoint.BatchRunner）。
+  失敗した行は --resume でやり直す
+- 取得済み（media_info の source が今のキーと一致）のものはスキップするので何度実行してもよい
+
+使い方:
+    python manage.py probe_media                 # 全件
+    python manage.py probe_media --resume        # 前回止まったところから
+    python manage.py probe_media --model phrase --workers 32
+"""
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from phrases import media_jobs, media_probe
+from phrases.checkpoint import BatchRunner, Checkpoint
+
+CHECKPOINT_NAME = "probe_media"
+
+
+def probe_row(obj, force: bool = False) -> dict | None:
+    """まだ取得していないメディアをすべて調べ、書き込むフィールドを返す（無ければNone）"""
+    pending = media_probe.pending_kinds(obj, force=force)
+    if not pending:
+        return None
+    changed = set()
+    for kind, key in pending:
+        changed.update(media_probe.apply(obj, kind, media_probe.probe_key(key), overwrite_duration=force))
+    return {field: getattr(obj, field) for field in changed}
+
+
+class Command(BaseCommand):
+    help = "メディアの長さ・サイズ・解像度・ビットレートをffprobeで取得してバックフィルする"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=["phrase", "expression", "all"], default="all")
+        parser.add_argument("--batch-size", type=int, default=500, help="1回に読み込み・更新する件数")
+        parser.add_argument("--workers", type=int, default=16, help="同時に実行するffprobeの数")
+        parser.add_argument("--resume", action="store_true", help="チェックポイントの続きから処理する")
+        parser.add_argument("--force", action="store_true", help="取得済みのものも取り直す")
+        parser.add_argument("--limit", type=int, default=None, help="処理する最大件数（モデルごと）")
+
+    def handle(self, *args, **options):
+        checkpoint = Checkpoint.for_command(CHECKPOINT_NAME)
+        if not options["resume"]:
+            checkpoint.clear()
+
+        targets = ["phrase", "expression"] if options["model"] == "all" else [options["model"]]
+        with ThreadPoolExecutor(max_workers=max(options["workers"], 1), thread_name_prefix="ffprobe") as executor:
+            for target in targets:
+                self.process_model(target, executor, checkpoint, options)
+
+    def process_model(self, target: str, executor, checkpoint: Checkpoint, options) -> None:
+        model = media_jobs.TARGET_MODELS[target]
+        key_fields = tuple(media_probe.MEDIA_FIELDS[target].values())
+        fields = ["id", "media_info", *key_fields]
+        if target == "phrase":
+            fields.append("duration_sec")
+
+        runner = BatchRunner(
+            self,
+            target,
+            model.objects.only(*fields),
+            checkpoint,
+            lambda obj: probe_row(obj, force=options["force"]),
+            executor=executor,
+            # 処理中にメディアが差し替えられたものは書き込まない
+            guard_fields=key_fields,
+            batch_size=options["batch_size"],
+            limit=options["limit"],
+            label="probed",
+        )
+        self.stdout.write(self.style.SUCCESS(runner.summary(runner.run())))
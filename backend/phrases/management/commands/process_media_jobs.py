@@ -0,0 +1,56 @@
+"""
+MediaJob（管理画面からのアップロード）を処理するワーカー
+
+保存したwebプロセス内でもすぐに1回処理されるが、失敗したジョブの再試行（バックオフ）と
+再起動などで取り残されたジョブ（リース切れ）の回収はこのコマンドが行う。
+本番では render.yaml の english-phrase-media-worker として常駐させる。
+共有ストレージ（R2 の MEDIA_JOB_STAGING_PREFIX）に移ったファイルだけを処理するので、webと別のホストで動かせる
+（公開用キーへはサーバー側でコピーするので、ダウンロードはffmpegに渡すための1回だけ）。
+
+使い方:
+    python manage.py process_media_jobs          # 常駐して処理し続ける
+    python manage.py process_media_jobs --once   # 実行待ちのジョブを1回処理して終了
+"""
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from phrases import media_jobs
+
+
+class Command(BaseCommand):
+    help = "MediaJob（メディアのアップロード・サムネイル生成）を処理する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="1バッチだけ処理して終了")
+        parser.add_argument(
+            "--workers", type=int, default=settings.MEDIA_JOB_WORKERS,
+            help="同時に処理するジョブ数",
+        )
+        parser.add_argument("--batch-size", type=int, default=20, help="1回に取得する件数")
+        parser.add_argument(
+            "--interval", type=float, default=5.0,
+            help="キューが空のときの待機秒数",
+        )
+
+    def handle(self, *args, **options):
+        executor = ThreadPoolExecutor(max_workers=max(options["workers"], 1), thread_name_prefix="media-job")
+        try:
+            while True:
+                job_ids = media_jobs.due_job_ids(options["batch_size"])
+                if job_ids:
+                    # 取得（claim）は各スレッドで行うので、webプロセスと同じジョブを二重に処理しない
+                    list(executor.map(media_jobs.run_job_in_thread, job_ids))
+                    self.stdout.write(f"Processed {len(job_ids)} media jobs")
+                if options["once"]:
+                    break
+                if not job_ids:
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            executor.shutdown(wait=True)
@@ -0,0 +1,242 @@
+"""
+スナップショット（data_export/）やフィクスチャから開発・テスト用のDBに一括でデータを入れる
+
+loaddata や migrate_to_postgres.py の代わりに使う:
+- JSON / JSONL を1件ずつ読む（JSON配列もストリーミングで読むので、大きなファイルでもメモリ使用量は一定）
+- モデルごとに batch_size 件ずつ bulk_create（PostgreSQLは COPY）で入れる。既存の行はIDで照合して上書き
+- シーケンスのリセットは最後に1回だけ行い、全体を1トランザクションで実行する
+- --flush では対象のテーブルを外部キーで参照しているテーブル（user_progress など）も空にする
+  （参照が残っていると PostgreSQL の TRUNCATE やコミット時の外部キーの検査で失敗するため）
+
+入力:
+- ディレクトリ: data_export/ と同じ形式（users.json, playback_logs.jsonl.gz など。TABLES の順に入れる）
+- ファイル: Django のフィクスチャ形式（[{"model": "phrases.phrase", "pk": 1, "fields": {...}}, ...]）
+文字コードは UTF-8（読めなければ CP932 として読む）。
+
+使い方:
+    python manage.py migrate && python manage.py seed_from_snapshot      # data_export/ から
+    python manage.py seed_from_snapshot phrases/fixtures/sample_phrases.json
+    python manage.py seed_from_snapshot --flush --tables phrases,expressions,phrase_expressions
+        # ↑ これらを参照している user_progress・playback_logs も空になる
+    python manage.py seed_from_snapshot --dry-run --repeat 5 --output seed_benchmark.json   # 計測のみ
+"""
+from __future__ import annotations
+
+import codecs
+import gzip
+import json
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from phrases import snapshot
+from phrases.cache import get_cache
+from phrases.models import Phrase
+from phrases.signals import CATALOG_PHRASE_COUNT_KEY
+
+# 文字コードの判定に読むバイト数
+DETECT_BYTES = 1024 * 1024
+
+
+def detect_encoding(path: Path) -> str:
+    """先頭を UTF-8 として読めるか確かめ、読めなければ CP932 とみなす"""
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rb") as f:
+        head = f.read(DETECT_BYTES)
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+    except UnicodeDecodeError:
+        return "cp932"
+    return "utf-8"
+
+
+def referencing_models(models: list) -> list:
+    """models を外部キーで参照しているモデル（間接的な参照と多対多の中間テーブルを含む。models 自身は除く）"""
+    seen = set(models)
+    found = []
+    queue = list(models)
+    while queue:
+        model = queue.pop(0)
+        for field in model._meta.get_fields(include_hidden=True):
+            if not (field.auto_created and not field.concrete and (field.one_to_many or field.one_to_one)):
+                continue
+            related = field.related_model
+            if related in seen or related._meta.proxy or not related._meta.managed:
+                continue
+            seen.add(related)
+            found.append(related)
+            queue.append(related)
+    return found
+
+
+def fixture_rows(records):
+    """フィクスチャのレコードを (モデル, attname → 値の辞書) にする"""
+    for record in records:
+        try:
+            model = apps.get_model(record["model"])
+        except (KeyError, LookupError) as e:
+            raise CommandError(f"Unknown model in fixture: {record.get('model')!r}") from e
+        if record.get("pk") is None:
+            raise CommandError(f"Fixture record without pk: {record}")
+        row = {model._meta.pk.attname: record["pk"]}
+        for name, value in record.get("fields", {}).items():
+            field = model._meta.get_field(name)
+            if field.many_to_many:
+                # through モデルのレコードとして入っているので無視する
+                continue
+            if field.is_relation and isinstance(value, list):
+                raise CommandError(f"Natural keys are not supported ({record['model']}.{name})")
+            row[field.attname] = value
+        yield model, row
+
+
+class Command(BaseCommand):
+    help = "data_export/ のスナップショットやフィクスチャからバッチの一括INSERTでDBにデータを入れる"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "source", nargs="?", default=None,
+            help="スナップショットのディレクトリまたはフィクスチャのファイル（省略時は data_export/）",
+        )
+        parser.add_argument(
+            "--tables", default=None,
+            help=f"入れるテーブル（カンマ区切り: {', '.join(snapshot.TABLES_BY_NAME)}）",
+        )
+        parser.add_argument("--batch-size", type=int, default=snapshot.DEFAULT_BATCH_SIZE, help="1回に入れる件数")
+        parser.add_argument(
+            "--flush", action="store_true", help="対象のテーブル（とそれを参照しているテーブル）を空にしてから入れる",
+        )
+        parser.add_argument("--encoding", default=None, help="ファイルの文字コード（省略時は自動判定）")
+        parser.add_argument("--dry-run", action="store_true", help="入れた後にロールバックする（計測用）")
+        parser.add_argument("--repeat", type=int, default=1, help="繰り返す回数（計測用）")
+        parser.add_argument("--output", default=None, help="計測結果をJSONで保存するパス")
+
+    def handle(self, *args, **options):
+        source = Path(options["source"]) if options["source"] else Path(settings.BASE_DIR) / "data_export"
+        if not source.exists():
+            raise CommandError(f"{source} does not exist")
+        if options["tables"]:
+            names = [name.strip() for name in options["tables"].split(",") if name.strip()]
+            unknown = [name for name in names if name not in snapshot.TABLES_BY_NAME]
+            if unknown:
+                raise CommandError(f"Unknown tables: {', '.join(unknown)}")
+            self.specs = [spec for spec in snapshot.TABLES if spec.name in names]
+        else:
+            self.specs = list(snapshot.TABLES)
+
+        self.stdout.write(
+            f"Seeding {connection.vendor} from {source} "
+            f"({'COPY' if connection.vendor == 'postgresql' else 'bulk_create'}, batch size {options['batch_size']})"
+        )
+        runs = []
+        for run in range(max(options["repeat"], 1)):
+            if options["repeat"] > 1:
+                self.stdout.write(f"Run {run + 1}/{options['repeat']}")
+            runs.append(self.seed(source, options))
+
+        seconds = [run["seconds"] for run in runs]
+        report = {
+            "source": str(source),
+            "vendor": connection.vendor,
+            "batch_size": options["batch_size"],
+            "rows": runs[-1]["rows"],
+            "best_seconds": round(min(seconds), 3),
+            "avg_seconds": round(sum(seconds) / len(seconds), 3),
+            "runs": runs,
+        }
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {report['rows']} rows in {report['best_seconds']}s"
+            + (f" (best of {len(runs)}, avg {report['avg_seconds']}s)" if len(runs) > 1 else "")
+            + (" [rolled back]" if options["dry_run"] else "")
+        ))
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Saved results to {options['output']}")
+
+    def seed(self, source: Path, options) -> dict:
+        started = time.perf_counter()
+        self.tables: dict[str, dict] = {}
+        with transaction.atomic():
+            if options["flush"]:
+                self.flush([spec.model for spec in self.specs])
+            if source.is_dir():
+                models = self.seed_directory(source, options)
+            else:
+                models = self.seed_fixture(source, options)
+            # シーケンスのリセットは最後に1回だけ
+            snapshot.reset_sequences(models)
+            if options["dry_run"]:
+                transaction.set_rollback(True)
+
+        if Phrase in models and not options["dry_run"]:
+            # bulk_create では post_save が呼ばれないので、件数のキャッシュはここで消す
+            get_cache().invalidate(CATALOG_PHRASE_COUNT_KEY)
+
+        elapsed = time.perf_counter() - started
+        for name, table in self.tables.items():
+            table["seconds"] = round(table["seconds"], 3)
+            self.stdout.write(
+                f"  {name}: {table['rows']} rows in {table['seconds']:.2f}s "
+                f"({table['rows'] / table['seconds'] if table['seconds'] else 0:,.0f} rows/s)"
+            )
+        return {
+            "rows": sum(table["rows"] for table in self.tables.values()),
+            "seconds": round(elapsed, 3),
+            "tables": self.tables,
+        }
+
+    def flush(self, models: list) -> None:
+        referencing = referencing_models(models)
+        if referencing:
+            self.stdout.write(self.style.WARNING(
+                "Also flushing tables that reference them: "
+                + ", ".join(model._meta.db_table for model in referencing)
+            ))
+        tables = [model._meta.db_table for model in [*models, *referencing]]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sql_flush(no_style(), tables, allow_cascade=True):
+                cursor.execute(sql)
+
+    def load(self, name: str, model, records, options) -> None:
+        started = time.perf_counter()
+        count = snapshot.load_model(
+            model, records, batch_size=options["batch_size"], upsert=not options["flush"]
+        )
+        table = self.tables.setdefault(name, {"rows": 0, "seconds": 0.0})
+        table["rows"] += count
+        table["seconds"] += time.perf_counter() - started
+
+    def seed_directory(self, directory: Path, options) -> list:
+        models = []
+        for spec in self.specs:
+            path = snapshot.find_snapshot(directory, spec)
+            if path is None:
+                continue
+            encoding = options["encoding"] or detect_encoding(path)
+            self.load(spec.name, spec.model, snapshot.iter_records(path, encoding=encoding), options)
+            models.append(spec.model)
+        return models
+
+    def seed_fixture(self, path: Path, options) -> list:
+        """フィクスチャはモデルが混ざっているので、モデルごとに batch_size 件たまったら入れる"""
+        allowed = {spec.model for spec in self.specs} if options["tables"] else None
+        encoding = options["encoding"] or detect_encoding(path)
+        pending: dict = {}
+        for model, row in fixture_rows(snapshot.iter_records(path, encoding=encoding)):
+            if allowed is not None and model not in allowed:
+                continue
+            rows = pending.setdefault(model, [])
+            rows.append(row)
+            if len(rows) >= options["batch_size"]:
+                self.load(model._meta.label, model, rows, options)
+                pending[model] = []
+        for model, rows in pending.items():
+            if rows:
+                self.load(model._meta.label, model, rows, options)
+        return list(pending)
@@ -0,0 +1,172 @@
+"""
+送信キュー（EmailOutbox）に溜まったメールを送信するワーカー
+
+使い方:
+    python manage.py send_outbox_emails          # 常駐して送信し続ける
+    python manage.py send_outbox_emails --once   # 1バッチだけ送信して終了
+"""
+from __future__ import annotations
+
+import logging
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from phrases import models, services
+
+logger = logging.getLogger(__name__)
+
+# 送信中のまま放置された行（ワーカー停止など）を再送対象に戻すまでの時間は、取得したバッチを
+# 送り終えるまでの最悪の時間（lease_seconds）にこの余裕を足したものにする
+LEASE_MARGIN_SECONDS = 60
+
+
+def executor_name(provider: str) -> str:
+    """送信に使うスレッドプール（同時送信数の設定が無いプロバイダは smtp のプールで送る）"""
+    return provider if provider in settings.EMAIL_OUTBOX_CONCURRENCY else "smtp"
+
+
+def lease_seconds(providers: list[str]) -> int:
+    """
+    取得したバッチを送り終えるまでの最悪の時間（秒）
+
+    プロバイダごとのプールは並列に動き、プール内では同時送信数ずつ、1通あたり最大 EMAIL_TIMEOUT 秒かかる。
+    """
+    counts: dict[str, int] = {}
+    for provider in providers:
+        name = executor_name(provider)
+        counts[name] = counts.get(name, 0) + 1
+    rounds = max(
+        (math.ceil(count / max(settings.EMAIL_OUTBOX_CONCURRENCY[name], 1)) for name, count in counts.items()),
+        default=0,
+    )
+    return rounds * settings.EMAIL_TIMEOUT + LEASE_MARGIN_SECONDS
+
+
+def claim_batch(batch_size: int) -> list[models.EmailOutbox]:
+    """
+    送信対象の行をロックして sending 状態にする（複数ワーカーで重複しない）
+
+    リースはバッチを送り終えるまでの最悪の時間より長くするので、送信中に他のワーカーが同じ行を取得して再送することはない。
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            models.EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status="pending", next_attempt_at__lte=now)
+                | Q(status="sending", locked_until__lt=now)
+            )
+            .order_by("next_attempt_at", "id")
+            .values_list("id", "provider")[:batch_size]
+        )
+        ids = [pk for pk, _ in rows]
+        if ids:
+            models.EmailOutbox.objects.filter(id__in=ids).update(
+                status="sending",
+                locked_until=now + timedelta(seconds=lease_seconds([provider for _, provider in rows])),
+                updated_at=now,
+            )
+    return list(models.EmailOutbox.objects.filter(id__in=ids))
+
+
+def retry_delay(attempts: int) -> float:
+    """指数バックオフ（ジッター付き）"""
+    base = settings.EMAIL_OUTBOX_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0))
+    delay = min(base, settings.EMAIL_OUTBOX_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def send_message(message: models.EmailOutbox) -> None:
+    sent = services.send_email_via_provider(
+        message.provider,
+        to_email=message.to_email,
+        subject=message.subject,
+        plain_content=message.plain_content,
+        html_content=message.html_content or None,
+        from_email=message.from_email or None,
+    )
+    if not sent:
+        raise RuntimeError("Email provider returned an error response")
+
+
+class Command(BaseCommand):
+    help = "送信キュー（EmailOutbox）のメールをバッチ送信する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="1バッチだけ処理して終了")
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.EMAIL_OUTBOX_BATCH_SIZE,
+            help="1回に取得する件数",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=5.0,
+            help="キューが空のときの待機秒数",
+        )
+
+    def handle(self, *args, **options):
+        # プロバイダごとにスレッドプールを作り、同時送信数を制限する
+        executors = {
+            provider: ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix=f"outbox-{provider}")
+            for provider, workers in settings.EMAIL_OUTBOX_CONCURRENCY.items()
+        }
+        try:
+            while True:
+                processed = self.process_batch(executors, options["batch_size"])
+                if options["once"]:
+                    break
+                if not processed:
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True)
+
+    def process_batch(self, executors, batch_size: int) -> int:
+        messages = claim_batch(batch_size)
+        if not messages:
+            return 0
+
+        futures = []
+        for message in messages:
+            executor = executors[executor_name(message.provider)]
+            futures.append((message, executor.submit(send_message, message)))
+
+        now = timezone.now()
+        sent_count = 0
+        for message, future in futures:
+            message.attempts += 1
+            message.locked_until = None
+            message.updated_at = now
+            try:
+                future.result()
+            except Exception as e:
+                message.last_error = f"{type(e).__name__}: {e}"[:2000]
+                if message.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                    message.status = "failed"
+                    logger.error(f"Giving up on email {message.id} to {message.to_email}: {e}")
+                else:
+                    message.status = "pending"
+                    message.next_attempt_at = now + timedelta(seconds=retry_delay(message.attempts))
+                    logger.warning(f"Email {message.id} failed (attempt {message.attempts}), will retry: {e}")
+            else:
+                message.status = "sent"
+                message.sent_at = timezone.now()
+                message.last_error = ""
+                sent_count += 1
+
+        models.EmailOutbox.objects.bulk_update(
+            messages,
+            ["status", "attempts", "next_attempt_at", "locked_until", "sent_at", "last_error", "updated_at"],
+        )
+        self.stdout.write(f"Sent {sent_count}/{len(messages)} emails")
+        return len(messages)
@@ -0,0 +1,285 @@
+"""
+ffmpegを使ったメディア処理
+
+ffmpegは1ジョブ1プロセスで実行し、同時に動かすffmpegプロセス数を
+MEDIA_FFMPEG_WORKERS で制限する（管理画面の保存やバッチ処理がCPUを奪い合わないように）。
+入力はディスク上のパス・URL・メモリ上のファイルのいずれでもよく、
+動画をディスクへ書き直さずにffmpegへ渡す。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MediaProcessingError(Exception):
+    pass
+
+
+@dataclass(slots=True)
+class ThumbnailResult:
+    data: bytes
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def get_ffmpeg_pool() -> ThreadPoolExecutor:
+    """
+    ffmpegプロセスの同時実行数を制限するプール
+
+    各タスクはffmpegの子プロセスを起動して待つだけなので、
+    スレッド1本 = ffmpegプロセス1つとなり、実質的にプロセスプールとして働く。
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=settings.MEDIA_FFMPEG_WORKERS,
+                    thread_name_prefix="ffmpeg",
+                )
+    return _pool
+
+
+def _source_path(source) -> str | None:
+    """ffmpegに直接渡せるパス/URLがあれば返す（無ければNone）"""
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    # Djangoの大きなアップロード（TemporaryUploadedFile）は既にディスク上にある
+    if hasattr(source, "temporary_file_path"):
+        return source.temporary_file_path()
+    return None
+
+
+def _read_bytes(source) -> bytes:
+    if hasattr(source, "chunks"):
+        return b"".join(source.chunks())
+    source.seek(0)
+    return source.read()
+
+
+def run_ffmpeg(args: list[str], input_bytes: bytes | None = None, timeout: float | None = None) -> bytes:
+    """ffmpegを実行して標準出力を返す"""
+    command = [settings.FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", *args]
+    try:
+        completed = subprocess.run(
+            command,
+            input=input_bytes,
+            capture_output=True,
+            timeout=timeout or settings.MEDIA_FFMPEG_TIMEOUT,
+            check=False,
+        )
+    except subprocess.TimeoutExpired as e:
+        raise MediaProcessingError(f"ffmpeg timed out after {e.timeout}s") from e
+    if completed.returncode != 0:
+        stderr = completed.stderr.decode(errors="replace").strip()
+        raise MediaProcessingError(f"ffmpeg failed ({completed.returncode}): {stderr[-500:]}")
+    return completed.stdout
+
+
+def _positive_float(value) -> float | None:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number > 0 else None
+
+
+def probe(source, timeout: float | None = None) -> dict:
+    """
+    ffprobeでメディアの長さ・サイズ・解像度・ビットレートを取得する
+
+    URL（署名付きURL）を渡した場合、ffprobeはヘッダー部分だけをRangeリクエストで読むため
+    ファイル全体はダウンロードしない。
+    """
+    path = _source_path(source)
+    if path is None:
+        raise MediaProcessingError("probe() requires a file path or URL")
+    command = [
+        settings.FFPROBE_BINARY, "-v", "error",
+        "-print_format", "json",
+        "-show_format", "-show_streams",
+        path,
+    ]
+    try:
+        completed = subprocess.run(
+            command,
+            capture_output=True,
+            timeout=timeout or settings.MEDIA_FFMPEG_TIMEOUT,
+            check=False,
+        )
+    except subprocess.TimeoutExpired as e:
+        raise MediaProcessingError(f"ffprobe timed out after {e.timeout}s") from e
+    if completed.returncode != 0:
+        stderr = completed.stderr.decode(errors="replace").strip()
+        raise MediaProcessingError(f"ffprobe failed ({completed.returncode}): {stderr[-500:]}")
+
+    data = json.loads(completed.stdout or b"{}")
+    fmt = data.get("format", {})
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+    duration = _positive_float(fmt.get("duration")) or _positive_float(video.get("duration"))
+    size = int(fmt["size"]) if str(fmt.get("size", "")).isdigit() else None
+    bit_rate = _positive_float(fmt.get("bit_rate"))
+    return {
+        "duration": round(duration, 3) if duration else None,
+        "bytes": size,
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "bit_rate": int(bit_rate) if bit_rate else None,
+        "video_codec": video.get("codec_name"),
+        "audio_codec": audio.get("codec_name"),
+        "format": fmt.get("format_name"),
+    }
+
+
+def _thumbnail_args(input_name: str, width: int) -> list[str]:
+    return [
+        # キーフレームだけをデコードし、最初のキーフレームを1枚だけ出力
+        "-skip_frame", "nokey",
+        "-i", input_name,
+        "-an",
+        "-frames:v", "1",
+        "-vf", f"scale={width}:-2",
+        "-q:v", "3",
+        "-f", "image2pipe",
+        "-vcodec", "mjpeg",
+        "pipe:1",
+    ]
+
+
+def extract_thumbnail(source, width: int = 720) -> ThumbnailResult:
+    """
+    動画の最初のキーフレームをJPEGとしてメモリ上に取り出す
+
+    Args:
+        source: ファイルパス・URL・Djangoのアップロードファイル・ファイルオブジェクト
+        width: 出力画像の幅（px）
+    """
+    timings: dict[str, float] = {}
+    started = time.perf_counter()
+
+    path = _source_path(source)
+    if path is not None:
+        timings["read"] = 0.0
+        decode_started = time.perf_counter()
+        data = run_ffmpeg(_thumbnail_args(path, width))
+    else:
+        video_bytes = _read_bytes(source)
+        timings["read"] = time.perf_counter() - started
+        decode_started = time.perf_counter()
+        try:
+            # メモリ上の動画はパイプで渡す（moovが末尾のMP4はパイプで読めない）
+            data = run_ffmpeg(_thumbnail_args("pipe:0", width), input_bytes=video_bytes)
+        except MediaProcessingError:
+            with tempfile.NamedTemporaryFile(suffix=".mp4") as tmp_video:
+                tmp_video.write(video_bytes)
+                tmp_video.flush()
+                data = run_ffmpeg(_thumbnail_args(tmp_video.name, width))
+    timings["decode"] = time.perf_counter() - decode_started
+
+    if not data:
+        raise MediaProcessingError("ffmpeg produced no thumbnail")
+    timings["total"] = time.perf_counter() - started
+    return ThumbnailResult(data=data, timings=timings)
+
+
+def submit_thumbnail(source, width: int = 720) -> Future:
+    """extract_thumbnail() をffmpegプールで実行する"""
+    return get_ffmpeg_pool().submit(extract_thumbnail, source, width)
+
+
+def _transcode_args(input_name: str, output_path: str, height: int, video_kbps: int, audio_kbps: int) -> list[str]:
+    return [
+        "-i", input_name,
+        "-map", "0:v:0",
+        "-map", "0:a:0?",
+        # 元動画より大きくはしない（幅は偶数に丸める）
+        "-vf", f"scale=-2:'min({height},ih)'",
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-profile:v", "main",
+        "-pix_fmt", "yuv420p",
+        "-b:v", f"{video_kbps}k",
+        "-maxrate", f"{int(video_kbps * 1.2)}k",
+        "-bufsize", f"{video_kbps * 2}k",
+        "-c:a", "aac",
+        "-b:a", f"{audio_kbps}k",
+        "-ac", "2",
+        # moovを先頭に置き、ダウンロード完了前に再生を始められるようにする
+        "-movflags", "+faststart",
+        "-y", output_path,
+    ]
+
+
+def transcode(source, output_path: str, *, height: int, video_kbps: int, audio_kbps: int) -> float:
+    """
+    動画を指定の解像度・ビットレートのMP4に変換する
+
+    faststartのために出力はシーク可能なファイルに書く。入力はパス・URL
+    （署名付きURLならダウンロードせずに読める）またはDjangoのアップロードファイル。
+    変換にかかった秒数を返す。
+    """
+    path = _source_path(source)
+    started = time.perf_counter()
+    if path is not None:
+        run_ffmpeg(
+            _transcode_args(path, output_path, height, video_kbps, audio_kbps),
+            timeout=settings.MEDIA_TRANSCODE_TIMEOUT,
+        )
+    else:
+        with tempfile.NamedTemporaryFile(suffix=".mp4") as tmp_video:
+            tmp_video.write(_read_bytes(source))
+            tmp_video.flush()
+            run_ffmpeg(
+                _transcode_args(tmp_video.name, output_path, height, video_kbps, audio_kbps),
+                timeout=settings.MEDIA_TRANSCODE_TIMEOUT,
+            )
+    return time.perf_counter() - started
+
+
+def submit_transcode(source, output_path: str, **profile) -> Future:
+    """transcode() をffmpegプールで実行する"""
+    return get_ffmpeg_pool().submit(transcode, source, output_path, **profile)
+
+
+def extract_audio(source, output_path: str, *, kbps: int, channels: int = 1) -> float:
+    """
+    動画の音声トラックだけをAAC（.m4a）として書き出す
+
+    入力はパス・URL（署名付きURLなら映像部分はほとんど読まずに済む）。
+    音声トラックが無い動画では MediaProcessingError になる。変換にかかった秒数を返す。
+    """
+    path = _source_path(source)
+    if path is None:
+        raise MediaProcessingError("extract_audio() requires a file path or URL")
+    started = time.perf_counter()
+    run_ffmpeg(
+        [
+            "-i", path,
+            "-vn",
+            "-map", "0:a:0",
+            "-c:a", "aac",
+            "-b:a", f"{kbps}k",
+            "-ac", str(channels),
+            "-movflags", "+faststart",
+            "-y", output_path,
+        ],
+        timeout=settings.MEDIA_TRANSCODE_TIMEOUT,
+    )
+    return time.perf_counter() - started
@@ -0,0 +1,543 @@
+"""
+管理画面からアップロードされたメディアのバックグラウンド処理
+
+管理画面の保存リクエストではファイルをこのホストのステージング領域（MEDIA_JOB_STAGING_DIR）に
+置いて MediaJob を登録するだけにし、R2への転送・サムネイル生成・レンディション作成は
+ワーカーで行う（大きな動画でも gunicorn のタイムアウトにかからない）。
+
+- 保存がコミットされたら、同じプロセスのワーカープールでローカルのファイルから処理する
+  （すぐに処理するための近道。元ファイルの転送は公開用キーへの1回だけ）
+- このプロセスで処理しない設定のときや失敗して再試行するときは、ファイルを共有ストレージ
+  （R2 の MEDIA_JOB_STAGING_PREFIX 以下）に移し、どのホストのワーカーでも処理できるようにする
+- 失敗したジョブの再試行（バックオフ）とリースが切れたジョブの回収は、
+  常駐ワーカー（`process_media_jobs`、render.yaml の english-phrase-media-worker）が行う。
+  共有ストレージから処理するときは、公開用キーへはサーバー側でコピーする（再アップロードしない）
+- 処理中はリースを定期的に延長するので、長い変換の途中で他のワーカーに回収されない
+- 完了したら対象の Phrase / Expression の *_key を更新する
+- キーは内容のハッシュにでき、同じファイルを再アップロードしても転送・保存は1回で済む
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import media_probe, models, services
+
+logger = logging.getLogger(__name__)
+
+# 処理中のジョブのリース（秒）。処理している間は LEASE_RENEW_SECONDS ごとに延長するので、
+# 1ジョブの処理時間（レンディションの変換など）に関係なく、プロセスが止まったジョブはこの時間で回収できる
+LEASE_SECONDS = 300
+LEASE_RENEW_SECONDS = 60
+
+TARGET_MODELS = {
+    "phrase": models.Phrase,
+    "expression": models.Expression,
+}
+
+KIND_FIELDS = {
+    "video": "video_key",
+    "audio": "audio_key",
+    "image": "image_key",
+    "scene_image": "scene_image_key",
+}
+
+
+@dataclass(slots=True)
+class PendingUpload:
+    """
+    フォームで受け取ったアップロード（保存後にジョブとして登録する）
+
+    MEDIA_CONTENT_ADDRESSED_KEYS が有効なら key・thumbnail_key のファイル名部分は
+    アップロード時に内容のハッシュに置き換わる（ディレクトリと拡張子だけが使われる）。
+    """
+
+    kind: str
+    file: object
+    key: str
+    thumbnail_key: str = ""
+
+
+class StagedUploadLost(Exception):
+    """ステージングしたファイルが共有ストレージに移る前に失われた（再試行しても処理できない）"""
+
+
+def stage_upload(upload) -> str:
+    """アップロードファイルをこのホストのステージング領域に置き、そのパスを返す"""
+    staging_dir = settings.MEDIA_JOB_STAGING_DIR
+    os.makedirs(staging_dir, exist_ok=True)
+    ext = os.path.splitext(upload.name)[1].lower()
+    path = os.path.join(staging_dir, f"{uuid.uuid4()}{ext}")
+
+    # 大きなアップロードは既に一時ファイルになっているので、同じファイルシステムならリンクだけで済ませる
+    if hasattr(upload, "temporary_file_path"):
+        try:
+            os.link(upload.temporary_file_path(), path)
+            return path
+        except OSError:
+            pass
+
+    with open(path, "wb") as destination:
+        for chunk in upload.chunks():
+            destination.write(chunk)
+    return path
+
+
+def publish_staged(job: models.MediaJob) -> None:
+    """このホストにだけあるステージングファイルを共有ストレージに移し、どのホストのワーカーでも処理できるようにする"""
+    if job.staged_key or not job.staged_path:
+        return
+    ext = os.path.splitext(job.staged_path)[1]
+    key = f"{settings.MEDIA_JOB_STAGING_PREFIX.strip('/')}/{uuid.uuid4()}{ext}"
+    with open(job.staged_path, "rb") as f:
+        # 大きな動画はマルチパートで並列に送られる。公開しないのでCDNにキャッシュさせない
+        job.staged_key = services.upload_to_r2(
+            File(f, name=os.path.basename(job.staged_path)), key, cache_control="private, no-store"
+        )
+    local_path, job.staged_path = job.staged_path, ""
+    job.save(update_fields=["staged_key", "staged_path", "updated_at"])
+    _remove_local(local_path)
+
+
+def _remove_local(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@contextmanager
+def staged_copy(key: str):
+    """ステージングしたファイルをこのホストの一時ファイルにダウンロードし、そのパスを渡す"""
+    fd, path = tempfile.mkstemp(prefix="media-job-", suffix=os.path.splitext(key)[1])
+    os.close(fd)
+    try:
+        services.download_media_to_file(key, path)
+        yield path
+    finally:
+        _remove_local(path)
+
+
+@contextmanager
+def staged_source(job: models.MediaJob):
+    """元ファイルのこのホスト上のパスを渡す（ローカルにあればそのまま、無ければ共有ストレージからダウンロード）"""
+    if job.staged_path and os.path.exists(job.staged_path):
+        yield job.staged_path
+    elif job.staged_key:
+        with staged_copy(job.staged_key) as path:
+            yield path
+    else:
+        raise StagedUploadLost(
+            f"Staged upload {job.staged_path or '(none)'} is not on this host and never reached shared storage; "
+            "upload the file again"
+        )
+
+
+def enqueue(instance, uploads: list[PendingUpload]) -> list[models.MediaJob]:
+    """アップロードをステージングしてジョブを登録し、コミット後に処理を開始する"""
+    target_type = instance._meta.model_name
+    jobs = []
+    for upload in uploads:
+        options = {"content_type": getattr(upload.file, "content_type", "") or ""}
+        if upload.thumbnail_key:
+            options["thumbnail_key"] = upload.thumbnail_key
+        jobs.append(
+            models.MediaJob(
+                target_type=target_type,
+                target_id=instance.pk,
+                kind=upload.kind,
+                key=upload.key,
+                staged_path=stage_upload(upload.file),
+                options=options,
+            )
+        )
+    jobs = models.MediaJob.objects.bulk_create(jobs)
+
+    job_ids = [job.pk for job in jobs]
+    transaction.on_commit(lambda: dispatch(job_ids))
+    return jobs
+
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def get_job_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=settings.MEDIA_JOB_WORKERS,
+                    thread_name_prefix="media-job",
+                )
+    return _pool
+
+
+def dispatch(job_ids: list[int]) -> None:
+    """
+    同じプロセスのワーカープールでジョブを処理する
+
+    1回試すだけなので、失敗したジョブの再試行やプロセスが止まって取り残されたジョブは
+    process_media_jobs コマンドが拾う。MEDIA_JOBS_IN_PROCESS が無効なら、ステージングした
+    ファイルを共有ストレージに移すだけにして処理はワーカーに任せる。
+    """
+    task = run_job_in_thread if settings.MEDIA_JOBS_IN_PROCESS else run_publish_in_thread
+    pool = get_job_pool()
+    for job_id in job_ids:
+        pool.submit(task, job_id)
+
+
+def due_job_ids(limit: int) -> list[int]:
+    """
+    実行待ち、またはリースが切れたジョブのIDを返す
+
+    ステージングしたファイルがまだ共有ストレージに移っていない実行待ちのジョブは、
+    ファイルのあるwebプロセスが処理する（または移す）ので含めない。
+    """
+    now = timezone.now()
+    return list(
+        models.MediaJob.objects.filter(
+            Q(status="pending", next_attempt_at__lte=now) & ~Q(staged_key="")
+            | Q(status="processing", locked_until__lt=now)
+        )
+        .order_by("next_attempt_at", "id")
+        .values_list("id", flat=True)[:limit]
+    )
+
+
+def claim(job_id: int) -> models.MediaJob | None:
+    """ジョブを processing にする（他のワーカーが取得済みならNone）"""
+    now = timezone.now()
+    claimed = (
+        models.MediaJob.objects.filter(pk=job_id)
+        .filter(
+            Q(status="pending", next_attempt_at__lte=now)
+            | Q(status="processing", locked_until__lt=now)
+        )
+        .update(
+            status="processing",
+            attempts=F("attempts") + 1,
+            locked_until=now + timedelta(seconds=LEASE_SECONDS),
+            updated_at=now,
+        )
+    )
+    if not claimed:
+        return None
+    return models.MediaJob.objects.get(pk=job_id)
+
+
+def renew_lease(job: models.MediaJob) -> bool:
+    """処理中のジョブのリースを延長する（他のワーカーに回収されていたら False）"""
+    return bool(
+        models.MediaJob.objects.filter(pk=job.pk, status="processing").update(
+            locked_until=timezone.now() + timedelta(seconds=LEASE_SECONDS)
+        )
+    )
+
+
+@contextmanager
+def lease_renewal(job: models.MediaJob):
+    """この中の処理をしている間、別スレッドで LEASE_RENEW_SECONDS ごとにリースを延長する"""
+    stop = threading.Event()
+
+    def renew() -> None:
+        try:
+            while not stop.wait(LEASE_RENEW_SECONDS):
+                if not renew_lease(job):
+                    logger.warning(f"Lost the lease on media job {job.pk}")
+                    return
+        except Exception as e:
+            logger.warning(f"Could not renew the lease on media job {job.pk}: {e}")
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=renew, name=f"media-job-lease-{job.pk}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def retry_delay(attempts: int) -> float:
+    """指数バックオフ（ジッター付き）"""
+    delay = min(30 * (2 ** max(attempts - 1, 0)), 3600)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def run_job_in_thread(job_id: int) -> None:
+    """ワーカースレッド用: ジョブを取得して処理し、DB接続を片付ける"""
+    try:
+        job = claim(job_id)
+        if job is not None:
+            process(job)
+    except Exception as e:
+        logger.error(f"Media job {job_id} crashed: {e}", exc_info=True)
+    finally:
+        close_old_connections()
+
+
+def run_publish_in_thread(job_id: int) -> None:
+    """ワーカースレッド用: ステージングしたファイルを共有ストレージに移す（処理はワーカーに任せる）"""
+    try:
+        job = models.MediaJob.objects.filter(pk=job_id, status="pending").first()
+        if job is not None:
+            publish_staged(job)
+    except Exception as e:
+        # ファイルはこのホストにしか無いので、他のワーカーでは処理できない
+        logger.error(f"Could not publish staged upload of media job {job_id}: {e}", exc_info=True)
+        models.MediaJob.objects.filter(pk=job_id, staged_key="").update(
+            status="failed", last_error=f"Staging failed: {type(e).__name__}: {e}"[:2000], updated_at=timezone.now()
+        )
+    finally:
+        close_old_connections()
+
+
+def process(job: models.MediaJob) -> bool:
+    """取得済みのジョブを実行し、結果を保存する"""
+    started = time.perf_counter()
+    job.last_error = ""
+    try:
+        with lease_renewal(job), staged_source(job) as source_path:
+            download_seconds = time.perf_counter() - started
+            updates, timings, probed, replace_if_unchanged = _execute(job, source_path)
+        if source_path != job.staged_path:
+            timings = {"download": download_seconds, **timings}
+    except Exception as e:
+        now = timezone.now()
+        job.last_error = f"{type(e).__name__}: {e}"[:2000]
+        job.locked_until = None
+        if isinstance(e, StagedUploadLost) or job.attempts >= settings.MEDIA_JOB_MAX_ATTEMPTS:
+            # ステージングしたファイルは手動で再実行できるよう残しておく
+            job.status = "failed"
+            logger.error(f"Giving up on media job {job.pk} ({job.key}): {e}")
+        else:
+            job.status = "pending"
+            job.next_attempt_at = now + timedelta(seconds=retry_delay(job.attempts))
+            logger.warning(f"Media job {job.pk} failed (attempt {job.attempts}), will retry: {e}")
+        job.save(update_fields=["status", "next_attempt_at", "locked_until", "last_error", "updated_at"])
+        if job.status == "pending" and not job.staged_key:
+            # 再試行は別のホストのワーカーが行うことがあるので、このホストにしか無いファイルを移しておく
+            try:
+                publish_staged(job)
+            except Exception as publish_error:
+                logger.error(f"Could not publish staged upload of media job {job.pk}: {publish_error}")
+                job.status = "failed"
+                job.last_error = f"{job.last_error}\nStaging failed: {publish_error}"[:2000]
+                job.save(update_fields=["status", "last_error", "updated_at"])
+        return False
+
+    model = TARGET_MODELS[job.target_type]
+    now = timezone.now()
+    with transaction.atomic():
+        if probed is not None:
+            target = model.objects.select_for_update().filter(pk=job.target_id).first()
+            if target is not None:
+                for field, value in updates.items():
+                    setattr(target, field, value)
+                for field in media_probe.apply(target, job.kind, probed, overwrite_duration=True):
+                    updates[field] = getattr(target, field)
+        model.objects.filter(pk=job.target_id).update(updated_at=now, **updates)
+        for field, (value, current) in replace_if_unchanged.items():
+            # 処理中に管理画面から設定されたものは上書きしない
+            model.objects.filter(pk=job.target_id, **{field: current}).update(**{field: value})
+        timings["total"] = time.perf_counter() - started
+        job.status = "done"
+        job.locked_until = None
+        job.finished_at = now
+        job.timings = {stage: round(seconds, 3) for stage, seconds in timings.items()}
+        job.save(update_fields=["key", "status", "locked_until", "finished_at", "timings", "last_error", "updated_at"])
+
+    if job.staged_path:
+        _remove_local(job.staged_path)
+    if job.staged_key:
+        try:
+            services.delete_media(job.staged_key)
+        except Exception as e:
+            # 残っても tmp/ のライフサイクルルールで消える
+            logger.warning(f"Could not delete staged upload {job.staged_key}: {e}")
+    logger.info(
+        f"Media job {job.pk} done ({job.target_type}:{job.target_id} {job.kind}): "
+        + ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in timings.items())
+    )
+    return True
+
+
+def _execute(job: models.MediaJob, source_path: str) -> tuple[dict, dict[str, float], dict | None, dict]:
+    """
+    アップロードとサムネイル生成を行い、対象モデルに書き込む値・処理時間・メタデータと、
+    処理前の値から変わっていないときだけ書き込む値（派生した音声トラック。フィールド → (値, 処理前の値)）を返す
+
+    source_path はステージングしたファイル（またはそのこのホスト上のコピー）。
+    """
+    from . import media
+
+    timings: dict[str, float] = {}
+    updates = {}
+    thumbnail_key = job.options.get("thumbnail_key")
+
+    # サムネイルはffmpegプールで生成し、その間にこのスレッドで動画をアップロードする
+    thumbnail_future = media.submit_thumbnail(source_path) if thumbnail_key else None
+
+    upload_started = time.perf_counter()
+    job.key = _store_source(job, source_path)
+    updates[KIND_FIELDS[job.kind]] = job.key
+    timings["upload"] = time.perf_counter() - upload_started
+
+    probed = None
+    try:
+        probed = {"source": job.key, **media.probe(source_path)}
+    except Exception as e:
+        logger.warning(f"Probe failed for media job {job.pk}: {e}")
+
+    if thumbnail_future is not None:
+        try:
+            result = thumbnail_future.result()
+            thumbnail_started = time.perf_counter()
+            thumbnail_key = services.upload_to_r2(
+                services.in_memory_file(result.data, thumbnail_key, "image/jpeg"),
+                thumbnail_key,
+                content_addressed=settings.MEDIA_CONTENT_ADDRESSED_KEYS,
+            )
+            timings["thumbnail_decode"] = result.timings.get("decode", 0.0)
+            timings["thumbnail_upload"] = time.perf_counter() - thumbnail_started
+            updates["scene_image_key"] = thumbnail_key
+            updates["scene_image_variants"] = _build_image_variants(job, thumbnail_key, result.data, timings)
+        except Exception as e:
+            # サムネイルが作れなくても動画自体は公開できるので失敗扱いにしない
+            job.last_error = f"Thumbnail skipped: {type(e).__name__}: {e}"[:2000]
+            logger.warning(f"Thumbnail generation failed for media job {job.pk}: {e}")
+
+    if job.kind == "scene_image":
+        with open(source_path, "rb") as f:
+            updates["scene_image_variants"] = _build_image_variants(job, job.key, f.read(), timings)
+
+    if job.kind == "video" and settings.VIDEO_RENDITIONS_ON_UPLOAD:
+        from . import renditions
+
+        renditions_started = time.perf_counter()
+        try:
+            updates["renditions"] = renditions.build_renditions(
+                source_path, job.key, source_bytes=os.path.getsize(source_path)
+            )
+            timings["renditions"] = time.perf_counter() - renditions_started
+        except Exception as e:
+            # レンディションが無くても元動画で再生できる（build_renditions コマンドで作り直せる）
+            job.last_error = f"Renditions skipped: {type(e).__name__}: {e}"[:2000]
+            logger.warning(f"Rendition build failed for media job {job.pk}: {e}")
+
+    replace_if_unchanged = {}
+    current_audio_key = None
+    if job.kind == "video" and settings.AUDIO_TRACK_ON_UPLOAD:
+        current_audio_key = _audio_key_to_replace(job, probed)
+    if current_audio_key is not None:
+        from . import audio_tracks
+
+        audio_started = time.perf_counter()
+        try:
+            audio_key, _ = media.get_ffmpeg_pool().submit(
+                audio_tracks.build_audio_track, source_path, job.key
+            ).result()
+            replace_if_unchanged["audio_key"] = (audio_key, current_audio_key)
+            timings["audio_track"] = time.perf_counter() - audio_started
+        except Exception as e:
+            # 音声トラックが無くても動画で再生できる（extract_audio_tracks コマンドで作り直せる）
+            job.last_error = f"Audio track skipped: {type(e).__name__}: {e}"[:2000]
+            logger.warning(f"Audio track build failed for media job {job.pk}: {e}")
+
+    return updates, timings, probed, replace_if_unchanged
+
+
+def _store_source(job: models.MediaJob, source_path: str) -> str:
+    """
+    元ファイルを公開用のキーに保存し、そのキーを返す
+
+    共有ストレージにステージング済みなら、アップロードし直さずにサーバー側でコピーする。
+    内容のハッシュをキーにする場合は、既に同じファイルがあれば転送せずにそのキーを使う。
+    """
+    content_type = job.options.get("content_type") or None
+    if not job.staged_key:
+        with open(source_path, "rb") as f:
+            staged_file = File(f, name=os.path.basename(job.key))
+            staged_file.content_type = content_type
+            return services.upload_to_r2(
+                staged_file, job.key, content_addressed=settings.MEDIA_CONTENT_ADDRESSED_KEYS
+            )
+
+    key = job.key
+    if settings.MEDIA_CONTENT_ADDRESSED_KEYS:
+        digest = hashlib.sha256()
+        with open(source_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        key = services.content_key(job.key, digest.hexdigest())
+        if services.media_exists(key):
+            logger.info(f"Skipped upload of {key}: identical content already stored")
+            return key
+    return services.copy_media(job.staged_key, key, content_type=content_type)
+
+
+def _audio_key_to_replace(job: models.MediaJob, probed: dict | None) -> str | None:
+    """
+    動画から音声トラックを作るなら、置き換える今の audio_key（未設定なら空文字）を返す（作らないならNone）
+
+    音声が未設定か以前の動画から作ったもので、同時に音声ファイルもアップロードされておらず、
+    動画に音声トラックがある場合に作る。
+    """
+    from . import audio_tracks
+
+    if probed is not None and not probed.get("audio_codec"):
+        return None
+    model = TARGET_MODELS[job.target_type]
+    current = model.objects.filter(pk=job.target_id).values_list("audio_key", flat=True).first()
+    if current is None or not audio_tracks.needs_track(current, job.key):
+        return None
+    uploading_audio = models.MediaJob.objects.filter(
+        target_type=job.target_type, target_id=job.target_id, kind="audio", status__in=["pending", "processing"]
+    ).exists()
+    return None if uploading_audio else current
+
+
+def _build_image_variants(job: models.MediaJob, key: str, data: bytes, timings: dict[str, float]) -> dict:
+    """シーン画像のバリアントを作成する（失敗しても元画像で表示できるので空を返す）"""
+    from . import images
+
+    started = time.perf_counter()
+    try:
+        value = images.build_variants(key, data)
+    except Exception as e:
+        job.last_error = f"Image variants skipped: {type(e).__name__}: {e}"[:2000]
+        logger.warning(f"Image variant build failed for media job {job.pk}: {e}")
+        return {}
+    timings["image_variants"] = time.perf_counter() - started
+    return value
+
+
+def retry(queryset) -> int:
+    """失敗・待機中のジョブを今すぐ再実行する（管理画面のアクション用）"""
+    job_ids = list(
+        queryset.exclude(status__in=["done", "processing"]).values_list("id", flat=True)
+    )
+    models.MediaJob.objects.filter(id__in=job_ids).update(
+        status="pending", next_attempt_at=timezone.now(), locked_until=None, attempts=0
+    )
+    transaction.on_commit(lambda: dispatch(job_ids))
+    return len(job_ids)
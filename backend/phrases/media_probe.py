@@ -0,0 +1,69 @@
+"""
+メディアのメタデータ（media_info）の取得と反映
+
+media_info フィールドの形式（メディアの種類ごと）:
+    {
+        "video": {"source": "videos/xxx.mp4", "duration": 12.5, "bytes": 123456,
+                  "width": 1280, "height": 720, "bit_rate": 800000, ...},
+        "audio": {...},
+    }
+
+source が今のキーと一致しているものは取得済みとして扱う（キーが変わったら取り直す）。
+"""
+from __future__ import annotations
+
+from . import media, services
+
+# モデルごとのメディアの種類 → キーのフィールド
+MEDIA_FIELDS = {
+    "phrase": {
+        "video": "video_key",
+        "audio": "audio_key",
+        "scene_image": "scene_image_key",
+    },
+    "expression": {
+        "video": "video_key",
+        "audio": "audio_key",
+        "image": "image_key",
+        "scene_image": "scene_image_key",
+    },
+}
+
+
+def probe_key(key: str) -> dict:
+    """保存済みのメディアをffprobeで調べ、media_info の1項目を返す"""
+    return {"source": key, **media.probe(services.get_media_source(key))}
+
+
+def pending_kinds(obj, force: bool = False) -> list[tuple[str, str]]:
+    """まだ取得していない (種類, キー) の一覧"""
+    media_info = obj.media_info or {}
+    pending = []
+    for kind, field in MEDIA_FIELDS[obj._meta.model_name].items():
+        key = getattr(obj, field)
+        if key and (force or media_info.get(kind, {}).get("source") != key):
+            pending.append((kind, key))
+    return pending
+
+
+def apply(obj, kind: str, entry: dict, overwrite_duration: bool = False) -> list[str]:
+    """
+    取得結果を obj に反映し、変更したフィールド名を返す
+
+    Phrase の duration_sec は未設定（0）のときだけ動画（無ければ音声）の長さで埋める。
+    """
+    media_info = dict(obj.media_info or {})
+    media_info[kind] = entry
+    # キーが空になったメディアの古い情報は消す
+    for other_kind, field in MEDIA_FIELDS[obj._meta.model_name].items():
+        if not getattr(obj, field):
+            media_info.pop(other_kind, None)
+    obj.media_info = media_info
+    changed = ["media_info"]
+
+    if hasattr(obj, "duration_sec") and entry.get("duration"):
+        if kind == "video" or (kind == "audio" and not obj.video_key):
+            if overwrite_duration or not obj.duration_sec:
+                obj.duration_sec = max(1, round(entry["duration"]))
+                changed.append("duration_sec")
+    return changed
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phrases', '0011_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('target_type', models.CharField(choices=[('phrase', 'Phrase'), ('expression', 'Expression')], max_length=16)),
+                ('target_id', models.PositiveBigIntegerField()),
+                ('kind', models.CharField(choices=[('video', 'Video'), ('audio', 'Audio'), ('image', 'Image'), ('scene_image', 'Scene image')], max_length=16)),
+                ('key', models.CharField(max_length=255)),
+                ('staged_path', models.CharField(max_length=500)),
+                ('options', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('timings', models.JSONField(blank=True, default=dict)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['-id'],
+                'indexes': [
+                    models.Index(fields=['status', 'next_attempt_at'], name='phrases_med_status_6146db_idx'),
+                    models.Index(fields=['target_type', 'target_id'], name='phrases_med_target__ce1b35_idx'),
+                ],
+            },
+        ),
+    ]
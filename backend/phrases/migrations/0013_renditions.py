@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phrases', '0012_mediajob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expression',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='phrase',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
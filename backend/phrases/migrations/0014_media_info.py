@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phrases', '0013_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expression',
+            name='media_info',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='phrase',
+            name='media_info',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
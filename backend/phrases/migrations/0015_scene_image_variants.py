@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phrases', '0014_media_info'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expression',
+            name='scene_image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='phrase',
+            name='scene_image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
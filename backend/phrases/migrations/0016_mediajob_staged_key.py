@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phrases', '0015_scene_image_variants'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='mediajob',
+            old_name='staged_path',
+            new_name='staged_key',
+        ),
+    ]
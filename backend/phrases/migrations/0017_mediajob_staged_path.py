@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phrases', '0016_mediajob_staged_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediajob',
+            name='staged_path',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AlterField(
+            model_name='mediajob',
+            name='staged_key',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+    ]
@@ -31,6 +31,9 @@ class Expression(TimeStampedModel):
     audio_key = models.CharField(max_length=255, blank=True)
     video_key = models.CharField(max_length=255, blank=True)
     scene_image_key = models.CharField(max_length=255, blank=True)
+    renditions = models.JSONField(default=dict, blank=True)
+    scene_image_variants = models.JSONField(default=dict, blank=True)
+    media_info = models.JSONField(default=dict, blank=True)
     parent = models.ForeignKey(
         "self",
         null=True,
@@ -70,6 +73,9 @@ class Phrase(TimeStampedModel):
     audio_key = models.CharField(max_length=255, blank=True)
     video_key = models.CharField(max_length=255, blank=True)
     scene_image_key = models.CharField(max_length=255, blank=True)
+    renditions = models.JSONField(default=dict, blank=True)
+    scene_image_variants = models.JSONField(default=dict, blank=True)
+    media_info = models.JSONField(default=dict, blank=True)
     duration_sec = models.PositiveIntegerField(default=0)
     difficulty = models.CharField(max_length=16, choices=DIFFICULTY_CHOICES, default="normal")
     expressions = models.ManyToManyField(Expression, through="PhraseExpression", related_name="phrases")
@@ -227,4 +233,93 @@ class SocialAccount(TimeStampedModel):
         ]
 
     def __str__(self) -> str:
-        return f"SocialAccount<{self.provider}:{self.user.email}>"
\ No newline at end of file
+        return f"SocialAccount<{self.provider}:{self.user.email}>"
+
+
+class EmailOutbox(TimeStampedModel):
+    """送信待ちメール（リクエスト内では行を追加するだけで、送信はワーカーが行う）"""
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    PROVIDER_CHOICES = [
+        ("sendgrid", "SendGrid"),
+        ("smtp", "SMTP"),
+    ]
+
+    to_email = models.EmailField()
+    from_email = models.CharField(max_length=255, blank=True)
+    subject = models.CharField(max_length=255)
+    plain_content = models.TextField()
+    html_content = models.TextField(blank=True)
+    provider = models.CharField(max_length=16, choices=PROVIDER_CHOICES, default="sendgrid")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name_plural = "email outbox"
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"EmailOutbox<{self.to_email}:{self.status}>"
+
+
+class MediaJob(TimeStampedModel):
+    """管理画面からアップロードされたメディアのバックグラウンド処理ジョブ"""
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("processing", "Processing"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+
+    TARGET_CHOICES = [
+        ("phrase", "Phrase"),
+        ("expression", "Expression"),
+    ]
+
+    KIND_CHOICES = [
+        ("video", "Video"),
+        ("audio", "Audio"),
+        ("image", "Image"),
+        ("scene_image", "Scene image"),
+    ]
+
+    target_type = models.CharField(max_length=16, choices=TARGET_CHOICES)
+    target_id = models.PositiveBigIntegerField()
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    key = models.CharField(max_length=255)
+    # webプロセスのホストにステージングしたファイル（共有ストレージに移したら空）
+    staged_path = models.CharField(max_length=500, blank=True)
+    # 共有ストレージ（R2）にステージングしたファイルのキー
+    staged_key = models.CharField(max_length=500, blank=True)
+    options = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    timings = models.JSONField(default=dict, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["-id"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+            models.Index(fields=["target_type", "target_id"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"MediaJob<{self.target_type}:{self.target_id}:{self.kind}:{self.status}>"
@@ -0,0 +1,191 @@
+"""
+スライディングウィンドウ方式のレートリミッター
+
+REDIS_URL が設定されていれば Redis 上で Lua スクリプトにより原子的に判定するため、
+gunicorn の全ワーカー・全インスタンスで同じカウンタを共有できる。
+未設定の場合（ローカル開発・テスト）はプロセス内のメモリで判定する。
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from . import services
+
+logger = logging.getLogger(__name__)
+
+_PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# ZSETに時刻を記録するスライディングウィンドウ（ログ方式）
+# KEYS[1]: カウンタのキー / ARGV: 現在時刻(ms), ウィンドウ(ms), 上限, メンバーID
+_SLIDING_WINDOW_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', key, 0, now - window)
+local count = redis.call('ZCARD', key)
+if count < limit then
+    redis.call('ZADD', key, now, ARGV[4])
+    redis.call('PEXPIRE', key, window)
+    return {1, limit - count - 1, 0}
+end
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+local retry_after = window
+if oldest[2] then
+    retry_after = tonumber(oldest[2]) + window - now
+end
+return {0, 0, retry_after}
+"""
+
+
+@dataclass(slots=True)
+class RateLimitResult:
+    allowed: bool
+    remaining: int
+    retry_after: float
+
+
+def parse_rate(rate: str) -> tuple[int, int]:
+    """"5/hour" や "10/min" を (回数, 秒) に変換（DRFと同じ書式）"""
+    num, period = rate.split("/")
+    return int(num), _PERIODS[period.strip()[0]]
+
+
+class LocalBackend:
+    """プロセス内メモリのスライディングウィンドウ（Redisが無い環境用）"""
+
+    def __init__(self) -> None:
+        self._hits: dict[str, tuple[int, deque[float]]] = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def hit(self, key: str, limit: int, window: int) -> RateLimitResult:
+        now = time.monotonic()
+        with self._lock:
+            self._calls += 1
+            if self._calls % 1000 == 0:
+                self._sweep(now)
+
+            _, hits = self._hits.setdefault(key, (window, deque()))
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if len(hits) < limit:
+                hits.append(now)
+                return RateLimitResult(True, limit - len(hits), 0.0)
+            return RateLimitResult(False, 0, hits[0] + window - now)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._hits.clear()
+
+    def _sweep(self, now: float) -> None:
+        expired = [
+            key for key, (window, hits) in self._hits.items()
+            if not hits or hits[-1] <= now - window
+        ]
+        for key in expired:
+            del self._hits[key]
+
+
+class RedisBackend:
+    """Redis上のスライディングウィンドウ（全ワーカーで共有・原子的）"""
+
+    def __init__(self, client) -> None:
+        self._client = client
+        self._script = client.register_script(_SLIDING_WINDOW_LUA)
+
+    def hit(self, key: str, limit: int, window: int) -> RateLimitResult:
+        now_ms = int(time.time() * 1000)
+        allowed, remaining, retry_after_ms = self._script(
+            keys=[key],
+            args=[now_ms, window * 1000, limit, f"{now_ms}-{uuid.uuid4().hex[:8]}"],
+        )
+        return RateLimitResult(bool(allowed), int(remaining), int(retry_after_ms) / 1000)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                client = services.get_redis_client()
+                _backend = RedisBackend(client) if client is not None else LocalBackend()
+    return _backend
+
+
+class RateLimiter:
+    def __init__(self, scope: str, rate: str) -> None:
+        self.scope = scope
+        self.limit, self.window = parse_rate(rate)
+
+    def hit(self, ident: str) -> RateLimitResult:
+        key = f"ratelimit:{self.scope}:{ident}"
+        try:
+            return get_backend().hit(key, self.limit, self.window)
+        except Exception as e:
+            # リミッターの障害でログイン等を止めない（fail open）
+            logger.warning(f"Rate limiter unavailable for {self.scope}: {e}")
+            return RateLimitResult(True, self.limit, 0.0)
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    DRFのスロットル。scopeごとのレートは settings.RATE_LIMITS で設定する。
+    ログイン済みならユーザーID、未ログインならIPアドレス単位で数える
+    （IPアドレスは REST_FRAMEWORK["NUM_PROXIES"] に従い、信頼できるプロキシが付けた値を使う）。
+    """
+
+    scope: str = ""
+
+    def __init__(self) -> None:
+        self.result: RateLimitResult | None = None
+
+    def get_cache_ident(self, request) -> str:
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            return f"user:{user.pk}"
+        return f"ip:{self.get_ident(request)}"
+
+    def allow_request(self, request, view) -> bool:
+        rate = settings.RATE_LIMITS.get(self.scope)
+        if not rate:
+            return True
+        self.result = RateLimiter(self.scope, rate).hit(self.get_cache_ident(request))
+        return self.result.allowed
+
+    def wait(self):
+        if self.result is None:
+            return None
+        return self.result.retry_after
+
+
+class LoginRateThrottle(SlidingWindowThrottle):
+    scope = "login"
+
+
+class SignUpRateThrottle(SlidingWindowThrottle):
+    scope = "signup"
+
+
+class PasswordResetRateThrottle(SlidingWindowThrottle):
+    scope = "password_reset"
+
+
+class PlaybackLogRateThrottle(SlidingWindowThrottle):
+    scope = "playback_log"
+
+
+class ContactRateThrottle(SlidingWindowThrottle):
+    scope = "contact"
@@ -0,0 +1,108 @@
+"""
+動画のレンディション（ビットレート別MP4）の作成と選択
+
+renditions フィールドの形式:
+    {
+        "source": "videos/xxx.mp4",   # 作成元の video_key（変わったら無効）
+        "variants": {
+            "low": {"key": "renditions/videos/xxx/low.mp4", "bytes": 123456},
+            ...
+        },
+    }
+
+クライアントは ?network=<種別> または X-Network-Type ヘッダーでネットワーク種別を申告する
+（値は PlaybackLog.network_type と同じ: wifi / cellular / 4g など）。
+Save-Data: on の場合は低画質を返す。
+"""
+from __future__ import annotations
+
+import logging
+import os
+import posixpath
+import tempfile
+import time
+from concurrent.futures import as_completed, wait
+
+from django.conf import settings
+from django.core.files import File
+
+from . import media, services
+
+logger = logging.getLogger(__name__)
+
+
+def network_class(request) -> str | None:
+    """リクエストからクライアントが申告したネットワーク種別を取得"""
+    if request is None:
+        return None
+    value = request.query_params.get("network") if hasattr(request, "query_params") else None
+    value = value or request.headers.get("X-Network-Type")
+    if not value and request.headers.get("Save-Data", "").lower() == "on":
+        value = "cellular"
+    return value.strip().lower() if value else None
+
+
+def is_current(obj) -> bool:
+    """renditions が今の video_key から作られたものか"""
+    return bool(obj.video_key) and (obj.renditions or {}).get("source") == obj.video_key
+
+
+def select_video_key(obj, request=None) -> str:
+    """ネットワーク種別に合ったレンディションのキーを返す（無ければ元動画）"""
+    name = settings.NETWORK_RENDITIONS.get(network_class(request) or "")
+    if not name or not is_current(obj):
+        return obj.video_key
+    variant = obj.renditions.get("variants", {}).get(name)
+    return variant["key"] if variant else obj.video_key
+
+
+def key_prefix(video_key: str) -> str:
+    stem, _ = posixpath.splitext(video_key.lstrip("/"))
+    return f"renditions/{stem}"
+
+
+def build_renditions(source, video_key: str, source_bytes: int | None = None) -> dict:
+    """
+    全プロファイルのレンディションを作成してR2にアップロードし、renditions の値を返す
+
+    変換はffmpegプールで並列に行い、終わったものから順にアップロードする。
+    元動画より小さくならなかったレンディションは作らない（元動画を返した方が軽い）。
+
+    Args:
+        source: 元動画のパス・URL（services.get_media_source() の戻り値など）
+        video_key: 元動画のキー（出力キーと source の記録に使う）
+        source_bytes: 元動画のサイズ（分かれば）
+    """
+    prefix = key_prefix(video_key)
+    variants: dict[str, dict] = {}
+    started = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(prefix="renditions-") as tmp_dir:
+        futures = {
+            media.submit_transcode(source, os.path.join(tmp_dir, f"{name}.mp4"), **profile): name
+            for name, profile in settings.VIDEO_RENDITIONS.items()
+        }
+        try:
+            for future in as_completed(futures):
+                name = futures[future]
+                future.result()
+                output_path = os.path.join(tmp_dir, f"{name}.mp4")
+                size = os.path.getsize(output_path)
+                if source_bytes and size >= source_bytes:
+                    continue
+                key = f"{prefix}/{name}.mp4"
+                with open(output_path, "rb") as f:
+                    services.upload_to_r2(File(f, name=f"{name}.mp4"), key)
+                variants[name] = {"key": key, "bytes": size}
+        except BaseException:
+            # 一時ディレクトリを消す前に残りの変換を止める
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            raise
+
+    logger.info(
+        f"Built {len(variants)} renditions for {video_key} in {time.perf_counter() - started:.1f}s: "
+        + ", ".join(f"{name}={variant['bytes'] // 1024}KB" for name, variant in variants.items())
+    )
+    return {"source": video_key, "variants": variants}
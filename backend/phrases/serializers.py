@@ -1,3 +1,5 @@
+import logging
+
 from django.conf import settings
 from django.contrib.auth import authenticate, get_user_model
 from django.db import transaction
@@ -5,18 +7,19 @@ from django.utils import timezone
 from rest_framework import serializers
 
 from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
 import jwt
 import requests
 
-from . import models, services
+from . import auth_keys, images, models, renditions, services
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 
 class ExpressionSerializer(serializers.ModelSerializer):
     video_url = serializers.SerializerMethodField()
     scene_image_url = serializers.SerializerMethodField()
+    scene_image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = models.Expression
@@ -30,6 +33,7 @@ class ExpressionSerializer(serializers.ModelSerializer):
             "audio_key",
             "video_url",
             "scene_image_url",
+            "scene_image_srcset",
             "order",
         ]
 
@@ -37,12 +41,17 @@ class ExpressionSerializer(serializers.ModelSerializer):
         if not obj.video_key:
             return None
         use_signed_url = True
-        return services.build_media_url(obj.video_key, sign=use_signed_url)
+        video_key = renditions.select_video_key(obj, self.context.get("request"))
+        return services.build_media_url(video_key, sign=use_signed_url)
 
     def get_scene_image_url(self, obj: models.Expression) -> str | None:
         if not obj.scene_image_key:
             return None
-        return services.build_media_url(obj.scene_image_key, sign=False)
+        scene_image_key = images.select_scene_image_key(obj, self.context.get("request"))
+        return services.build_media_url(scene_image_key, sign=False)
+
+    def get_scene_image_srcset(self, obj: models.Expression) -> dict[str, str] | None:
+        return images.build_srcset(obj)
 
 
 class PhraseExpressionSerializer(serializers.ModelSerializer):
@@ -58,6 +67,7 @@ class PhraseSerializer(serializers.ModelSerializer):
     video_url = serializers.SerializerMethodField()
     audio_url = serializers.SerializerMethodField()
     scene_image_url = serializers.SerializerMethodField()
+    scene_image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = models.Phrase
@@ -72,6 +82,7 @@ class PhraseSerializer(serializers.ModelSerializer):
             "video_url",
             "audio_url",
             "scene_image_url",
+            "scene_image_srcset",
             "expressions",
         ]
 
@@ -81,7 +92,9 @@ class PhraseSerializer(serializers.ModelSerializer):
         # 有料コンテンツは署名URL（セキュリティ）、無料は公開URL（CDNキャッシュ効率）
         # 将来的にobj.is_publicフラグで切り替え可能
         use_signed_url = True  # デフォルト: 署名URL（有料コンテンツ）
-        return services.build_media_url(obj.video_key, sign=use_signed_url)
+        # クライアントが申告したネットワーク種別に合ったレンディションを返す
+        video_key = renditions.select_video_key(obj, self.context.get("request"))
+        return services.build_media_url(video_key, sign=use_signed_url)
 
     def get_audio_url(self, obj: models.Phrase) -> str | None:
         if not obj.audio_key:
@@ -93,7 +106,11 @@ class PhraseSerializer(serializers.ModelSerializer):
         if not obj.scene_image_key:
             return None
         # 画像は通常公開URLでOK（署名不要）
-        return services.build_media_url(obj.scene_image_key, sign=False)
+        scene_image_key = images.select_scene_image_key(obj, self.context.get("request"))
+        return services.build_media_url(scene_image_key, sign=False)
+
+    def get_scene_image_srcset(self, obj: models.Phrase) -> dict[str, str] | None:
+        return images.build_srcset(obj)
 
 
 class PhraseFeedSerializer(serializers.ModelSerializer):
@@ -101,6 +118,8 @@ class PhraseFeedSerializer(serializers.ModelSerializer):
     video_url = serializers.SerializerMethodField()
     audio_url = serializers.SerializerMethodField()
     scene_image_url = serializers.SerializerMethodField()
+    scene_image_srcset = serializers.SerializerMethodField()
+    scene_image_placeholder = serializers.SerializerMethodField()
     is_mastered = serializers.SerializerMethodField()
     is_favorite = serializers.SerializerMethodField()
 
@@ -116,6 +135,8 @@ class PhraseFeedSerializer(serializers.ModelSerializer):
             "video_url",
             "audio_url",
             "scene_image_url",
+            "scene_image_srcset",
+            "scene_image_placeholder",
             "is_mastered",
             "is_favorite",
             "expressions",
@@ -125,7 +146,8 @@ class PhraseFeedSerializer(serializers.ModelSerializer):
         if not obj.video_key:
             return None
         use_signed_url = True  # デフォルト: 署名URL
-        return services.build_media_url(obj.video_key, sign=use_signed_url)
+        video_key = renditions.select_video_key(obj, self.context.get("request"))
+        return services.build_media_url(video_key, sign=use_signed_url)
 
     def get_audio_url(self, obj: models.Phrase) -> str | None:
         if not obj.audio_key:
@@ -137,7 +159,15 @@ class PhraseFeedSerializer(serializers.ModelSerializer):
         if not obj.scene_image_key:
             return None
         # 画像は公開URL（署名不要）
-        return services.build_media_url(obj.scene_image_key, sign=False)
+        scene_image_key = images.select_scene_image_key(obj, self.context.get("request"))
+        return services.build_media_url(scene_image_key, sign=False)
+
+    def get_scene_image_srcset(self, obj: models.Phrase) -> dict[str, str] | None:
+        return images.build_srcset(obj)
+
+    def get_scene_image_placeholder(self, obj: models.Phrase) -> str | None:
+        # 約200バイトの縮小画像（data URI）。画像の読み込み中にぼかして表示する
+        return images.get_placeholder(obj)
 
     def get_is_mastered(self, obj: models.Phrase) -> bool:
         # ViewでアノテーションされたフラグをN+1クエリなしで使用
@@ -262,7 +292,7 @@ class PhraseMediaSignedUrlSerializer(serializers.Serializer):
 
         # サーバ側でDBからkeyを取得（クライアントからは受け取らない）
         if media_type == "video":
-            key = phrase.video_key
+            key = renditions.select_video_key(phrase, self.context.get("request"))
         else:
             key = phrase.audio_key
 
@@ -295,7 +325,7 @@ class ExpressionMediaSignedUrlSerializer(serializers.Serializer):
 
         # サーバ側でDBからkeyを取得（クライアントからは受け取らない）
         if media_type == "video":
-            key = expression.video_key
+            key = renditions.select_video_key(expression, self.context.get("request"))
         elif media_type == "audio":
             key = expression.audio_key
         else:
@@ -389,20 +419,8 @@ class GoogleLoginSerializer(serializers.Serializer):
     def validate(self, attrs):
         token = attrs.get("id_token")
 
-        # Google Client IDを環境変数から取得
-        client_ids = []
-        if hasattr(settings, 'GOOGLE_CLIENT_ID_IOS') and settings.GOOGLE_CLIENT_ID_IOS:
-            client_ids.append(settings.GOOGLE_CLIENT_ID_IOS)
-        if hasattr(settings, 'GOOGLE_CLIENT_ID_WEB') and settings.GOOGLE_CLIENT_ID_WEB:
-            client_ids.append(settings.GOOGLE_CLIENT_ID_WEB)
-        if hasattr(settings, 'GOOGLE_CLIENT_ID_ANDROID') and settings.GOOGLE_CLIENT_ID_ANDROID:
-            client_ids.append(settings.GOOGLE_CLIENT_ID_ANDROID)
-
-        # デバッグログ（本番確認後に削除）
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.info(f"Google OAuth - client_ids count: {len(client_ids)}")
-        logger.info(f"Google OAuth - IOS configured: {bool(getattr(settings, 'GOOGLE_CLIENT_ID_IOS', ''))}")
+        # Google Client IDは起動時にsettingsで確定済み
+        client_ids = settings.GOOGLE_CLIENT_IDS
 
         if not client_ids:
             raise serializers.ValidationError("Google authentication is not configured.")
@@ -411,7 +429,7 @@ class GoogleLoginSerializer(serializers.Serializer):
             # ID Tokenを検証
             idinfo = id_token.verify_oauth2_token(
                 token,
-                google_requests.Request(),
+                auth_keys.google_request,
                 audience=client_ids[0] if len(client_ids) == 1 else None
             )
 
@@ -484,18 +502,8 @@ class AppleLoginSerializer(serializers.Serializer):
     id_token = serializers.CharField(write_only=True)
 
     def _get_apple_public_key(self, kid):
-        import logging
-        logger = logging.getLogger(__name__)
-        """AppleのJWKSから公開鍵を取得"""
-        response = requests.get("https://appleid.apple.com/auth/keys")
-        response.raise_for_status()
-        keys = response.json().get("keys", [])
-
-        for key in keys:
-            if key.get("kid") == kid:
-                return jwt.algorithms.RSAAlgorithm.from_jwk(key)
-
-        raise ValueError("Apple public key not found")
+        """AppleのJWKSから公開鍵を取得（プロセス内でキャッシュ）"""
+        return auth_keys.apple_jwks.get_key(kid)
 
     def validate(self, attrs):
         token = attrs.get("id_token")
@@ -546,6 +554,9 @@ class AppleLoginSerializer(serializers.Serializer):
         except requests.RequestException as e:
             logger.error(f"Apple OAuth: request failed - {str(e)}")
             raise serializers.ValidationError(f"Failed to verify Apple ID token: {str(e)}")
+        except ValueError as e:
+            logger.error(f"Apple OAuth: {str(e)}")
+            raise serializers.ValidationError(f"Invalid Apple ID token: {str(e)}")
 
         return attrs
 
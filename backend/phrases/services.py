@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 import base64
+import functools
 import hashlib
 import hmac
 import logging
+import threading
 import time
 from dataclasses import dataclass
 from typing import Any
@@ -12,6 +14,99 @@ from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+
+@functools.lru_cache(maxsize=1)
+def get_sendgrid_client():
+    """プロセス内で使い回すSendGridクライアント"""
+    from sendgrid import SendGridAPIClient
+
+    client = SendGridAPIClient(settings.SENDGRID_API_KEY)
+    client.client.timeout = settings.EMAIL_TIMEOUT
+    return client
+
+
+@functools.lru_cache(maxsize=1)
+def get_redis_client():
+    """REDIS_URLが設定されていれば共有のRedisクライアントを返す（未設定ならNone）"""
+    if not settings.REDIS_URL:
+        return None
+    import redis
+
+    return redis.Redis.from_url(
+        settings.REDIS_URL,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        health_check_interval=30,
+    )
+
+
+def get_email_provider() -> str:
+    return "sendgrid" if getattr(settings, 'SENDGRID_API_KEY', '') else "smtp"
+
+
+def enqueue_email(
+    to_email: str,
+    subject: str,
+    plain_content: str,
+    html_content: str | None = None,
+    from_email: str | None = None,
+):
+    """
+    メールを送信キュー（EmailOutbox）に追加する
+
+    呼び出し元のトランザクション内で行を追加するだけなので、
+    メールプロバイダの応答速度がリクエストに影響しない。
+    実際の送信は `python manage.py send_outbox_emails` が行う。
+    """
+    from .models import EmailOutbox
+
+    return EmailOutbox.objects.create(
+        to_email=to_email,
+        subject=subject,
+        plain_content=plain_content,
+        html_content=html_content or "",
+        from_email=from_email or "",
+        provider=get_email_provider(),
+    )
+
+
+def send_email_via_smtp(
+    to_email: str,
+    subject: str,
+    plain_content: str,
+    html_content: str | None = None,
+    from_email: str | None = None,
+) -> bool:
+    """Djangoのメールバックエンド（EMAIL_BACKEND）で送信"""
+    from django.core.mail import send_mail
+
+    send_mail(
+        subject,
+        plain_content,
+        from_email or settings.DEFAULT_FROM_EMAIL,
+        [to_email],
+        html_message=html_content,
+        fail_silently=False,
+    )
+    return True
+
+
+def send_email_via_provider(provider: str, **kwargs) -> bool:
+    """
+    EmailOutbox に記録したプロバイダで送信する
+
+    キューに入れたwebプロセスとワーカーで設定が違っても、記録したプロバイダ以外では送らない
+    （SendGridの行でAPIキーが無ければSMTPに切り替えず失敗にし、再送に回す）。
+    """
+    if provider == "sendgrid":
+        if not getattr(settings, 'SENDGRID_API_KEY', ''):
+            raise RuntimeError("SENDGRID_API_KEY is not set for an email queued for SendGrid")
+        return send_email_via_sendgrid(**kwargs)
+    if provider == "smtp":
+        return send_email_via_smtp(**kwargs)
+    raise ValueError(f"Unknown email provider: {provider}")
+
+
 def send_email_via_sendgrid(
     to_email: str,
     subject: str,
@@ -22,22 +117,12 @@ def send_email_via_sendgrid(
     """
     SendGrid Web APIを使ってメールを送信（SMTPより信頼性が高い）
     """
-    from sendgrid import SendGridAPIClient
     from sendgrid.helpers.mail import Mail, Content
 
     api_key = getattr(settings, 'SENDGRID_API_KEY', '')
     logger.info(f"SendGrid API key exists: {bool(api_key)}, sending to: {to_email}")
     if not api_key:
-        from django.core.mail import send_mail
-        send_mail(
-            subject,
-            plain_content,
-            from_email or settings.DEFAULT_FROM_EMAIL,
-            [to_email],
-            html_message=html_content,
-            fail_silently=False,
-        )
-        return True
+        return send_email_via_smtp(to_email, subject, plain_content, html_content, from_email)
 
     try:
         message = Mail(
@@ -50,8 +135,7 @@ def send_email_via_sendgrid(
             message.add_content(Content("text/html", html_content))
 
         logger.info(f"Sending email via SendGrid Web API to {to_email}")
-        sg = SendGridAPIClient(api_key)
-        response = sg.send(message)
+        response = get_sendgrid_client().send(message)
 
         if response.status_code >= 200 and response.status_code < 300:
             logger.info(f"Email sent successfully to {to_email}")
@@ -118,7 +202,7 @@ def get_user_settings(user) -> Any:
 
 def send_verification_email(user, token: str) -> None:
     """
-    メール確認用のメールを送信
+    メール確認用のメールを送信キューに追加
 
     Args:
         user: Userオブジェクト
@@ -182,7 +266,7 @@ https://www.ai-works.site/
 </html>
 """
 
-    send_email_via_sendgrid(
+    enqueue_email(
         to_email=user.email,
         subject=subject,
         plain_content=message,
@@ -192,7 +276,7 @@ https://www.ai-works.site/
 
 def send_password_reset_email(user, token: str) -> None:
     """
-    パスワードリセット用のメールを送信
+    パスワードリセット用のメールを送信キューに追加
 
     Args:
         user: Userオブジェクト
@@ -259,7 +343,7 @@ https://www.ai-works.site/
 </html>
 """
 
-    send_email_via_sendgrid(
+    enqueue_email(
         to_email=user.email,
         subject=subject,
         plain_content=message,
@@ -269,7 +353,7 @@ https://www.ai-works.site/
 
 def send_contact_email(user, subject_type: str, message_text: str) -> None:
     """
-    管理者に問い合わせメールを送信
+    管理者への問い合わせメールを送信キューに追加
 
     Args:
         user: 送信者のUserオブジェクト
@@ -344,7 +428,7 @@ def send_contact_email(user, subject_type: str, message_text: str) -> None:
     # Get admin email from settings
     admin_email = getattr(settings, 'ADMIN_EMAIL', settings.DEFAULT_FROM_EMAIL)
 
-    send_email_via_sendgrid(
+    enqueue_email(
         to_email=admin_email,
         subject=email_subject,
         plain_content=plain_message,
@@ -369,7 +453,76 @@ def _get_content_type(file_obj, key: str) -> str:
     return 'application/octet-stream'
 
 
-def upload_to_r2(file_obj, key: str, cache_control: str | None = None) -> str:
+_r2_client = None
+_r2_client_lock = threading.Lock()
+
+
+def get_r2_endpoint() -> str:
+    return settings.R2_SIGNING_ENDPOINT or f'https://{settings.R2_BUCKET_NAME}.r2.cloudflarestorage.com'
+
+
+def get_r2_client():
+    """
+    プロセス内で共有するR2（S3互換）クライアントを返す
+
+    boto3のclientは生成に数百msかかるため一度だけ作成し、
+    コネクションプールごと使い回す（clientはスレッドセーフ）。
+    """
+    global _r2_client
+    if _r2_client is None:
+        with _r2_client_lock:
+            if _r2_client is None:
+                _r2_client = build_r2_client()
+    return _r2_client
+
+
+def build_r2_client(
+    endpoint_url: str | None = None,
+    access_key: str | None = None,
+    secret_key: str | None = None,
+):
+    """コネクションプール・タイムアウト・リトライを調整したS3クライアントを作成"""
+    import boto3
+    from botocore.config import Config
+
+    config = Config(
+        max_pool_connections=settings.R2_MAX_POOL_CONNECTIONS,
+        connect_timeout=5,
+        read_timeout=60,
+        retries={'max_attempts': 3, 'mode': 'standard'},
+        tcp_keepalive=True,
+    )
+    # boto3のデフォルトセッションはスレッドセーフではないため専用のセッションから作る
+    return boto3.session.Session().client(
+        's3',
+        endpoint_url=endpoint_url or get_r2_endpoint(),
+        aws_access_key_id=access_key or settings.R2_ACCESS_KEY,
+        aws_secret_access_key=secret_key or settings.R2_SECRET_KEY,
+        region_name='auto',
+        config=config,
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def get_r2_transfer_config():
+    """大きな動画をマルチパートで並列アップロードするための設定"""
+    from boto3.s3.transfer import TransferConfig
+
+    mb = 1024 * 1024
+    return TransferConfig(
+        multipart_threshold=settings.R2_MULTIPART_THRESHOLD_MB * mb,
+        multipart_chunksize=settings.R2_MULTIPART_CHUNKSIZE_MB * mb,
+        max_concurrency=settings.R2_UPLOAD_CONCURRENCY,
+        use_threads=True,
+    )
+
+
+def upload_to_r2(
+    file_obj,
+    key: str,
+    cache_control: str | None = None,
+    content_addressed: bool = False,
+) -> str:
     """
     Upload a file to Cloudflare R2 and return the key.
 
@@ -377,10 +530,15 @@ def upload_to_r2(file_obj, key: str, cache_control: str | None = None) -> str:
         file_obj: ファイルオブジェクト
         key: R2のオブジェクトキー（パス）
         cache_control: Cache-Controlヘッダー（Noneの場合はデフォルト）
+        content_addressed: Trueなら key のファイル名部分を内容のハッシュに置き換えたキーに保存する
+            （例: "videos/upload.mp4" → "videos/<sha256>.mp4"）。
+            同じキーのオブジェクトが既にあればアップロードしない。戻り値が実際のキーになる
     """
-    import boto3
     from django.conf import settings
 
+    if content_addressed:
+        return _upload_content_addressed(file_obj, key, cache_control)
+
     # R2の設定が不完全な場合はローカルに保存
     if not all([settings.R2_ACCESS_KEY, settings.R2_SECRET_KEY, settings.R2_BUCKET_NAME]):
         # ローカル保存にフォールバック
@@ -388,16 +546,26 @@ def upload_to_r2(file_obj, key: str, cache_control: str | None = None) -> str:
         media_path = os.path.join(settings.MEDIA_ROOT, key)
         os.makedirs(os.path.dirname(media_path), exist_ok=True)
         with open(media_path, 'wb+') as destination:
-            for chunk in file_obj.chunks():
+            for chunk in _iter_chunks(file_obj):
                 destination.write(chunk)
         return key
 
-    # Content-Typeを判定
-    content_type = _get_content_type(file_obj, key)
+    # R2にアップロード（大きなファイルはマルチパートで並列アップロード）
+    get_r2_client().upload_fileobj(
+        file_obj,
+        settings.R2_BUCKET_NAME,
+        key,
+        ExtraArgs=_upload_extra_args(file_obj, key, cache_control),
+        Config=get_r2_transfer_config(),
+    )
+
+    return key
+
 
-    # ExtraArgsを構築
+def _upload_extra_args(file_obj, key: str, cache_control: str | None) -> dict:
+    # Content-Typeを判定
     extra_args = {
-        'ContentType': content_type,
+        'ContentType': _get_content_type(file_obj, key),
     }
 
     # Cache-Controlを設定（デフォルトは1年キャッシュ）
@@ -406,99 +574,268 @@ def upload_to_r2(file_obj, key: str, cache_control: str | None = None) -> str:
 
     if cache_control:
         extra_args['CacheControl'] = cache_control
+    return extra_args
 
-    # R2にアップロード
-    s3_client = boto3.client(
-        's3',
-        endpoint_url=settings.R2_SIGNING_ENDPOINT or f'https://{settings.R2_BUCKET_NAME}.r2.cloudflarestorage.com',
-        aws_access_key_id=settings.R2_ACCESS_KEY,
-        aws_secret_access_key=settings.R2_SECRET_KEY,
-        region_name='auto',
-    )
 
-    s3_client.upload_fileobj(
-        file_obj,
+def _iter_chunks(file_obj, chunk_size: int = 1024 * 1024):
+    """Djangoのファイル（chunks()あり）と通常のファイルオブジェクトの両方から順に読み出す"""
+    if hasattr(file_obj, 'chunks'):
+        yield from file_obj.chunks()
+        return
+    while chunk := file_obj.read(chunk_size):
+        yield chunk
+
+
+class HashingReader:
+    """読み出したバイト列のSHA-256を計算しながら、元のストリームをそのまま読ませるラッパー"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.hash = hashlib.sha256()
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        self.hash.update(data)
+        self.bytes_read += len(data)
+        return data
+
+
+def content_key(key: str, digest: str) -> str:
+    """key のファイル名部分（拡張子以外）をハッシュに置き換える"""
+    import posixpath
+
+    directory, filename = posixpath.split(_normalize_key(key))
+    ext = posixpath.splitext(filename)[1].lower()
+    return posixpath.join(directory, f"{digest[:32]}{ext}")
+
+
+def media_exists(key: str) -> bool:
+    return get_media_size(key) is not None
+
+
+def _is_seekable(file_obj) -> bool:
+    try:
+        return bool(file_obj.seekable())
+    except (AttributeError, ValueError, OSError):
+        return hasattr(file_obj, 'seek') and hasattr(file_obj, 'tell')
+
+
+def _upload_content_addressed(file_obj, key: str, cache_control: str | None) -> str:
+    """
+    内容のハッシュをキーにしてアップロードする
+
+    シーク可能なファイル（管理画面のアップロード・ステージング済みのファイルなど）は先に読み通して
+    ハッシュを求め、HEADで既存なら転送しない。HTTPレスポンスのようなシークできないストリームは
+    読み出しながらハッシュを計算して一時キーにアップロードし、サーバー側コピーで本来のキーに移す
+    （既に同じ内容があれば一時キーを消すだけ）。
+    """
+    import os
+    import shutil
+    import tempfile
+    import uuid
+
+    local = not all([settings.R2_ACCESS_KEY, settings.R2_SECRET_KEY, settings.R2_BUCKET_NAME])
+
+    if _is_seekable(file_obj):
+        file_obj.seek(0)
+        digest = hashlib.sha256()
+        for chunk in _iter_chunks(file_obj):
+            digest.update(chunk)
+        file_obj.seek(0)
+        final_key = content_key(key, digest.hexdigest())
+        if media_exists(final_key):
+            logger.info(f"Skipped upload of {final_key}: identical content already stored")
+            return final_key
+        return upload_to_r2(file_obj, final_key, cache_control)
+
+    # 呼び出し側で既に HashingReader に包んでいれば（読み込んだバイト数を数えるためなど）そのまま使う
+    reader = file_obj if isinstance(file_obj, HashingReader) else HashingReader(file_obj)
+    if local:
+        # 同じディレクトリの一時ファイルに書いてから置き換える（書き込み途中のファイルを見せない）
+        directory = os.path.join(settings.MEDIA_ROOT, os.path.dirname(_normalize_key(key)))
+        os.makedirs(directory, exist_ok=True)
+        tmp = tempfile.NamedTemporaryFile(dir=directory, delete=False)
+        try:
+            with tmp:
+                shutil.copyfileobj(reader, tmp, 1024 * 1024)
+            final_key = content_key(key, reader.hash.hexdigest())
+            os.replace(tmp.name, os.path.join(settings.MEDIA_ROOT, final_key))
+        except BaseException:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+            raise
+        return final_key
+
+    client = get_r2_client()
+    temp_key = f"tmp/uploads/{uuid.uuid4()}"
+    client.upload_fileobj(
+        reader,
         settings.R2_BUCKET_NAME,
-        key,
-        ExtraArgs=extra_args
+        temp_key,
+        ExtraArgs=_upload_extra_args(file_obj, key, cache_control),
+        Config=get_r2_transfer_config(),
     )
+    final_key = content_key(key, reader.hash.hexdigest())
+    try:
+        if media_exists(final_key):
+            logger.info(f"Skipped upload of {final_key}: identical content already stored")
+        else:
+            # copy() は5GBを超えるオブジェクトもマルチパートでコピーできる
+            client.copy(
+                {'Bucket': settings.R2_BUCKET_NAME, 'Key': temp_key},
+                settings.R2_BUCKET_NAME,
+                final_key,
+                ExtraArgs={**_upload_extra_args(file_obj, key, cache_control), 'MetadataDirective': 'REPLACE'},
+                Config=get_r2_transfer_config(),
+            )
+    finally:
+        client.delete_object(Bucket=settings.R2_BUCKET_NAME, Key=temp_key)
+    return final_key
 
+
+def get_media_source(key: str, ttl: int = 3600) -> str:
+    """
+    ffmpeg/ffprobeに渡す読み取り元を返す
+
+    R2が設定されていれば署名付きURL（ダウンロードせずにRange読み込みできる）、
+    未設定ならローカル保存先のパスを返す。
+    """
+    import os
+
+    if not all([settings.R2_ACCESS_KEY, settings.R2_SECRET_KEY, settings.R2_BUCKET_NAME]):
+        return os.path.join(settings.MEDIA_ROOT, _normalize_key(key))
+    return get_r2_client().generate_presigned_url(
+        'get_object',
+        Params={'Bucket': settings.R2_BUCKET_NAME, 'Key': _normalize_key(key)},
+        ExpiresIn=ttl,
+    )
+
+
+def get_media_size(key: str) -> int | None:
+    """保存済みメディアのサイズ（バイト）を返す（存在しなければNone）"""
+    import os
+
+    if not all([settings.R2_ACCESS_KEY, settings.R2_SECRET_KEY, settings.R2_BUCKET_NAME]):
+        path = os.path.join(settings.MEDIA_ROOT, _normalize_key(key))
+        return os.path.getsize(path) if os.path.exists(path) else None
+    try:
+        response = get_r2_client().head_object(Bucket=settings.R2_BUCKET_NAME, Key=_normalize_key(key))
+    except Exception:
+        return None
+    return response['ContentLength']
+
+
+def download_media(key: str) -> bytes:
+    """保存済みメディアをメモリに読み込む（画像など小さいファイル用）"""
+    import os
+
+    if not all([settings.R2_ACCESS_KEY, settings.R2_SECRET_KEY, settings.R2_BUCKET_NAME]):
+        with open(os.path.join(settings.MEDIA_ROOT, _normalize_key(key)), 'rb') as f:
+            return f.read()
+    response = get_r2_client().get_object(Bucket=settings.R2_BUCKET_NAME, Key=_normalize_key(key))
+    return response['Body'].read()
+
+
+def download_media_to_file(key: str, path: str) -> None:
+    """保存済みメディアをファイルにダウンロードする（動画など大きいファイル用。マルチパートで並列に取得）"""
+    import os
+    import shutil
+
+    if not all([settings.R2_ACCESS_KEY, settings.R2_SECRET_KEY, settings.R2_BUCKET_NAME]):
+        shutil.copyfile(os.path.join(settings.MEDIA_ROOT, _normalize_key(key)), path)
+        return
+    get_r2_client().download_file(
+        settings.R2_BUCKET_NAME, _normalize_key(key), path, Config=get_r2_transfer_config()
+    )
+
+
+def copy_media(source_key: str, key: str, content_type: str | None = None, cache_control: str | None = None) -> str:
+    """
+    保存済みメディアを別のキーにサーバー側でコピーし、コピー先のキーを返す（ダウンロード・再アップロードしない）
+
+    Content-Type と Cache-Control はコピー先に合わせて付け直す（cache_control が None ならデフォルト）。
+    """
+    import os
+    import shutil
+
+    if not all([settings.R2_ACCESS_KEY, settings.R2_SECRET_KEY, settings.R2_BUCKET_NAME]):
+        destination = os.path.join(settings.MEDIA_ROOT, _normalize_key(key))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(os.path.join(settings.MEDIA_ROOT, _normalize_key(source_key)), destination)
+        return key
+
+    extra_args = _upload_extra_args(None, key, cache_control)
+    if content_type:
+        extra_args['ContentType'] = content_type
+    # copy() は5GBを超えるオブジェクトもマルチパートでコピーできる
+    get_r2_client().copy(
+        {'Bucket': settings.R2_BUCKET_NAME, 'Key': _normalize_key(source_key)},
+        settings.R2_BUCKET_NAME,
+        _normalize_key(key),
+        ExtraArgs={**extra_args, 'MetadataDirective': 'REPLACE'},
+        Config=get_r2_transfer_config(),
+    )
     return key
 
 
+def delete_media(key: str) -> None:
+    """保存済みメディアを削除する（存在しなければ何もしない）"""
+    import os
+
+    if not all([settings.R2_ACCESS_KEY, settings.R2_SECRET_KEY, settings.R2_BUCKET_NAME]):
+        path = os.path.join(settings.MEDIA_ROOT, _normalize_key(key))
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    get_r2_client().delete_object(Bucket=settings.R2_BUCKET_NAME, Key=_normalize_key(key))
+
+
 def generate_video_thumbnail(video_file, output_key: str) -> str | None:
     """
-    動画の1フレーム目からサムネイル画像を生成してR2にアップロード
+    動画の最初のキーフレームからサムネイル画像を生成してR2にアップロード
+
+    動画はディスクに書き直さずにffmpegへ渡し、JPEGはメモリ上で受け取る。
+    ffmpegの同時実行数は media.get_ffmpeg_pool() で制限される。
 
     Args:
-        video_file: 動画ファイルオブジェクト
+        video_file: 動画ファイルオブジェクト（またはパス・URL）
         output_key: 出力画像のR2キー（例: "thumbnails/xxx.jpg"）
 
     Returns:
         アップロードされたサムネイルのキー、失敗時はNone
     """
-    import io
-    import tempfile
-    import os
-    import ffmpeg
-    from PIL import Image
+    from . import media
 
     try:
-        # 一時ファイルに動画を保存
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp_video:
-            for chunk in video_file.chunks():
-                tmp_video.write(chunk)
-            tmp_video_path = tmp_video.name
-
-        # 動画の1フレーム目を抽出（JPEGとして）
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_thumb:
-            tmp_thumb_path = tmp_thumb.name
-
-        # ffmpegで1フレーム目を抽出
-        (
-            ffmpeg
-            .input(tmp_video_path, ss=0)
-            .filter('scale', 720, -1)  # 幅720pxにリサイズ
-            .output(tmp_thumb_path, vframes=1, format='image2', vcodec='mjpeg')
-            .overwrite_output()
-            .run(capture_stdout=True, capture_stderr=True, quiet=True)
-        )
+        result = media.submit_thumbnail(video_file).result()
 
-        # 生成されたサムネイルをR2にアップロード
-        with open(tmp_thumb_path, 'rb') as thumb_file:
-            # BytesIOに読み込んでDjangoのFileオブジェクトとして扱う
-            from django.core.files.uploadedfile import InMemoryUploadedFile
-            thumb_content = thumb_file.read()
-            thumb_io = io.BytesIO(thumb_content)
-
-            # InMemoryUploadedFileを作成
-            thumbnail = InMemoryUploadedFile(
-                thumb_io,
-                None,
-                output_key.split('/')[-1],
-                'image/jpeg',
-                len(thumb_content),
-                None
-            )
-
-            # R2にアップロード
-            upload_to_r2(thumbnail, output_key)
-
-        # 一時ファイルを削除
-        os.unlink(tmp_video_path)
-        os.unlink(tmp_thumb_path)
+        upload_started = time.perf_counter()
+        upload_to_r2(in_memory_file(result.data, output_key, 'image/jpeg'), output_key)
+        result.timings['upload'] = time.perf_counter() - upload_started
 
+        logger.info(
+            f"Generated thumbnail {output_key} ({len(result.data)} bytes): "
+            + ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in result.timings.items())
+        )
         return output_key
 
     except Exception as e:
         # エラーログを出力
         logger.error(f"Error generating thumbnail: {e}", exc_info=True)
-        # 一時ファイルのクリーンアップ
-        try:
-            if 'tmp_video_path' in locals():
-                os.unlink(tmp_video_path)
-            if 'tmp_thumb_path' in locals():
-                os.unlink(tmp_thumb_path)
-        except:
-            pass
-        return None
\ No newline at end of file
+        return None
+
+
+def in_memory_file(data: bytes, key: str, content_type: str):
+    """バイト列をupload_to_r2()に渡せるDjangoのファイルオブジェクトにする"""
+    import io
+    from django.core.files.uploadedfile import InMemoryUploadedFile
+
+    return InMemoryUploadedFile(
+        io.BytesIO(data),
+        None,
+        key.split('/')[-1],
+        content_type,
+        len(data),
+        None,
+    )
@@ -0,0 +1,21 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import models
+from .cache import get_cache
+
+CATALOG_PHRASE_COUNT_KEY = "catalog:phrase_count"
+
+
+@receiver([post_save, post_delete], sender=models.Phrase)
+def invalidate_catalog_cache(sender, instance, created=False, **kwargs):
+    """
+    フレーズの追加・削除時にカタログ件数のキャッシュを全ワーカーで破棄
+
+    コミット前に破棄すると、他のワーカーがコミット前の件数を再計算してキャッシュし、
+    それがTTLの間残るので、コミット後に破棄する。
+    """
+    if kwargs.get("signal") is post_save and not created:
+        return
+    transaction.on_commit(lambda: get_cache().invalidate(CATALOG_PHRASE_COUNT_KEY))
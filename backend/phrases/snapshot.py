@@ -0,0 +1,560 @@
+"""
+データのスナップショット（data_export/）の読み書き
+
+テーブルごとに出力するカラムを TABLES で定義し、エクスポート（migrate_to_postgres.py）と
+読み込みで共有する。
+
+形式:
+- .json: 1ファイル = 1つのJSON配列（従来の形式、indent=2）
+- .jsonl: 1行 = 1レコード（.jsonl.gz ならgzip圧縮）
+
+どちらもレコードを1件ずつ書き出すので、PlaybackLog のように大きなテーブルでも
+メモリ使用量は一定になる（PostgreSQLではサーバーサイドカーソルで chunk_size 件ずつ読む）。
+iter_records で読むときも、.json の配列を含めて1件ずつ読む。
+
+読み込み（load_table）は、PostgreSQLなら COPY FROM STDIN、それ以外は bulk_create でバッチごとに入れる。
+既存の行はIDで照合して上書きする（上書きするのはスナップショットにあるカラムだけ）。
+created_at などのタイムスタンプもスナップショットの値のまま入れる。
+
+run_tables はテーブルごとの処理をスレッドで並列に実行する。外部キーの参照先のテーブルが
+終わってから参照元を始めるので、全体の時間はおおよそ一番大きいテーブルの時間で決まる。
+"""
+from __future__ import annotations
+
+import datetime
+import decimal
+import gzip
+import json
+import os
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.db import connections, reset_queries, transaction
+from django.utils import timezone
+
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_WORKERS = 4
+
+
+@dataclass(frozen=True)
+class TableSpec:
+    name: str
+    label: str
+    model_label: str
+    fields: tuple[str, ...]
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+
+# 外部キーの参照先が先に来る順番に並べる
+TABLES = [
+    TableSpec("users", "Users", "auth.User", (
+        "id", "username", "email", "password", "first_name", "last_name",
+        "is_active", "is_staff", "is_superuser", "date_joined", "last_login",
+    )),
+    TableSpec("expressions", "Expressions", "phrases.Expression", (
+        "id", "type", "text", "meaning", "phonetic", "image_key", "audio_key", "video_key",
+        "scene_image_key", "renditions", "scene_image_variants", "media_info", "parent_id", "order",
+        "created_at", "updated_at",
+    )),
+    TableSpec("phrases", "Phrases", "phrases.Phrase", (
+        "id", "text", "meaning", "topic", "tags", "audio_key", "video_key", "scene_image_key",
+        "renditions", "scene_image_variants", "media_info", "duration_sec", "difficulty",
+        "created_at", "updated_at",
+    )),
+    TableSpec("phrase_expressions", "PhraseExpressions", "phrases.PhraseExpression", (
+        "id", "phrase_id", "expression_id", "order",
+    )),
+    TableSpec("user_settings", "UserSettings", "phrases.UserSetting", (
+        "id", "user_id", "playback_speed", "volume", "show_japanese", "repeat_count", "created_at", "updated_at",
+    )),
+    TableSpec("user_progress", "UserProgress", "phrases.UserProgress", (
+        "id", "user_id", "phrase_id", "expression_id", "completed", "replay_count", "last_reviewed",
+        "is_favorite", "is_mastered", "created_at", "updated_at",
+    )),
+    TableSpec("playback_logs", "PlaybackLogs", "phrases.PlaybackLog", (
+        "id", "user_id", "phrase_id", "play_ms", "completed", "source", "device_type", "network_type",
+        "created_at",
+    )),
+    TableSpec("email_verification_tokens", "EmailVerificationTokens", "phrases.EmailVerificationToken", (
+        "id", "user_id", "token", "is_verified", "verified_at", "created_at", "updated_at",
+    )),
+    TableSpec("password_reset_tokens", "PasswordResetTokens", "phrases.PasswordResetToken", (
+        "id", "user_id", "token", "is_used", "used_at", "expires_at", "created_at", "updated_at",
+    )),
+]
+
+TABLES_BY_NAME = {spec.name: spec for spec in TABLES}
+
+
+def json_default(value):
+    """datetime / Decimal / UUID を従来のエクスポートと同じ文字列にする"""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _open(path: Path, mode: str, compress: bool | None = None, encoding: str = "utf-8"):
+    if compress is None:
+        compress = path.suffix == ".gz"
+    if compress:
+        return gzip.open(path, mode + "t", encoding=encoding)
+    return open(path, mode, encoding=encoding)
+
+
+def write_records(path: str | os.PathLike, records, fmt: str = "jsonl") -> int:
+    """
+    レコードを1件ずつファイルに書き出し、件数を返す
+
+    一時ファイルに書いてから置き換えるので、途中で止まっても前回のファイルは壊れない。
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    count = 0
+    try:
+        with _open(tmp_path, "w", compress=path.suffix == ".gz") as f:
+            if fmt == "jsonl":
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False, default=json_default))
+                    f.write("\n")
+                    count += 1
+            else:
+                # json.dump(records, indent=2) と同じ形を1件ずつ書く
+                for record in records:
+                    item = json.dumps(record, ensure_ascii=False, indent=2, default=json_default)
+                    f.write(("[\n  " if count == 0 else ",\n  ") + item.replace("\n", "\n  "))
+                    count += 1
+                f.write("\n]" if count else "[]")
+        os.replace(tmp_path, path)
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+    return count
+
+
+def iter_table(spec: TableSpec, chunk_size: int = DEFAULT_CHUNK_SIZE, using: str = "default"):
+    """テーブルをIDの順に chunk_size 件ずつ読み、出力するカラムの辞書を返す"""
+    return (
+        spec.model.objects.using(using)
+        .order_by("pk")
+        .values(*spec.fields)
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def export_path(directory: str | os.PathLike, spec: TableSpec, fmt: str = "jsonl", compress: bool = False) -> Path:
+    suffix = ".jsonl" if fmt == "jsonl" else ".json"
+    return Path(directory) / f"{spec.name}{suffix}{'.gz' if compress else ''}"
+
+
+def export_table(
+    spec: TableSpec,
+    directory: str | os.PathLike,
+    fmt: str = "jsonl",
+    compress: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    using: str = "default",
+) -> tuple[Path, int]:
+    """1テーブルをエクスポートし、(ファイルのパス, 件数) を返す"""
+    path = export_path(directory, spec, fmt, compress)
+    count = write_records(path, iter_table(spec, chunk_size, using), fmt)
+    return path, count
+
+
+def find_snapshot(directory: str | os.PathLike, spec: TableSpec) -> Path | None:
+    """テーブルのスナップショットを探す（JSONL → 圧縮JSONL → JSONの順）"""
+    for suffix in (".jsonl", ".jsonl.gz", ".json", ".json.gz"):
+        path = Path(directory) / f"{spec.name}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+
+_JSON_WHITESPACE = " \t\r\n"
+
+
+def iter_json_array(f, read_size: int = 1024 * 1024):
+    """
+    JSON配列の要素を read_size 文字ずつ読みながら順に返す（配列全体をメモリに載せない）
+
+    要素と要素の間にはカンマがちょうど1つ必要（[1,] や [1,,2] はエラー）。
+    区切りはバッファを位置で見て確かめるので、要素ごとに残りのバッファをコピーしない。
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+
+    def read_more() -> None:
+        nonlocal buffer, position, eof
+        chunk = f.read(read_size)
+        eof = not chunk
+        buffer, position = buffer[position:] + chunk, 0
+
+    def next_char() -> str:
+        """空白を読み飛ばして次の文字を返す（ファイルの終わりなら空文字列）"""
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in _JSON_WHITESPACE:
+                position += 1
+            if position < len(buffer) or eof:
+                return buffer[position:position + 1]
+            read_more()
+
+    if next_char() != "[":
+        raise ValueError("Expected a JSON array")
+    position += 1
+    if next_char() == "]":
+        return
+
+    while True:
+        if next_char() in ("", ",", "]"):
+            raise ValueError(f"Expected a JSON value near {buffer[position:position + 40]!r}")
+        # 要素の後ろの区切りが見えるまで読む（数値などがバッファの終わりで切れていないことを確かめる）
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                read_more()
+                continue
+            following = end
+            while following < len(buffer) and buffer[following] in _JSON_WHITESPACE:
+                following += 1
+            if following < len(buffer) or eof:
+                break
+            read_more()
+
+        separator = buffer[following:following + 1]
+        if separator not in (",", "]"):
+            raise ValueError(f"Expected ',' or ']' near {buffer[following:following + 40]!r}")
+        yield value
+        if separator == "]":
+            return
+        position = following + 1
+
+
+def iter_records(path: str | os.PathLike, encoding: str = "utf-8"):
+    """スナップショットのレコードを順に返す（どの形式でも1件ずつ読む）"""
+    path = Path(path)
+    with _open(path, "r", encoding=encoding) as f:
+        if ".jsonl" in path.suffixes:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from iter_json_array(f)
+
+
+# --- 読み込み ---
+
+def concrete_fields(model) -> list:
+    return [field for field in model._meta.concrete_fields]
+
+
+def timestamp_fields(model) -> list:
+    """auto_now / auto_now_add のフィールド"""
+    return [
+        field for field in concrete_fields(model)
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+
+
+def parse_record(model, record: dict, timestamps=()) -> dict:
+    """
+    スナップショットのレコードをモデルの全カラムの値（attname → Pythonの値）にする
+
+    スナップショットに無いカラム（後から追加したフィールドなど）はモデルのデフォルト値で埋める
+    （新しく入れる行のため。既存の行はそのカラムを上書きしない → update_fields）。
+    timestamps（timestamp_fields の結果）にあるカラムが無ければ現在時刻にする。
+    """
+    values = {}
+    now = None
+    for field in concrete_fields(model):
+        if field.attname in record:
+            value = record[field.attname]
+            values[field.attname] = None if value is None else field.to_python(value)
+        elif field in timestamps:
+            # preserve_timestamps で自動設定を止めているので、無いタイムスタンプはここで埋める
+            now = now or timezone.now()
+            values[field.attname] = now
+        else:
+            values[field.attname] = field.get_default()
+    return values
+
+
+@contextmanager
+def preserve_timestamps(model):
+    """auto_now / auto_now_add を一時的に止め、スナップショットのタイムスタンプをそのまま保存する"""
+    fields = timestamp_fields(model)
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def update_fields(model, records) -> list:
+    """上書きするカラム（主キー以外で、バッチのすべてのレコードにあるもの）"""
+    present = set.intersection(*(set(record) for record in records)) if records else set()
+    return [
+        field for field in concrete_fields(model)
+        if not field.primary_key and field.attname in present
+    ]
+
+
+def _batches(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_table(
+    spec: TableSpec,
+    records,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    using: str = "default",
+    upsert: bool = True,
+    progress=None,
+) -> int:
+    """
+    レコードを batch_size 件ずつテーブルに入れ、件数を返す
+
+    複数のテーブルを入れるときは呼び出し側で transaction.atomic() にまとめる
+    （外部キーの検査はコミット時まで遅延されるので、テーブル内の前方参照があっても入れられる）。
+
+    Args:
+        upsert: 同じIDの行があれば、レコードにあるカラムだけ上書きする（False なら空のテーブルに入れる前提でそのまま入れる）
+        progress: バッチごとに累計件数を渡して呼ばれる関数
+    """
+    return load_model(spec.model, records, batch_size, using, upsert, progress)
+
+
+def load_model(
+    model,
+    records,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    using: str = "default",
+    upsert: bool = True,
+    progress=None,
+) -> int:
+    """load_table と同じ（TABLES に無いモデル用）"""
+    # (行の値, 上書きするカラム) をバッチごとに作る（preserve_timestamps の中で作られるので、先に調べておく）
+    timestamps = timestamp_fields(model)
+    batches = (
+        ([parse_record(model, record, timestamps) for record in batch], update_fields(model, batch))
+        for batch in _batches(records, batch_size)
+    )
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        return _copy_load(model, batches, connection, upsert, progress)
+    return _bulk_create_load(model, batches, using, upsert, progress)
+
+
+def _bulk_create_load(model, batches, using: str, upsert: bool, progress) -> int:
+    count = 0
+    with preserve_timestamps(model):
+        for rows, fields in batches:
+            options = {}
+            if upsert and fields:
+                options = {
+                    "update_conflicts": True,
+                    "unique_fields": [model._meta.pk.name],
+                    "update_fields": [field.name for field in fields],
+                }
+            elif upsert:
+                # 主キーしか無いレコードは、既存の行をそのまま残す
+                options = {"ignore_conflicts": True}
+            model.objects.using(using).bulk_create([model(**values) for values in rows], **options)
+            # DEBUG=True だと実行したクエリがたまり続けるのでバッチごとに消す
+            reset_queries()
+            count += len(rows)
+            if progress:
+                progress(count)
+    return count
+
+
+def _copy_load(model, batches, connection, upsert: bool, progress) -> int:
+    """
+    COPY FROM STDIN（psycopg 3）で入れる
+
+    upsert のときは一時テーブルにCOPYしてから INSERT ... ON CONFLICT (id) DO UPDATE で反映する。
+    """
+    from psycopg import sql
+
+    fields = concrete_fields(model)
+    table = model._meta.db_table
+    columns = sql.SQL(", ").join(sql.Identifier(field.column) for field in fields)
+    target = sql.Identifier(table)
+    staging = sql.Identifier(f"_load_{table}")
+    pk_column = sql.Identifier(model._meta.pk.column)
+
+    count = 0
+    # 一時テーブルは ON COMMIT DROP なので、呼び出し側がトランザクション外でも必ずトランザクション内で実行する
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        raw_cursor = cursor.cursor
+        raw_cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+        if upsert:
+            raw_cursor.execute(
+                sql.SQL("CREATE TEMP TABLE IF NOT EXISTS {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP").format(
+                    staging, target
+                )
+            )
+        copy_into = staging if upsert else target
+        for rows, update in batches:
+            with raw_cursor.copy(sql.SQL("COPY {} ({}) FROM STDIN").format(copy_into, columns)) as copy:
+                for values in rows:
+                    copy.write_row([
+                        field.get_db_prep_save(values[field.attname], connection) for field in fields
+                    ])
+            if upsert:
+                if update:
+                    conflict = sql.SQL("DO UPDATE SET {}").format(sql.SQL(", ").join(
+                        sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(field.column)) for field in update
+                    ))
+                else:
+                    conflict = sql.SQL("DO NOTHING")
+                raw_cursor.execute(
+                    sql.SQL(
+                        "INSERT INTO {target} ({columns}) SELECT {columns} FROM {staging} "
+                        "ON CONFLICT ({pk}) {conflict}"
+                    ).format(target=target, columns=columns, staging=staging, pk=pk_column, conflict=conflict)
+                )
+                raw_cursor.execute(sql.SQL("TRUNCATE {}").format(staging))
+            reset_queries()
+            count += len(rows)
+            if progress:
+                progress(count)
+    return count
+
+
+def reset_sequences(models, using: str = "default") -> None:
+    """IDを指定して入れたテーブルの自動採番を最大IDの次に合わせる（PostgreSQL以外では何もしない）"""
+    connection = connections[using]
+    statements = connection.ops.sequence_reset_sql(no_style(), list(models))
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+# --- 並列実行 ---
+
+def switch_database(url: str, alias: str = "default") -> None:
+    """
+    alias の接続先を url のDBに切り替える
+
+    設定の辞書は接続ハンドラーが持っているものと同じオブジェクトなので、置き換えずにその場で更新する
+    （新しい辞書に置き換えると TIME_ZONE などの既定値が入らず、run_tables のスレッドで作る接続が失敗する）。
+    このスレッドの接続は閉じて作り直させる（ENGINE が変わることがあるため）。
+    """
+    import dj_database_url
+    from django.conf import settings
+
+    settings.DATABASES[alias].update(dj_database_url.parse(url, conn_max_age=600))
+    connections[alias].close()
+    del connections[alias]
+
+
+@dataclass
+class TableResult:
+    spec: TableSpec
+    count: int = 0
+    started: float = 0.0  # 全体の開始からの秒数
+    seconds: float = 0.0
+    error: BaseException | None = None
+    skipped: bool = False  # 依存先のテーブルが失敗したため実行しなかった
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.count / self.seconds if self.seconds else 0.0
+
+
+def dependency_graph(specs) -> dict[str, set[str]]:
+    """テーブル名 → 外部キーで参照しているテーブル名（自己参照と specs に無いテーブルは除く）"""
+    by_model = {spec.model: spec.name for spec in specs}
+    return {
+        spec.name: {
+            by_model[field.related_model]
+            for field in spec.model._meta.concrete_fields
+            if field.is_relation and field.related_model is not spec.model and field.related_model in by_model
+        }
+        for spec in specs
+    }
+
+
+def run_tables(specs, task, workers: int = DEFAULT_WORKERS, ordered: bool = True) -> list[TableResult]:
+    """
+    テーブルごとに task(spec)（件数を返す）をスレッドで並列に実行し、specs の順に結果を返す
+
+    各スレッドはそれぞれのDB接続を使い、テーブルが終わるたびに閉じる。
+
+    Args:
+        ordered: 外部キーの参照先のテーブルが終わってから参照元を始める（インポート用）。
+                 参照先が失敗したテーブルは実行しない
+    """
+    specs = list(specs)
+    graph = dependency_graph(specs) if ordered else {spec.name: set() for spec in specs}
+    results = {spec.name: TableResult(spec) for spec in specs}
+    origin = time.perf_counter()
+
+    def run(spec: TableSpec) -> None:
+        result = results[spec.name]
+        result.started = time.perf_counter() - origin
+        try:
+            result.count = task(spec)
+        finally:
+            result.seconds = time.perf_counter() - origin - result.started
+            connections.close_all()
+
+    pending = list(specs)
+    finished: set[str] = set()
+    failed: set[str] = set()
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="snapshot-table") as pool:
+        running = {}
+        while pending or running:
+            for spec in list(pending):
+                dependencies = graph[spec.name]
+                if dependencies & failed:
+                    results[spec.name].skipped = True
+                    failed.add(spec.name)
+                    pending.remove(spec)
+                elif dependencies <= finished:
+                    running[pool.submit(run, spec)] = spec.name
+                    pending.remove(spec)
+            if not running:
+                if pending:
+                    raise ValueError(f"Circular table dependencies: {[spec.name for spec in pending]}")
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    results[name].error = e
+                    failed.add(name)
+                else:
+                    finished.add(name)
+    return [results[spec.name] for spec in specs]
@@ -1,3 +1,1392 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from jwt import algorithms as jwt_algorithms
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from phrases import (
+    audio_tracks, auth_keys, cache, checkpoint, images, media_jobs, models, ratelimit, renditions, services, signals,
+    snapshot,
+)
+from phrases.management.commands import send_outbox_emails
+
+
+def local_media_settings(test):
+    """R2を使わずに MEDIA_ROOT（テストごとの一時ディレクトリ）に保存する設定にする"""
+    media_root = tempfile.mkdtemp(prefix="phrases-test-media-")
+    test.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+    overrides = override_settings(
+        MEDIA_ROOT=media_root,
+        MEDIA_JOB_STAGING_DIR=os.path.join(media_root, "local-staging"),
+        R2_ACCESS_KEY=None,
+        R2_SECRET_KEY=None,
+    )
+    overrides.enable()
+    test.addCleanup(overrides.disable)
+    return media_root
+
+
+class ParseRateTests(SimpleTestCase):
+    def test_parses_drf_style_rates(self):
+        self.assertEqual(ratelimit.parse_rate("5/hour"), (5, 3600))
+        self.assertEqual(ratelimit.parse_rate("10/min"), (10, 60))
+        self.assertEqual(ratelimit.parse_rate("100/day"), (100, 86400))
+        self.assertEqual(ratelimit.parse_rate("3/s"), (3, 1))
+
+
+class LocalBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = ratelimit.LocalBackend()
+        self.now = 1000.0
+        patcher = mock.patch.object(ratelimit.time, "monotonic", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_allows_up_to_limit_then_blocks(self):
+        results = [self.backend.hit("k", 3, 60) for _ in range(3)]
+        self.assertTrue(all(result.allowed for result in results))
+        self.assertEqual([result.remaining for result in results], [2, 1, 0])
+
+        blocked = self.backend.hit("k", 3, 60)
+        self.assertFalse(blocked.allowed)
+        self.assertEqual(blocked.retry_after, 60)
+
+    def test_window_slides(self):
+        self.backend.hit("k", 2, 60)
+        self.now += 30
+        self.backend.hit("k", 2, 60)
+        self.assertFalse(self.backend.hit("k", 2, 60).allowed)
+
+        # 最初のヒットがウィンドウから外れたら1回分だけ空く
+        self.now += 30
+        self.assertTrue(self.backend.hit("k", 2, 60).allowed)
+        blocked = self.backend.hit("k", 2, 60)
+        self.assertFalse(blocked.allowed)
+        self.assertEqual(blocked.retry_after, 30)
+
+    def test_keys_are_independent(self):
+        self.assertTrue(self.backend.hit("a", 1, 60).allowed)
+        self.assertFalse(self.backend.hit("a", 1, 60).allowed)
+        self.assertTrue(self.backend.hit("b", 1, 60).allowed)
+
+    def test_reset_clears_counters(self):
+        self.backend.hit("k", 1, 60)
+        self.backend.reset()
+        self.assertTrue(self.backend.hit("k", 1, 60).allowed)
+
+
+class SlidingWindowThrottleTests(SimpleTestCase):
+    def setUp(self):
+        backend = ratelimit.LocalBackend()
+        patcher = mock.patch.object(ratelimit, "get_backend", return_value=backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, **headers):
+        return Request(APIRequestFactory().post("/api/auth/login", **headers))
+
+    @override_settings(RATE_LIMITS={"login": "2/min"})
+    def test_blocks_after_rate_and_reports_wait(self):
+        throttle = ratelimit.LoginRateThrottle()
+        self.assertTrue(throttle.allow_request(self.request(), None))
+        self.assertTrue(throttle.allow_request(self.request(), None))
+        self.assertFalse(throttle.allow_request(self.request(), None))
+        self.assertGreater(throttle.wait(), 0)
+
+    @override_settings(RATE_LIMITS={"login": "1/min"})
+    def test_spoofed_forwarded_for_does_not_reset_the_bucket(self):
+        throttle = ratelimit.LoginRateThrottle()
+        # プロキシ（1段）が右端に実際のクライアントIPを追加する
+        first = self.request(HTTP_X_FORWARDED_FOR="1.1.1.1, 203.0.113.7")
+        second = self.request(HTTP_X_FORWARDED_FOR="2.2.2.2, 203.0.113.7")
+        self.assertEqual(throttle.get_cache_ident(first), "ip:203.0.113.7")
+        self.assertTrue(throttle.allow_request(first, None))
+        self.assertFalse(throttle.allow_request(second, None))
+
+    @override_settings(RATE_LIMITS={})
+    def test_unconfigured_scope_is_not_limited(self):
+        throttle = ratelimit.LoginRateThrottle()
+        for _ in range(5):
+            self.assertTrue(throttle.allow_request(self.request(), None))
+
+
+@override_settings(MEDIA_JOBS_IN_PROCESS=False, MEDIA_JOB_MAX_ATTEMPTS=3, MEDIA_CONTENT_ADDRESSED_KEYS=True)
+class MediaJobProcessTests(TestCase):
+    def setUp(self):
+        self.media_root = local_media_settings(self)
+        # ffprobe が無い環境でも同じ結果になるよう、メタデータの取得は失敗扱いにする
+        patcher = mock.patch("phrases.media.probe", side_effect=RuntimeError("no ffprobe"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.phrase = models.Phrase.objects.create(text="Could you say that again?")
+
+    def enqueue(self, data=b"ID3 audio bytes"):
+        upload = SimpleUploadedFile("take1.mp3", data, content_type="audio/mpeg")
+        [job] = media_jobs.enqueue(self.phrase, [media_jobs.PendingUpload("audio", upload, "audio/take1.mp3")])
+        return job
+
+    def shared_exists(self, job):
+        return bool(job.staged_key) and os.path.exists(os.path.join(self.media_root, job.staged_key))
+
+    def test_upload_is_staged_on_this_host(self):
+        job = self.enqueue()
+        self.assertTrue(job.staged_path.endswith(".mp3"))
+        self.assertTrue(os.path.exists(job.staged_path))
+        self.assertEqual(job.staged_key, "")
+        self.assertEqual(job.status, "pending")
+        # ファイルのあるwebプロセスが処理するので、常駐ワーカーには渡さない
+        self.assertEqual(media_jobs.due_job_ids(10), [])
+
+    def test_in_process_success_uploads_once_from_local_file(self):
+        job = media_jobs.claim(self.enqueue().pk)
+        with mock.patch.object(services, "upload_to_r2", wraps=services.upload_to_r2) as upload, \
+                self.assertLogs("phrases.media_jobs", "WARNING"):
+            self.assertTrue(media_jobs.process(job))
+        # 共有ストレージのステージング領域は通さず、公開用キーにだけ送る
+        self.assertFalse(any(call.args[1].startswith("tmp/") for call in upload.call_args_list))
+
+        job.refresh_from_db()
+        self.phrase.refresh_from_db()
+        self.assertEqual(job.status, "done")
+        self.assertIsNone(job.locked_until)
+        self.assertEqual(self.phrase.audio_key, job.key)
+        self.assertRegex(job.key, r"^audio/[0-9a-f]{32}\.mp3$")
+        self.assertNotIn("download", job.timings)
+        self.assertFalse(os.path.exists(job.staged_path))
+
+    def test_publish_moves_file_to_shared_storage(self):
+        job = self.enqueue()
+        local_path = job.staged_path
+        media_jobs.run_publish_in_thread(job.pk)
+
+        job.refresh_from_db()
+        self.assertTrue(job.staged_key.startswith("tmp/media-jobs/"))
+        self.assertTrue(self.shared_exists(job))
+        self.assertEqual(job.staged_path, "")
+        self.assertFalse(os.path.exists(local_path))
+        self.assertEqual(media_jobs.due_job_ids(10), [job.pk])
+
+    def test_worker_promotes_shared_file_with_server_side_copy(self):
+        job = self.enqueue()
+        media_jobs.publish_staged(job)
+        job = media_jobs.claim(job.pk)
+        with mock.patch.object(services, "upload_to_r2") as upload, \
+                self.assertLogs("phrases.media_jobs", "WARNING"):
+            self.assertTrue(media_jobs.process(job))
+        upload.assert_not_called()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done")
+        self.assertIn("download", job.timings)
+        with open(os.path.join(self.media_root, job.key), "rb") as stored:
+            self.assertEqual(stored.read(), b"ID3 audio bytes")
+        self.assertFalse(self.shared_exists(job))
+
+    def test_failure_is_retried_with_backoff_then_marked_failed(self):
+        job = self.enqueue()
+        local_path = job.staged_path
+        with mock.patch.object(media_jobs, "_execute", side_effect=RuntimeError("R2 unavailable")), \
+                self.assertLogs("phrases.media_jobs", "WARNING") as logs:
+            for attempt in (1, 2):
+                claimed = media_jobs.claim(job.pk)
+                self.assertEqual(claimed.attempts, attempt)
+                before = timezone.now()
+                self.assertFalse(media_jobs.process(claimed))
+
+                claimed.refresh_from_db()
+                self.assertEqual(claimed.status, "pending")
+                self.assertIsNone(claimed.locked_until)
+                self.assertIn("R2 unavailable", claimed.last_error)
+                self.assertGreater(claimed.next_attempt_at, before)
+                # 再試行は別のホストのワーカーでもできるよう、共有ストレージに移っている
+                self.assertTrue(self.shared_exists(claimed))
+                self.assertFalse(os.path.exists(local_path))
+                # バックオフ中は取得できず、時間が来たら取得できる
+                self.assertIsNone(media_jobs.claim(job.pk))
+                self.assertEqual(media_jobs.due_job_ids(10), [])
+                models.MediaJob.objects.filter(pk=job.pk).update(next_attempt_at=timezone.now())
+
+            claimed = media_jobs.claim(job.pk)
+            self.assertFalse(media_jobs.process(claimed))
+
+        self.assertIn("Giving up on media job", logs.output[-1])
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.status, "failed")
+        self.assertEqual(claimed.attempts, 3)
+        # 手動で再実行できるようステージングしたファイルは残す
+        self.assertTrue(self.shared_exists(claimed))
+
+    def test_lost_local_file_fails_without_retry(self):
+        job = self.enqueue()
+        os.remove(job.staged_path)
+        with self.assertLogs("phrases.media_jobs", "ERROR"):
+            self.assertFalse(media_jobs.process(media_jobs.claim(job.pk)))
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertIn("StagedUploadLost", job.last_error)
+
+    def test_lease_is_renewed_while_processing(self):
+        job = media_jobs.claim(self.enqueue().pk)
+        models.MediaJob.objects.filter(pk=job.pk).update(locked_until=timezone.now())
+        self.assertTrue(media_jobs.renew_lease(job))
+        job.refresh_from_db()
+        self.assertGreater(job.locked_until, timezone.now() + timedelta(seconds=media_jobs.LEASE_SECONDS - 5))
+
+        # 他のワーカーが処理を終えたジョブは延長しない
+        models.MediaJob.objects.filter(pk=job.pk).update(status="done")
+        self.assertFalse(media_jobs.renew_lease(job))
+
+    def process_video(self, audio_key):
+        models.Phrase.objects.filter(pk=self.phrase.pk).update(audio_key=audio_key)
+        upload = SimpleUploadedFile("clip.mp4", b"\x00\x00\x00\x18ftypmp42", content_type="video/mp4")
+        [job] = media_jobs.enqueue(self.phrase, [media_jobs.PendingUpload("video", upload, "videos/clip.mp4")])
+        build = mock.patch.object(
+            audio_tracks, "build_audio_track", side_effect=lambda source, key: (audio_tracks.derived_key(key), 10)
+        )
+        with build as built, self.assertLogs("phrases.media_jobs", "WARNING"):
+            self.assertTrue(media_jobs.process(media_jobs.claim(job.pk)))
+        job.refresh_from_db()
+        self.phrase.refresh_from_db()
+        return job, built
+
+    @override_settings(AUDIO_TRACK_ON_UPLOAD=True, VIDEO_RENDITIONS_ON_UPLOAD=False)
+    def test_replaced_video_rebuilds_stale_derived_audio(self):
+        job, built = self.process_video("audio/derived/videos/old.48k1ch.m4a")
+        built.assert_called_once()
+        self.assertEqual(self.phrase.video_key, job.key)
+        self.assertEqual(self.phrase.audio_key, audio_tracks.derived_key(job.key))
+
+    @override_settings(AUDIO_TRACK_ON_UPLOAD=True, VIDEO_RENDITIONS_ON_UPLOAD=False)
+    def test_uploaded_audio_is_kept(self):
+        job, built = self.process_video("audio/recorded.mp3")
+        built.assert_not_called()
+        self.assertEqual(self.phrase.audio_key, "audio/recorded.mp3")
+
+    def test_expired_lease_is_reclaimed(self):
+        job = media_jobs.claim(self.enqueue().pk)
+        self.assertIsNotNone(job)
+        self.assertIsNone(media_jobs.claim(job.pk))
+
+        models.MediaJob.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(media_jobs.due_job_ids(10), [job.pk])
+        reclaimed = media_jobs.claim(job.pk)
+        self.assertEqual(reclaimed.attempts, 2)
+        self.assertEqual(reclaimed.status, "processing")
+
+    def test_retry_resets_failed_jobs(self):
+        job = self.enqueue()
+        models.MediaJob.objects.filter(pk=job.pk).update(status="failed", attempts=3)
+        self.assertEqual(media_jobs.retry(models.MediaJob.objects.all()), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("pending", 0))
+
+
+@override_settings(AUDIO_TRACK_KBPS=48, AUDIO_TRACK_CHANNELS=1)
+class AudioTrackKeyTests(SimpleTestCase):
+    def test_key_includes_encoding_settings(self):
+        self.assertEqual(audio_tracks.derived_key("/videos/a.mp4"), "audio/derived/videos/a.48k1ch.m4a")
+        with self.settings(AUDIO_TRACK_KBPS=64):
+            self.assertEqual(audio_tracks.derived_key("videos/a.mp4"), "audio/derived/videos/a.64k1ch.m4a")
+
+    def test_stale_tracks_need_rebuilding(self):
+        current = audio_tracks.derived_key("videos/b.mp4")
+        self.assertFalse(audio_tracks.needs_track(current, "videos/b.mp4"))
+        self.assertTrue(audio_tracks.needs_track("", "videos/b.mp4"))
+        # 差し替え前の動画から作った音声・設定を変える前の音声
+        self.assertTrue(audio_tracks.needs_track("audio/derived/videos/a.48k1ch.m4a", "videos/b.mp4"))
+        self.assertTrue(audio_tracks.needs_track("audio/derived/videos/b.m4a", "videos/b.mp4"))
+        # アップロードされた音声はそのまま
+        self.assertFalse(audio_tracks.needs_track("audio/recorded.mp3", "videos/b.mp4"))
+
+@override_settings(NETWORK_RENDITIONS={"3g": "low", "cellular": "low", "4g": "mid", "wifi": "high"})
+class SelectVideoKeyTests(SimpleTestCase):
+    def setUp(self):
+        self.phrase = models.Phrase(
+            video_key="videos/a.mp4",
+            renditions={
+                "source": "videos/a.mp4",
+                "variants": {
+                    "low": {"key": "renditions/videos/a/low.mp4", "bytes": 100},
+                    "mid": {"key": "renditions/videos/a/mid.mp4", "bytes": 200},
+                },
+            },
+        )
+
+    def request(self, query="", **headers):
+        return Request(APIRequestFactory().get(f"/api/feed{query}", **headers))
+
+    def test_selects_rendition_for_declared_network(self):
+        self.assertEqual(
+            renditions.select_video_key(self.phrase, self.request("?network=3g")), "renditions/videos/a/low.mp4"
+        )
+        self.assertEqual(
+            renditions.select_video_key(self.phrase, self.request(HTTP_X_NETWORK_TYPE="4G")),
+            "renditions/videos/a/mid.mp4",
+        )
+
+    def test_save_data_selects_low(self):
+        self.assertEqual(
+            renditions.select_video_key(self.phrase, self.request(HTTP_SAVE_DATA="on")), "renditions/videos/a/low.mp4"
+        )
+
+    def test_falls_back_to_original(self):
+        # 申告なし・未知の種別・作っていないレンディション（high）
+        for query in ("", "?network=satellite", "?network=wifi"):
+            with self.subTest(query=query):
+                self.assertEqual(renditions.select_video_key(self.phrase, self.request(query)), "videos/a.mp4")
+        self.assertEqual(renditions.select_video_key(self.phrase), "videos/a.mp4")
+
+    def test_ignores_renditions_of_a_replaced_video(self):
+        self.phrase.video_key = "videos/b.mp4"
+        self.assertEqual(renditions.select_video_key(self.phrase, self.request("?network=3g")), "videos/b.mp4")
+
+
+class RenderVariantsTests(SimpleTestCase):
+    def image_bytes(self, size=(640, 360), mode="RGB", fmt="JPEG"):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new(mode, size, "#3a7bd5").save(buffer, fmt)
+        return buffer.getvalue()
+
+    def test_renders_each_width_and_format(self):
+        rendered = images.render_variants(self.image_bytes(), [160, 320], ["webp", "jpeg"], {"webp": 70})
+
+        self.assertEqual((rendered.width, rendered.height), (640, 360))
+        self.assertEqual(
+            [(image.format, image.width, image.height) for image in rendered.images],
+            [("webp", 160, 90), ("jpeg", 160, 90), ("webp", 320, 180), ("jpeg", 320, 180)],
+        )
+        self.assertTrue(rendered.images[0].data.startswith(b"RIFF"))
+        self.assertTrue(rendered.images[1].data.startswith(b"\xff\xd8"))
+        self.assertTrue(rendered.placeholder.startswith("data:image/webp;base64,"))
+
+    def test_does_not_upscale(self):
+        # 元画像より大きい幅は元画像の幅にまとめる
+        rendered = images.render_variants(self.image_bytes(), [320, 1280, 1920], ["webp"], {})
+        self.assertEqual([(image.width, image.height) for image in rendered.images], [(320, 180), (640, 360)])
+
+    def test_converts_palette_images_for_jpeg(self):
+        rendered = images.render_variants(self.image_bytes(mode="P", fmt="PNG"), [100], ["jpeg"], {})
+        self.assertEqual([(image.width, image.height) for image in rendered.images], [(100, 56)])
+
+    def test_keys_are_content_addressed(self):
+        rendered = images.render_variants(self.image_bytes(), [160], ["webp", "jpeg"], {})
+        webp, jpeg = (images.variant_key(image) for image in rendered.images)
+        self.assertRegex(webp, r"^variants/[0-9a-f]{32}\.webp$")
+        self.assertRegex(jpeg, r"^variants/[0-9a-f]{32}\.jpg$")
+        [again] = images.render_variants(self.image_bytes(), [160], ["webp"], {}).images
+        self.assertEqual(images.variant_key(again), webp)
+
+
+class ContentAddressedUploadTests(SimpleTestCase):
+    class Stream:
+        """HTTPレスポンスのようなシークできないストリーム"""
+
+        def __init__(self, data):
+            self.buffer = io.BytesIO(data)
+
+        def read(self, size=-1):
+            return self.buffer.read(size)
+
+    def setUp(self):
+        self.media_root = local_media_settings(self)
+        self.data = b"\x00\x00\x00\x18ftypmp42 video bytes"
+        self.expected = f"videos/{hashlib.sha256(self.data).hexdigest()[:32]}.mp4"
+
+    def upload(self, file_obj, key="videos/Upload.MP4"):
+        return services.upload_to_r2(file_obj, key, content_addressed=True)
+
+    def test_key_is_content_hash(self):
+        key = self.upload(services.in_memory_file(self.data, "Upload.MP4", "video/mp4"))
+        self.assertEqual(key, self.expected)
+        with open(os.path.join(self.media_root, key), "rb") as stored:
+            self.assertEqual(stored.read(), self.data)
+
+    def test_identical_content_is_not_uploaded_again(self):
+        self.upload(services.in_memory_file(self.data, "a.mp4", "video/mp4"))
+        with self.assertLogs("phrases.services", "INFO") as logs:
+            key = self.upload(services.in_memory_file(self.data, "b.mp4", "video/mp4"), "videos/b.mp4")
+        self.assertEqual(key, self.expected)
+        self.assertIn(f"Skipped upload of {self.expected}", logs.output[0])
+
+    def test_non_seekable_stream_gets_the_same_key(self):
+        key = self.upload(self.Stream(self.data))
+        self.assertEqual(key, self.expected)
+        # 一時ファイルは残らない
+        self.assertEqual(os.listdir(os.path.join(self.media_root, "videos")), [os.path.basename(key)])
+
+        reader = services.HashingReader(self.Stream(self.data))
+        self.assertEqual(self.upload(reader), self.expected)
+        self.assertEqual(reader.bytes_read, len(self.data))
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    """テスト用のローカルHTTPサーバー（パスごとに (ステータス, ヘッダー, JSON) を返し、リクエスト数を数える）"""
+
+    def __init__(self):
+        self.routes: dict[str, tuple[int, dict, Any]] = {}
+        self.hits: dict[str, int] = {}
+        super().__init__(("127.0.0.1", 0), StubHTTPHandler)
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+
+class StubHTTPHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+        status, headers, payload = self.server.routes.get(self.path, (404, {}, {}))
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServerTestCase(SimpleTestCase):
+    """スタブサーバーを起動し、auth_keys の時計を self.offset 秒だけ進められるようにする"""
+
+    def setUp(self):
+        self.server = StubHTTPServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.offset = 0.0
+        monotonic = auth_keys.time.monotonic
+        patcher = mock.patch.object(auth_keys.time, "monotonic", side_effect=lambda: monotonic() + self.offset)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class JWKSCacheTests(StubServerTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        cls.public_keys = {
+            kid: rsa.generate_private_key(public_exponent=65537, key_size=2048).public_key()
+            for kid in ("k1", "k2")
+        }
+
+    def serve_keys(self, *kids, cache_control="public, max-age=3600"):
+        keys = [
+            {**json.loads(jwt_algorithms.RSAAlgorithm.to_jwk(self.public_keys[kid])), "kid": kid}
+            for kid in kids
+        ]
+        self.server.routes["/keys"] = (200, {"Cache-Control": cache_control}, {"keys": keys})
+
+    def make_cache(self):
+        return auth_keys.JWKSCache(self.server.url("/keys"), min_refetch_interval=60)
+
+    def test_known_kid_is_served_from_cache(self):
+        self.serve_keys("k1")
+        jwks = self.make_cache()
+
+        first = jwks.get_key("k1")
+        second = jwks.get_key("k1")
+
+        self.assertIs(first, second)
+        self.assertEqual(first.public_numbers(), self.public_keys["k1"].public_numbers())
+        self.assertEqual(self.server.hits["/keys"], 1)
+
+    def test_unknown_kid_refetches_at_most_once_per_interval(self):
+        self.serve_keys("k1")
+        jwks = self.make_cache()
+        jwks.get_key("k1")
+
+        # 取得した直後の未知のkidでは取り直さない
+        self.serve_keys("k1", "k2")
+        with self.assertRaises(ValueError):
+            jwks.get_key("k2")
+        self.assertEqual(self.server.hits["/keys"], 1)
+
+        # min_refetch_interval を過ぎれば、鍵のローテーションとみなして取り直す
+        self.offset = 61
+        self.assertEqual(jwks.get_key("k2").public_numbers(), self.public_keys["k2"].public_numbers())
+        with self.assertRaises(ValueError):
+            jwks.get_key("k3")
+        self.assertEqual(self.server.hits["/keys"], 2)
+
+    def test_keys_expire_after_max_age(self):
+        self.serve_keys("k1", cache_control="max-age=10")
+        jwks = self.make_cache()
+        jwks.get_key("k1")
+
+        self.offset = 9
+        jwks.get_key("k1")
+        self.assertEqual(self.server.hits["/keys"], 1)
+
+        self.offset = 11
+        jwks.get_key("k1")
+        self.assertEqual(self.server.hits["/keys"], 2)
+
+
+class CachingGoogleRequestTests(StubServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.request = auth_keys.CachingGoogleRequest()
+
+    def test_get_is_cached_until_max_age_minus_age(self):
+        self.server.routes["/certs"] = (200, {"Cache-Control": "public, max-age=100", "Age": "90"}, {"k1": "cert"})
+
+        first = self.request(self.server.url("/certs"))
+        self.offset = 9
+        second = self.request(self.server.url("/certs"))
+        self.assertIs(first, second)
+        self.assertEqual(json.loads(second.data), {"k1": "cert"})
+        self.assertEqual(self.server.hits["/certs"], 1)
+
+        self.offset = 11
+        self.request(self.server.url("/certs"))
+        self.assertEqual(self.server.hits["/certs"], 2)
+
+    def test_error_responses_are_not_cached(self):
+        self.server.routes["/certs"] = (503, {"Cache-Control": "max-age=100"}, {})
+
+        self.assertEqual(self.request(self.server.url("/certs")).status, 503)
+        self.assertEqual(self.request(self.server.url("/certs")).status, 503)
+        self.assertEqual(self.server.hits["/certs"], 2)
+
+    def test_no_store_is_not_cached(self):
+        self.server.routes["/certs"] = (200, {"Cache-Control": "no-store"}, {"k1": "cert"})
+
+        self.request(self.server.url("/certs"))
+        self.request(self.server.url("/certs"))
+        self.assertEqual(self.server.hits["/certs"], 2)
+
+
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = cache.LocalBackend()
+        self.cache = cache.TwoTierCache(self.backend, prefix="test:", l1_maxsize=8, l1_ttl=30)
+
+    def test_lru_keeps_recently_used_keys(self):
+        lru = cache.LRUCache(maxsize=2)
+        lru.set("a", 1, ttl=30)
+        lru.set("b", 2, ttl=30)
+        lru.get("a")
+        lru.set("c", 3, ttl=30)
+
+        self.assertEqual(lru.get("a"), 1)
+        self.assertIs(lru.get("b"), cache._MISSING)
+        self.assertEqual(lru.get("c"), 3)
+
+    def test_l1_hit_does_not_touch_l2(self):
+        self.cache.set("count", 5, ttl=60)
+
+        with mock.patch.object(self.backend, "get", wraps=self.backend.get) as l2_get:
+            self.assertEqual(self.cache.get("count"), 5)
+
+        l2_get.assert_not_called()
+        self.assertEqual(self.cache.stats.l1_hits, 1)
+
+    def test_l2_stores_json_and_fills_l1_of_other_workers(self):
+        self.cache.set("summary", {"total": 3, "topics": ("daily", "travel")}, ttl=60)
+        other = cache.TwoTierCache(self.backend, prefix="test:")
+
+        self.assertEqual(json.loads(self.backend.get("test:summary")), {"total": 3, "topics": ["daily", "travel"]})
+        self.assertEqual(other.get("summary"), {"total": 3, "topics": ["daily", "travel"]})
+        self.assertEqual(other.get("summary"), {"total": 3, "topics": ["daily", "travel"]})
+        self.assertEqual((other.stats.l2_hits, other.stats.l1_hits), (1, 1))
+
+    def test_non_json_l2_value_is_a_miss(self):
+        self.backend.set("test:count", pickle.dumps(5), ttl=60)
+
+        self.assertEqual(self.cache.get_or_set("count", lambda: 7, ttl=60), 7)
+        self.assertEqual(self.backend.get("test:count"), b"7")
+
+    def test_concurrent_misses_run_loader_once(self):
+        release = threading.Event()
+        calls = []
+
+        def loader():
+            calls.append(1)
+            release.wait(5)
+            return 42
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            futures = [executor.submit(self.cache.get_or_set, "count", loader, 60) for _ in range(5)]
+            for _ in range(500):
+                if self.cache.stats.coalesced == 4:
+                    break
+                threading.Event().wait(0.01)
+            release.set()
+            results = [future.result(timeout=5) for future in futures]
+
+        self.assertEqual(results, [42] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.cache.stats.coalesced, 4)
+
+    def test_loader_error_reaches_waiting_threads_and_is_not_cached(self):
+        def loader():
+            raise RuntimeError("database down")
+
+        with self.assertRaises(RuntimeError):
+            self.cache.get_or_set("count", loader, ttl=60)
+        self.assertEqual(self.cache.get_or_set("count", lambda: 3, ttl=60), 3)
+
+    def test_invalidate_clears_l1_of_other_workers(self):
+        other = cache.TwoTierCache(self.backend, prefix="test:")
+        self.cache.set("count", 5, ttl=60)
+        self.assertEqual(other.get("count"), 5)
+
+        self.cache.invalidate("count")
+
+        self.assertIsNone(other.get("count"))
+        self.assertIsNone(self.cache.get("count"))
+
+
+class CatalogCacheInvalidationTests(TestCase):
+    def setUp(self):
+        self.cache = cache.TwoTierCache(cache.LocalBackend(), prefix="test:")
+        patcher = mock.patch.object(cache, "_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache.set(signals.CATALOG_PHRASE_COUNT_KEY, 10, ttl=300)
+
+    def test_new_phrase_invalidates_count_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            models.Phrase.objects.create(text="Hello", meaning="こんにちは", topic="daily")
+            # コミットまでは古い件数のまま（他のワーカーがコミット前の件数をキャッシュしないように）
+            self.assertEqual(self.cache.get(signals.CATALOG_PHRASE_COUNT_KEY), 10)
+
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertIsNone(self.cache.get(signals.CATALOG_PHRASE_COUNT_KEY))
+
+    def test_updating_a_phrase_keeps_count(self):
+        phrase = models.Phrase.objects.create(text="Hello", meaning="こんにちは", topic="daily")
+        self.cache.set(signals.CATALOG_PHRASE_COUNT_KEY, 10, ttl=300)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            phrase.meaning = "やあ"
+            phrase.save()
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.cache.get(signals.CATALOG_PHRASE_COUNT_KEY), 10)
+
+    def test_deleting_a_phrase_invalidates_count(self):
+        phrase = models.Phrase.objects.create(text="Hello", meaning="こんにちは", topic="daily")
+        self.cache.set(signals.CATALOG_PHRASE_COUNT_KEY, 10, ttl=300)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            phrase.delete()
+
+        self.assertIsNone(self.cache.get(signals.CATALOG_PHRASE_COUNT_KEY))
+
+
+class BatchRunnerTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="phrases-test-checkpoint-")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, "probe.json")
+        self.phrases = [
+            models.Phrase.objects.create(text=f"Phrase {i}", meaning="意味", topic="daily") for i in range(5)
+        ]
+        self.failing: set[int] = set()
+        self.processed: list[int] = []
+
+    def process(self, phrase):
+        self.processed.append(phrase.pk)
+        if phrase.pk in self.failing:
+            raise RuntimeError("probe failed")
+        return {"duration_sec": 7}
+
+    def run_batches(self, **options):
+        command = mock.Mock(stdout=io.StringIO(), stderr=io.StringIO())
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            runner = checkpoint.BatchRunner(
+                command, "phrase", models.Phrase.objects.all(), checkpoint.Checkpoint(self.path), self.process,
+                executor=executor, batch_size=2, **options,
+            )
+            return runner.run()
+
+    def durations(self):
+        return list(models.Phrase.objects.order_by("id").values_list("duration_sec", flat=True))
+
+    def test_resume_retries_failed_ids_before_continuing(self):
+        first, second, third, fourth, fifth = (phrase.pk for phrase in self.phrases)
+        self.failing = {second}
+
+        result = self.run_batches(limit=3)
+
+        self.assertEqual((result.scanned, result.updated, result.failed), (3, 2, 1))
+        self.assertEqual(self.durations(), [7, 0, 7, 0, 0])
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f), {"phrase": third, "phrase.failed": [second]})
+
+        # 次の実行では失敗したIDをやり直してから、前回の続き（4件目以降）を処理する
+        self.failing = set()
+        self.processed = []
+        result = self.run_batches()
+
+        self.assertEqual(self.processed[0], second)
+        self.assertEqual(sorted(self.processed[1:]), [fourth, fifth])
+        self.assertEqual((result.scanned, result.updated, result.failed), (3, 3, 0))
+        self.assertEqual(self.durations(), [7] * 5)
+        self.assertEqual(checkpoint.Checkpoint(self.path).get("phrase.failed"), [])
+        self.assertEqual(checkpoint.Checkpoint(self.path).get("phrase"), fifth)
+
+    def test_ids_that_fail_again_stay_in_checkpoint(self):
+        second = self.phrases[1].pk
+        self.failing = {second}
+        self.run_batches()
+        self.processed = []
+
+        result = self.run_batches()
+
+        self.assertEqual(self.processed, [second])
+        self.assertEqual(result.failed, 1)
+        self.assertEqual(checkpoint.Checkpoint(self.path).get("phrase.failed"), [second])
+
+
+class ImportExpressionGraphTests(TestCase):
+    def write_jsonl(self, records):
+        handle, path = tempfile.mkstemp(suffix=".jsonl")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+        return path
+
+    def run_import(self, records, *args):
+        call_command(
+            "import_expression_graph", "--expressions", self.write_jsonl(records), *args,
+            stdout=io.StringIO(), stderr=io.StringIO(),
+        )
+
+    def test_children_listed_before_parents_are_loaded(self):
+        self.run_import([
+            {"id": 3, "type": "word", "text": "again", "parent_id": 2},
+            {"id": 2, "type": "phrase", "text": "say that again", "parent_id": 1},
+            {"id": 1, "type": "sentence", "text": "Could you say that again?"},
+        ])
+        again = models.Expression.objects.get(text="again")
+        self.assertEqual(again.parent.text, "say that again")
+        self.assertEqual(again.parent.parent.text, "Could you say that again?")
+        self.assertIsNone(again.parent.parent.parent_id)
+
+    def test_natural_key_parents_and_existing_rows(self):
+        existing = models.Expression.objects.create(type="sentence", text="See you later.")
+        self.run_import([
+            {"type": "word", "text": "later", "parent_type": "phrase", "parent_text": "see you"},
+            {"type": "phrase", "text": "see you", "parent_type": "sentence", "parent_text": "See you later."},
+        ], "--ignore-ids")
+        see_you = models.Expression.objects.get(text="see you")
+        self.assertEqual(see_you.parent_id, existing.pk)
+        self.assertEqual(models.Expression.objects.get(text="later").parent_id, see_you.pk)
+
+    def test_cycle_is_rejected_and_nothing_is_written(self):
+        with self.assertRaisesMessage(CommandError, "Parent cycle"):
+            self.run_import([
+                {"id": 10, "text": "independent"},
+                {"id": 1, "text": "a", "parent_id": 2},
+                {"id": 2, "text": "b", "parent_id": 1},
+            ])
+        self.assertFalse(models.Expression.objects.exists())
+
+    def test_self_parent_is_rejected(self):
+        with self.assertRaisesMessage(CommandError, "is its own parent"):
+            self.run_import([{"id": 1, "text": "a", "parent_id": 1}])
+
+    def test_unknown_parent_is_rejected(self):
+        with self.assertRaisesMessage(CommandError, "Unknown parent_id 99"):
+            self.run_import([{"id": 1, "text": "a", "parent_id": 99}])
+        with self.assertRaisesMessage(CommandError, "Unknown parent ('phrase', 'missing')"):
+            self.run_import([{"text": "a", "parent_text": "missing"}])
+        self.assertFalse(models.Expression.objects.exists())
+
+
+class SnapshotFileTests(SimpleTestCase):
+    records = [
+        {"id": 1, "text": "Thanks, I’ll manage.", "tags": ["daily"], "media_info": {"video": {"duration": 1.5}}},
+        {"id": 2, "text": "", "tags": [], "created_at": datetime(2024, 5, 1, 9, 30, tzinfo=dt_timezone.utc)},
+    ]
+    expected = [records[0], {**records[1], "created_at": "2024-05-01T09:30:00+00:00"}]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="phrases-test-snapshot-")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_round_trip(self):
+        for name, fmt in (("t.jsonl", "jsonl"), ("t.jsonl.gz", "jsonl"), ("t.json", "json"), ("t.json.gz", "json")):
+            with self.subTest(name=name):
+                path = os.path.join(self.directory, name)
+                self.assertEqual(snapshot.write_records(path, iter(self.records), fmt), 2)
+                self.assertEqual(list(snapshot.iter_records(path)), self.expected)
+                self.assertFalse(os.path.exists(path + ".tmp"))
+
+    def test_json_format_matches_json_dump(self):
+        path = os.path.join(self.directory, "t.json")
+        snapshot.write_records(path, iter(self.expected), "json")
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(f.read(), json.dumps(self.expected, ensure_ascii=False, indent=2))
+
+        snapshot.write_records(path, iter([]), "json")
+        self.assertEqual(list(snapshot.iter_records(path)), [])
+
+    def test_iter_json_array_with_small_reads(self):
+        text = json.dumps([*self.expected, 12345, "a, ]", [1, {"b": None}]], indent=2)
+        for read_size in (1, 2, 7, 64):
+            with self.subTest(read_size=read_size):
+                self.assertEqual(
+                    list(snapshot.iter_json_array(io.StringIO(text), read_size)),
+                    [*self.expected, 12345, "a, ]", [1, {"b": None}]],
+                )
+
+    def test_iter_json_array_rejects_invalid_input(self):
+        for text in ('{"id": 1}', "[1, 2", "[1, {", "[1,]", "[1,,2]", "[,1]", "[1 2]", "[1, 2,\n]", "["):
+            for read_size in (1, 3, 1024):
+                with self.subTest(text=text, read_size=read_size), self.assertRaises(ValueError):
+                    list(snapshot.iter_json_array(io.StringIO(text), read_size))
+
+    def test_iter_json_array_accepts_empty_and_spaced_arrays(self):
+        for text, expected in (("[]", []), (" [ ] ", []), ("\n[ 1 ,\t2\r\n]", [1, 2]), ("[[], {}]", [[], {}])):
+            for read_size in (1, 3, 1024):
+                with self.subTest(text=text, read_size=read_size):
+                    self.assertEqual(list(snapshot.iter_json_array(io.StringIO(text), read_size)), expected)
+
+    def test_failed_write_keeps_previous_file(self):
+        path = os.path.join(self.directory, "t.jsonl")
+        snapshot.write_records(path, iter(self.records))
+
+        def broken():
+            yield self.records[0]
+            raise RuntimeError("connection lost")
+
+        with self.assertRaises(RuntimeError):
+            snapshot.write_records(path, broken())
+        self.assertEqual(list(snapshot.iter_records(path)), self.expected)
+        self.assertFalse(os.path.exists(path + ".tmp"))
+
+
+class SnapshotLoadTests(TestCase):
+    spec = snapshot.TABLES_BY_NAME["phrases"]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="phrases-test-snapshot-")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.created_at = datetime(2024, 5, 1, 9, 30, tzinfo=dt_timezone.utc)
+
+    def create_phrase(self, **fields):
+        phrase = models.Phrase.objects.create(
+            text="Could you say that again?",
+            meaning="もう一度言ってもらえますか？",
+            tags=["daily"],
+            video_key="videos/a.mp4",
+            renditions={"source": "videos/a.mp4", "variants": {"low": {"key": "renditions/videos/a/low.mp4"}}},
+            scene_image_variants={"source": "images/a.jpg", "placeholder": "data:image/webp;base64,AAAA"},
+            media_info={"source": "videos/a.mp4", "video": {"width": 1280, "height": 720}},
+            **fields,
+        )
+        models.Phrase.objects.filter(pk=phrase.pk).update(created_at=self.created_at, updated_at=self.created_at)
+        return models.Phrase.objects.get(pk=phrase.pk)
+
+    def test_export_and_load_round_trip(self):
+        original = self.create_phrase()
+        path, count = snapshot.export_table(self.spec, self.directory, compress=True)
+        self.assertEqual(count, 1)
+        models.Phrase.objects.all().delete()
+
+        self.assertEqual(snapshot.load_table(self.spec, snapshot.iter_records(path), batch_size=1), 1)
+        loaded = models.Phrase.objects.get(pk=original.pk)
+        for field in self.spec.fields:
+            with self.subTest(field=field):
+                self.assertEqual(getattr(loaded, field), getattr(original, field))
+        # 読み込み後はタイムスタンプの自動設定が元に戻っている
+        self.assertTrue(models.Phrase._meta.get_field("updated_at").auto_now)
+
+    def test_upsert_only_overwrites_columns_in_the_record(self):
+        original = self.create_phrase()
+        snapshot.load_table(self.spec, [{"id": original.pk, "text": "Say that again?", "updated_at": self.created_at}])
+
+        loaded = models.Phrase.objects.get(pk=original.pk)
+        self.assertEqual(loaded.text, "Say that again?")
+        self.assertEqual(loaded.meaning, original.meaning)
+        self.assertEqual(loaded.renditions, original.renditions)
+        self.assertEqual(loaded.scene_image_variants, original.scene_image_variants)
+        self.assertEqual(loaded.media_info, original.media_info)
+        self.assertEqual(loaded.created_at, self.created_at)
+
+    def test_record_with_only_id_keeps_existing_row(self):
+        original = self.create_phrase()
+        snapshot.load_table(self.spec, [{"id": original.pk}])
+        self.assertEqual(models.Phrase.objects.get(pk=original.pk).text, original.text)
+
+    def test_new_rows_get_defaults_and_timestamps(self):
+        before = timezone.now()
+        snapshot.load_table(self.spec, [{"id": 500, "text": "See you later."}])
+
+        loaded = models.Phrase.objects.get(pk=500)
+        self.assertEqual((loaded.topic, loaded.tags, loaded.renditions), ("daily", [], {}))
+        self.assertGreaterEqual(loaded.created_at, before)
+        self.assertGreaterEqual(loaded.updated_at, before)
+
+
+class SnapshotRunTablesTests(SimpleTestCase):
+    def test_dependency_graph_follows_foreign_keys(self):
+        graph = snapshot.dependency_graph(snapshot.TABLES)
+        # 自己参照（Expression.parent）は含めない
+        self.assertEqual(graph["expressions"], set())
+        self.assertEqual(graph["phrase_expressions"], {"phrases", "expressions"})
+        self.assertEqual(graph["user_progress"], {"users", "phrases", "expressions"})
+        self.assertEqual(graph["playback_logs"], {"users", "phrases"})
+        # specs に無いテーブルへの参照は除く
+        subset = [snapshot.TABLES_BY_NAME[name] for name in ("phrases", "phrase_expressions")]
+        self.assertEqual(snapshot.dependency_graph(subset)["phrase_expressions"], {"phrases"})
+
+    def test_tables_start_after_their_dependencies(self):
+        graph = snapshot.dependency_graph(snapshot.TABLES)
+        lock = threading.Lock()
+        finished = set()
+
+        def task(spec):
+            with lock:
+                self.assertLessEqual(graph[spec.name], finished, spec.name)
+            with lock:
+                finished.add(spec.name)
+            return len(spec.name)
+
+        results = snapshot.run_tables(snapshot.TABLES, task, workers=4)
+        self.assertEqual([result.spec for result in results], snapshot.TABLES)
+        self.assertEqual([result.count for result in results], [len(spec.name) for spec in snapshot.TABLES])
+
+    def test_dependents_of_a_failed_table_are_skipped(self):
+        def task(spec):
+            if spec.name == "phrases":
+                raise RuntimeError("COPY failed")
+            return 1
+
+        results = {result.spec.name: result for result in snapshot.run_tables(snapshot.TABLES, task, workers=2)}
+        self.assertIsInstance(results["phrases"].error, RuntimeError)
+        for name in ("phrase_expressions", "user_progress", "playback_logs"):
+            with self.subTest(name=name):
+                self.assertTrue(results[name].skipped)
+                self.assertEqual(results[name].count, 0)
+        for name in ("users", "expressions", "user_settings", "password_reset_tokens"):
+            with self.subTest(name=name):
+                self.assertEqual((results[name].count, results[name].error, results[name].skipped), (1, None, False))
+
+    def test_threads_use_the_switched_database(self):
+        directory = tempfile.mkdtemp(prefix="phrases-test-switch-")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        paths = {}
+        for name in ("before", "after"):
+            paths[name] = os.path.join(directory, f"{name}.sqlite3")
+            with sqlite3.connect(paths[name]) as db:
+                db.execute("CREATE TABLE marker (name TEXT)")
+                db.execute("INSERT INTO marker VALUES (?)", (name,))
+
+        alias = "snapshot_switch"
+        settings.DATABASES[alias] = {**connections["default"].settings_dict, "ENGINE": "django.db.backends.sqlite3",
+                                     "NAME": paths["before"], "TEST": {}}
+
+        def remove_alias():
+            connections[alias].close()
+            del connections[alias]
+            del settings.DATABASES[alias]
+
+        self.addCleanup(remove_alias)
+        # テストの中で追加した接続なので、このテストでだけ接続を許可する
+        patcher = mock.patch.object(type(self), "databases", frozenset({alias}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        def marker(spec=None):
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT name FROM marker")
+                return cursor.fetchone()[0]
+
+        self.assertEqual(marker(), "before")
+        snapshot.switch_database(f"sqlite:///{paths['after']}", alias)
+
+        # このスレッドの接続も、run_tables のスレッドで新しく作る接続も切り替え先を使う
+        self.assertEqual(marker(), "after")
+        names = []
+        [result] = snapshot.run_tables(
+            [snapshot.TABLES_BY_NAME["users"]], lambda spec: names.append(marker()) or len(names)
+        )
+        self.assertIsNone(result.error)
+        self.assertEqual(names, ["after"])
+        self.assertIn("TIME_ZONE", settings.DATABASES[alias])
+
+
+@override_settings(
+    EMAIL_TIMEOUT=30,
+    EMAIL_OUTBOX_CONCURRENCY={"sendgrid": 4, "smtp": 1},
+    EMAIL_OUTBOX_MAX_ATTEMPTS=2,
+    EMAIL_OUTBOX_RETRY_BASE_SECONDS=30,
+    EMAIL_OUTBOX_RETRY_MAX_SECONDS=3600,
+)
+class SendOutboxEmailsTests(TestCase):
+    def setUp(self):
+        self.executors = {"sendgrid": ThreadPoolExecutor(max_workers=4), "smtp": ThreadPoolExecutor(max_workers=1)}
+        for executor in self.executors.values():
+            self.addCleanup(executor.shutdown)
+        self.command = send_outbox_emails.Command(stdout=io.StringIO())
+
+    def add_message(self, **fields):
+        return models.EmailOutbox.objects.create(
+            to_email="learner@example.com", subject="Verify your email", plain_content="Hello", **fields
+        )
+
+    def test_lease_covers_the_slowest_provider_pool(self):
+        # sendgrid: 50通を4並列 → 13回、smtp: 2通を1並列 → 2回
+        self.assertEqual(send_outbox_emails.lease_seconds(["sendgrid"] * 50 + ["smtp"] * 2), 13 * 30 + 60)
+        # 同時送信数の設定が無いプロバイダは smtp のプールで送る
+        self.assertEqual(send_outbox_emails.lease_seconds(["smtp", "ses", "ses"]), 3 * 30 + 60)
+
+    def test_claim_leases_rows_and_skips_leased_ones(self):
+        messages = [self.add_message() for _ in range(5)]
+        before = timezone.now()
+        claimed = send_outbox_emails.claim_batch(10)
+
+        self.assertEqual({message.pk for message in claimed}, {message.pk for message in messages})
+        for message in claimed:
+            self.assertEqual(message.status, "sending")
+            self.assertGreaterEqual(message.locked_until, before + timedelta(seconds=2 * 30 + 60))
+        self.assertEqual(send_outbox_emails.claim_batch(10), [])
+
+        # リースが切れた行（ワーカーが止まったなど）は取得し直せる
+        models.EmailOutbox.objects.filter(pk=messages[0].pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([message.pk for message in send_outbox_emails.claim_batch(10)], [messages[0].pk])
+
+    def test_sends_through_the_provider_stored_on_the_row(self):
+        sendgrid = self.add_message()
+        smtp = self.add_message(provider="smtp")
+        with mock.patch.object(send_outbox_emails.services, "send_email_via_provider", return_value=True) as send:
+            self.assertEqual(self.command.process_batch(self.executors, 10), 2)
+
+        self.assertEqual(sorted(call.args[0] for call in send.call_args_list), ["sendgrid", "smtp"])
+        for message in (sendgrid, smtp):
+            message.refresh_from_db()
+            self.assertEqual((message.status, message.attempts, message.locked_until), ("sent", 1, None))
+            self.assertIsNotNone(message.sent_at)
+
+    def test_failures_back_off_then_give_up(self):
+        message = self.add_message()
+        with mock.patch.object(send_outbox_emails.services, "send_email_via_provider", return_value=False), \
+                self.assertLogs("phrases.management.commands.send_outbox_emails", "WARNING") as logs:
+            before = timezone.now()
+            self.command.process_batch(self.executors, 10)
+            message.refresh_from_db()
+            self.assertEqual((message.status, message.attempts), ("pending", 1))
+            self.assertGreater(message.next_attempt_at, before + timedelta(seconds=20))
+            self.assertIn("error response", message.last_error)
+            # バックオフ中は取得しない
+            self.assertEqual(self.command.process_batch(self.executors, 10), 0)
+
+            models.EmailOutbox.objects.filter(pk=message.pk).update(next_attempt_at=timezone.now())
+            self.command.process_batch(self.executors, 10)
+
+        self.assertIn("Giving up on email", logs.output[-1])
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ("failed", 2))
+
+
+class SeedFromSnapshotTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="phrases-test-seed-")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.user = User.objects.create_user("learner", "learner@example.com", "pass")
+        self.phrase = models.Phrase.objects.create(text="See you later.", media_info={"video": {"width": 640}})
+        self.expression = models.Expression.objects.create(text="later", type="word")
+        models.PhraseExpression.objects.create(phrase=self.phrase, expression=self.expression)
+
+    def seed(self, *args):
+        out = io.StringIO()
+        call_command("seed_from_snapshot", *args, stdout=out)
+        return out.getvalue()
+
+    def export(self, *names):
+        for name in names:
+            snapshot.export_table(snapshot.TABLES_BY_NAME[name], self.directory)
+
+    def test_directory_round_trip(self):
+        self.export("phrases", "expressions", "phrase_expressions")
+        models.Phrase.objects.filter(pk=self.phrase.pk).update(text="edited")
+
+        output = self.seed(self.directory, "--tables", "phrases,expressions,phrase_expressions")
+        self.assertIn("Seeded 3 rows", output)
+        phrase = models.Phrase.objects.get(pk=self.phrase.pk)
+        self.assertEqual((phrase.text, phrase.media_info), ("See you later.", {"video": {"width": 640}}))
+        self.assertEqual(list(phrase.expressions.all()), [self.expression])
+
+    def test_flush_also_empties_referencing_tables(self):
+        self.export("phrases", "expressions", "phrase_expressions")
+        models.UserProgress.objects.create(user=self.user, phrase=self.phrase)
+        models.PlaybackLog.objects.create(user=self.user, phrase=self.phrase, play_ms=1500)
+        models.Phrase.objects.create(text="Not in the snapshot")
+
+        output = self.seed(self.directory, "--flush", "--tables", "phrases,expressions,phrase_expressions")
+        self.assertIn("Also flushing tables that reference them", output)
+        self.assertIn("phrases_userprogress", output)
+        self.assertEqual(list(models.Phrase.objects.values_list("text", flat=True)), ["See you later."])
+        self.assertFalse(models.UserProgress.objects.exists())
+        self.assertFalse(models.PlaybackLog.objects.exists())
+        # 参照していないテーブルはそのまま
+        self.assertTrue(User.objects.filter(pk=self.user.pk).exists())
+
+    def test_fixture_file(self):
+        path = os.path.join(self.directory, "fixture.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([
+                {"model": "phrases.phrase", "pk": 100, "fields": {"text": "Long time no see.", "tags": ["daily"]}},
+                {"model": "phrases.expression", "pk": 100, "fields": {"text": "no see", "type": "phrase"}},
+                {"model": "phrases.phraseexpression", "pk": 100, "fields": {"phrase": 100, "expression": 100}},
+            ], f)
+
+        self.seed(path, "--tables", "phrases,expressions")
+        self.assertEqual(models.Phrase.objects.get(pk=100).tags, ["daily"])
+        self.assertTrue(models.Expression.objects.filter(pk=100).exists())
+        # --tables に無いモデルのレコードは入れない
+        self.assertFalse(models.PhraseExpression.objects.filter(pk=100).exists())
+
+    def test_dry_run_rolls_back(self):
+        self.export("phrases")
+        models.Phrase.objects.filter(pk=self.phrase.pk).update(text="edited")
+        self.assertIn("[rolled back]", self.seed(self.directory, "--tables", "phrases", "--dry-run"))
+        self.assertEqual(models.Phrase.objects.get(pk=self.phrase.pk).text, "edited")
+
+    def test_rejects_unknown_tables_and_models(self):
+        with self.assertRaisesMessage(CommandError, "Unknown tables: phrase"):
+            self.seed(self.directory, "--tables", "phrase")
+        path = os.path.join(self.directory, "fixture.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([{"model": "phrases.missing", "pk": 1, "fields": {}}], f)
+        with self.assertRaisesMessage(CommandError, "Unknown model in fixture"):
+            self.seed(path)
+
+
+def load_import_phrases():
+    """リポジトリ直下のインポートスクリプト（import_phrases.py）をモジュールとして読み込む"""
+    module = sys.modules.get("import_phrases")
+    if module is None:
+        path = Path(settings.BASE_DIR).parent / "import_phrases.py"
+        spec = importlib.util.spec_from_file_location("import_phrases", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules["import_phrases"] = module
+    return module
+
+
+class ImportManifestTests(SimpleTestCase):
+    def setUp(self):
+        self.import_phrases = load_import_phrases()
+        directory = tempfile.mkdtemp(prefix="phrases-test-manifest-")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, "data.csv.manifest.jsonl")
+
+    def write_lines(self, *entries, tail=""):
+        with open(self.path, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            f.write(tail)
+
+    def open_manifest(self):
+        manifest = self.import_phrases.ImportManifest(self.path, resume=True)
+        self.addCleanup(manifest.close)
+        return manifest
+
+    def test_resume_keeps_only_offset_failed_rows_and_rows_after_offset(self):
+        self.write_lines(
+            {"row": 2, "text": "a", "state": "uploaded", "video_key": "videos/a.mp4"},
+            {"row": 3, "text": "b", "state": "failed", "error": "timeout"},
+            {"row": 2, "text": "a", "state": "inserted", "id": 1},
+            {"row": 5, "text": "d", "state": "uploaded", "video_key": "videos/d.mp4"},
+            {"completed": 4},
+            {"row": 6, "text": "e", "state": "inserted", "id": 2},
+            tail='{"row": 7, "text": "f", "sta',  # 書きかけで止まった行
+        )
+
+        manifest = self.open_manifest()
+
+        self.assertEqual(manifest.completed, 4)
+        self.assertEqual(list(manifest.failed), [3])
+        self.assertEqual(sorted(manifest.pending), [5, 6])
+        self.assertEqual(manifest.get(2, "a"), {"state": "completed"})
+        self.assertEqual(manifest.get(3, "b")["state"], "failed")
+        self.assertEqual(manifest.get(5, "d")["video_key"], "videos/d.mp4")
+        self.assertEqual(manifest.get(5, "edited"), {})
+        self.assertEqual(manifest.get(6, "e")["state"], "inserted")
+        self.assertEqual(manifest.get(7, "f"), {})
+
+    def test_retried_row_leaves_failed_rows(self):
+        self.write_lines(
+            {"row": 3, "text": "b", "state": "failed", "error": "timeout"},
+            {"completed": 10},
+            {"row": 3, "text": "b", "state": "inserted", "id": 7},
+            {"completed": 12},
+        )
+
+        manifest = self.open_manifest()
+
+        self.assertEqual(manifest.completed, 12)
+        self.assertEqual(manifest.failed, {})
+        self.assertEqual(manifest.pending, {})
+        self.assertEqual(manifest.get(3, "b"), {"state": "completed"})
+
+    def test_complete_only_moves_forward(self):
+        manifest = self.import_phrases.ImportManifest(self.path, resume=False)
+        manifest.complete(5)
+        manifest.complete(3)
+        manifest.close()
+
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual([json.loads(line) for line in f], [{"completed": 5}])
+
+
+class ReadRowsTests(SimpleTestCase):
+    def setUp(self):
+        self.import_phrases = load_import_phrases()
+        self.directory = tempfile.mkdtemp(prefix="phrases-test-rows-")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_reads_csv_rows_with_header_line_numbers(self):
+        path = os.path.join(self.directory, "data.csv")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write("text,meaning,topic,video_url,extra\n")
+            f.write('"Hello, world", こんにちは ,Daily,https://example.com/1.mp4,x\n')
+            f.write("Bye,,daily,https://example.com/2.mp4,y\n")
+
+        rows = list(self.import_phrases.read_rows(path))
+
+        self.assertEqual(rows, [
+            (2, {"text": "Hello, world", "meaning": "こんにちは", "topic": "Daily",
+                 "video_url": "https://example.com/1.mp4"}),
+            (3, {"text": "Bye", "meaning": "", "topic": "daily", "video_url": "https://example.com/2.mp4"}),
+        ])
+
+    def test_csv_without_required_columns_exits(self):
+        path = os.path.join(self.directory, "data.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("text,meaning\nHello,こんにちは\n")
+
+        with redirect_stdout(io.StringIO()), self.assertRaises(SystemExit):
+            list(self.import_phrases.read_rows(path))
+
+    def test_reads_gzipped_jsonl_and_marks_broken_lines(self):
+        path = os.path.join(self.directory, "data.jsonl.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"text": "Hello", "meaning": "やあ", "topic": "daily", "video_url": "u", "id": 1}) + "\n")
+            f.write("\n")
+            f.write("{broken\n")
+            f.write("[1, 2]\n")
+            f.write(json.dumps({"text": "Bye", "topic": "travel", "video_url": None}) + "\n")
+
+        rows = list(self.import_phrases.read_rows(path))
+
+        self.assertEqual(rows, [
+            (1, {"text": "Hello", "meaning": "やあ", "topic": "daily", "video_url": "u"}),
+            (3, None),
+            (4, None),
+            (5, {"text": "Bye", "meaning": "", "topic": "travel", "video_url": ""}),
+        ])
+
+
+class ImportCsvTests(TestCase):
+    def setUp(self):
+        self.import_phrases = load_import_phrases()
+        directory = tempfile.mkdtemp(prefix="phrases-test-import-")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.csv_path = os.path.join(directory, "data.csv")
+        self.transferred = []
+        patcher = mock.patch.object(self.import_phrases, "transfer_video", side_effect=self.fake_transfer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_transfer(self, row):
+        self.transferred.append(row.row_num)
+        if "broken" in row.video_url:
+            raise ConnectionError("download failed")
+        return self.import_phrases.TransferResult(
+            row=row, video_key=f"videos/{row.row_num}.mp4", bytes=10, connect_seconds=0.0, transfer_seconds=0.0
+        )
+
+    def write_csv(self, *texts, broken=()):
+        with open(self.csv_path, "w", encoding="utf-8", newline="") as f:
+            f.write("text,meaning,topic,video_url\n")
+            for text in texts:
+                host = "broken" if text in broken else "example"
+                f.write(f"{text},意味,daily,https://{host}.com/{text}.mp4\n")
+
+    def run_import(self, **options):
+        with redirect_stdout(io.StringIO()):
+            self.import_phrases.import_csv(self.csv_path, workers=2, **options)
+
+    def test_checks_existing_texts_and_inserts_per_batch(self):
+        models.Phrase.objects.create(text="Existing", meaning="既存", topic="daily")
+        self.write_csv("A", "Existing", "B", "A", "C")
+
+        with CaptureQueriesContext(connection) as queries:
+            self.run_import(batch_size=2)
+
+        statements = [query["sql"] for query in queries.captured_queries]
+        self.assertEqual(len([sql for sql in statements if sql.startswith("SELECT") and '"text" IN' in sql]), 3)
+        self.assertEqual(len([sql for sql in statements if sql.startswith("INSERT")]), 2)
+        self.assertEqual(sorted(self.transferred), [2, 4, 6])
+        self.assertEqual(
+            dict(models.Phrase.objects.exclude(text="Existing").values_list("text", "video_key")),
+            {"A": "videos/2.mp4", "B": "videos/4.mp4", "C": "videos/6.mp4"},
+        )
+
+    def test_resume_skips_completed_rows_and_retries_failed_ones(self):
+        self.write_csv("A", "B", "C", broken={"B"})
+        self.run_import(batch_size=2)
+        self.assertEqual(sorted(models.Phrase.objects.values_list("text", flat=True)), ["A", "C"])
+
+        self.write_csv("A", "B", "C")
+        self.transferred.clear()
+        self.run_import(batch_size=2, resume=True)
+
+        self.assertEqual(self.transferred, [3])
+        self.assertEqual(sorted(models.Phrase.objects.values_list("text", flat=True)), ["A", "B", "C"])
+        manifest = self.import_phrases.ImportManifest(f"{self.csv_path}.manifest.jsonl", resume=True)
+        manifest.close()
+        self.assertEqual((manifest.completed, manifest.failed, manifest.pending), (4, {}, {}))
+
+    def test_resume_inserts_earlier_uploads_without_transfer(self):
+        self.write_csv("A", "B")
+        with open(f"{self.csv_path}.manifest.jsonl", "w", encoding="utf-8") as f:
+            f.write(json.dumps({"row": 2, "text": "A", "state": "uploaded", "video_key": "videos/earlier.mp4"}) + "\n")
+
+        self.run_import(batch_size=10, resume=True)
+
+        self.assertEqual(self.transferred, [3])
+        self.assertEqual(models.Phrase.objects.get(text="A").video_key, "videos/earlier.mp4")
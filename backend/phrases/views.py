@@ -4,14 +4,17 @@ import logging
 import secrets
 
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.utils import timezone
-from rest_framework import generics, mixins, permissions, status
+from rest_framework import exceptions, generics, mixins, permissions, status
 from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from . import models, serializers, services
+from . import models, ratelimit, serializers, services
+from .cache import get_cache
+from .signals import CATALOG_PHRASE_COUNT_KEY
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -137,6 +140,7 @@ class MasteredToggleView(APIView):
 class PlaybackLogCreateView(generics.CreateAPIView):
     serializer_class = serializers.PlaybackLogSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [ratelimit.PlaybackLogRateThrottle]
 
 
 class UserSettingsView(generics.GenericAPIView, mixins.RetrieveModelMixin, mixins.UpdateModelMixin):
@@ -158,24 +162,23 @@ class UserSettingsView(generics.GenericAPIView, mixins.RetrieveModelMixin, mixin
 
 class AuthSignUpView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [ratelimit.SignUpRateThrottle]
 
     def post(self, request):
         serializer = serializers.SignUpSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        user = serializer.save()
 
-        # ユーザー設定を作成
-        services.get_user_settings(user)
+        with transaction.atomic():
+            user = serializer.save()
 
-        # メール確認トークンを作成
-        verification_token = models.EmailVerificationToken.objects.create(user=user)
+            # ユーザー設定を作成
+            services.get_user_settings(user)
 
-        # 確認メールを送信
-        try:
+            # メール確認トークンを作成
+            verification_token = models.EmailVerificationToken.objects.create(user=user)
+
+            # 確認メールを送信キューに追加（送信はワーカーが行う）
             services.send_verification_email(user, str(verification_token.token))
-        except Exception as e:
-            # メール送信エラーはログに記録するが、サインアップ自体は成功とする
-            logger.error(f"Failed to send verification email: {e}", exc_info=True)
 
         return Response(
             {
@@ -233,6 +236,7 @@ class EmailVerifyView(APIView):
 
 class AuthLoginView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [ratelimit.LoginRateThrottle]
 
     def post(self, request):
         provider = request.data.get("provider")
@@ -379,7 +383,7 @@ class PhraseMediaSignedUrlView(APIView):
         ttl = request.data.get("ttl")
         serializer = serializers.PhraseMediaSignedUrlSerializer(
             data=request.data,
-            context={"ttl": ttl}
+            context={"ttl": ttl, "request": request}
         )
         serializer.is_valid(raise_exception=True)
         body = serializer.save()
@@ -398,7 +402,7 @@ class ExpressionMediaSignedUrlView(APIView):
         ttl = request.data.get("ttl")
         serializer = serializers.ExpressionMediaSignedUrlSerializer(
             data=request.data,
-            context={"ttl": ttl}
+            context={"ttl": ttl, "request": request}
         )
         serializer.is_valid(raise_exception=True)
         body = serializer.save()
@@ -485,8 +489,10 @@ class MasteryRateView(APIView):
             phrase__isnull=False,
         ).count()
 
-        # 全フレーズ数を取得
-        total_count = models.Phrase.objects.count()
+        # 全フレーズ数を取得（カタログ更新時にsignalsで無効化）
+        total_count = get_cache().get_or_set(
+            CATALOG_PHRASE_COUNT_KEY, models.Phrase.objects.count, ttl=300
+        )
 
         # マスター率を計算（パーセンテージ）
         mastery_rate = (mastered_count / total_count * 100) if total_count > 0 else 0
@@ -500,6 +506,7 @@ class MasteryRateView(APIView):
 
 class PasswordResetRequestView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [ratelimit.PasswordResetRateThrottle]
 
     def post(self, request):
         email = request.data.get("email")
@@ -509,20 +516,18 @@ class PasswordResetRequestView(APIView):
         try:
             user = User.objects.get(email=email)
 
-            # 既存の未使用トークンを無効化
-            models.PasswordResetToken.objects.filter(
-                user=user,
-                is_used=False
-            ).update(is_used=True)
+            with transaction.atomic():
+                # 既存の未使用トークンを無効化
+                models.PasswordResetToken.objects.filter(
+                    user=user,
+                    is_used=False
+                ).update(is_used=True)
 
-            # 新しいトークンを作成
-            reset_token = models.PasswordResetToken.objects.create(user=user)
+                # 新しいトークンを作成
+                reset_token = models.PasswordResetToken.objects.create(user=user)
 
-            # リセットメールを送信
-            try:
+                # リセットメールを送信キューに追加（送信はワーカーが行う）
                 services.send_password_reset_email(user, str(reset_token.token))
-            except Exception as e:
-                logger.error(f"Failed to send password reset email: {e}", exc_info=True)
 
             # セキュリティ上、ユーザーが存在するかどうかを明かさない
             return Response(
@@ -587,6 +592,14 @@ class PasswordResetConfirmView(APIView):
 
 class ContactFormView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    # 1ユーザーあたり1時間に5件まで（settings.RATE_LIMITS["contact"]）
+    throttle_classes = [ratelimit.ContactRateThrottle]
+
+    def throttled(self, request, wait):
+        raise exceptions.Throttled(
+            wait,
+            detail="お問い合わせの送信制限に達しました。1時間後にもう一度お試しください。",
+        )
 
     def post(self, request):
         serializer = serializers.ContactFormSerializer(data=request.data)
@@ -603,34 +616,17 @@ class ContactFormView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Simple rate limiting check (max 5 contacts per hour per user)
-        from datetime import timedelta
-        from django.core.cache import cache
-
-        cache_key = f"contact_form_{user.id}"
-        contact_count = cache.get(cache_key, 0)
-
-        if contact_count >= 5:
-            return Response(
-                {"detail": "お問い合わせの送信制限に達しました。1時間後にもう一度お試しください。"},
-                status=status.HTTP_429_TOO_MANY_REQUESTS
-            )
-
-        # Send email to admin
+        # Queue email to admin (sent by the outbox worker)
         try:
-            logger.info(f"Sending contact email from user {user.email} (subject: {subject_type})")
+            logger.info(f"Queueing contact email from user {user.email} (subject: {subject_type})")
             services.send_contact_email(user, subject_type, message)
-            logger.info(f"Contact email sent successfully from {user.email}")
-
-            # Increment rate limit counter
-            cache.set(cache_key, contact_count + 1, 3600)  # Expire in 1 hour
 
             return Response(
                 {"message": "お問い合わせを送信しました。ご連絡ありがとうございます。"},
                 status=status.HTTP_200_OK
             )
         except Exception as e:
-            logger.error(f"Failed to send contact email from {user.email}: {type(e).__name__}: {str(e)}", exc_info=True)
+            logger.error(f"Failed to queue contact email from {user.email}: {type(e).__name__}: {str(e)}", exc_info=True)
 
             # より詳細なエラーメッセージを返す（開発環境のみ）
             from django.conf import settings
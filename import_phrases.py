@@ -1,210 +1,539 @@
 #!/usr/bin/env python
 """
-CSV形式のデータからPhraseモデルにデータを一括インポートするスクリプト
+CSV / JSONL 形式のデータからPhraseモデルにデータを一括インポートするスクリプト
 
 CSVフォーマット:
 text,meaning,topic,video_url
 "Hello, how are you?","こんにちは、お元気ですか？",daily,https://example.com/video1.mp4
 "Where is the nearest store?","一番近い店はどこですか？",shopping,https://example.com/video2.mp4
 
+処理の流れ:
+- ファイルは1行ずつ読みながら検証する（全体をメモリに載せない。pandasは不要）
+- 動画のダウンロードとR2へのアップロードはスレッドプール（--workers）で並列に行う。
+  HTTPレスポンスをメモリに溜めずにそのままマルチパートアップロードへ流す
+  （キーは内容のハッシュなので、同じ動画は1回しか保存されない）
+- アップロードが終わった行から --batch-size 件ずつ bulk_create する
+- 行ごとの状態（uploaded: アップロード済み / inserted: 登録済み / failed）を
+  マニフェスト（<CSV>.manifest.jsonl）に追記する。--resume ならそれを読み、処理済みの行は飛ばし、
+  失敗した行はやり直し、アップロード済みの行は転送せずにそのキーで登録する
+- 既存のテキストは --batch-size 行ずつまとめて1回のクエリ（text__in）で照合する
+- 最後にステージごとのスループット（接続・転送・登録）を表示する
+
 使い方:
     python import_phrases.py data.csv
+    python import_phrases.py data.csv --workers 16 --batch-size 200
+    python import_phrases.py data.csv --resume        # 中断したインポートの続きから
+    python import_phrases.py catalog.jsonl.gz          # JSONL（gzip圧縮も可）
+
+ローカルで試す場合（R2の代わりにS3互換サーバー、動画はローカルのHTTPサーバー）:
+    moto_server -p 5055 &
+    python -m http.server 8001 --directory ./videos &
+    R2_SIGNING_ENDPOINT=http://127.0.0.1:5055 R2_ACCESS_KEY=test R2_SECRET_KEY=test \\
+        python import_phrases.py data.csv
 """
 
+import argparse
+import csv
+import gzip
+import json
 import os
 import sys
-import uuid
-from io import BytesIO
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from pathlib import Path
 
 import django
-import pandas as pd
 import requests
-from django.core.files.uploadedfile import InMemoryUploadedFile
 
 # Djangoの設定を読み込む
 sys.path.insert(0, str(Path(__file__).parent / "backend"))
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 django.setup()
 
+from phrases.cache import get_cache
 from phrases.models import Phrase
-from phrases.services import upload_to_r2
+from phrases.services import HashingReader, upload_to_r2
+from phrases.signals import CATALOG_PHRASE_COUNT_KEY
+
+DOWNLOAD_TIMEOUT = 60
+REQUIRED_COLUMNS = ['text', 'meaning', 'topic', 'video_url']
+
+_local = threading.local()
 
 
-def download_video(url: str) -> tuple[BytesIO, str]:
+def get_session() -> requests.Session:
+    """スレッドごとにHTTPセッションを使い回す（同じホストへの接続を再利用する）"""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+class ImportManifest:
+    """
+    インポートの進み具合を記録するJSONLファイル（追記のみ）
+
+    1行 = 1つの状態変化で、登録をコミットするたびに「この行番号までは処理が終わった」という
+    位置（{"completed": 行番号}）も書く。読み込むときに覚えておくのはその位置と失敗した行、
+    位置より後ろでアップロードや登録が済んだ行だけなので、何百万行のファイルでもメモリは増えない。
+    位置より前の行は処理済みとして飛ばす（CSVを編集して行がずれた場合は --resume を付けずにやり直す。
+    既存のテキストはスキップされる）。失敗した行と位置より後ろの行は、行番号とテキストの組で照合する。
+    途中で止まって最後の行が壊れていても、その行だけ無視して読み込める。
     """
-    URLから動画をダウンロード
 
-    Args:
-        url: 動画のURL
+    def __init__(self, path: str, resume: bool):
+        self.path = path
+        self.completed = 0
+        self.failed: dict[int, dict] = {}
+        self.pending: dict[int, dict] = {}
+        if resume and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if "completed" in entry:
+                        self._advance(entry["completed"])
+                    else:
+                        self._apply(entry)
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def _apply(self, entry: dict) -> None:
+        row_num = entry["row"]
+        if entry.get("state") == "inserted" and row_num <= self.completed:
+            # 処理済みの位置より前で失敗していた行を、やり直して登録できた
+            self.failed.pop(row_num, None)
+            self.pending.pop(row_num, None)
+        elif entry.get("state") == "failed":
+            self.pending.pop(row_num, None)
+            self.failed[row_num] = entry
+        else:
+            self.failed.pop(row_num, None)
+            self.pending.setdefault(row_num, {}).update(entry)
+
+    def _advance(self, row_num: int) -> None:
+        self.completed = max(self.completed, row_num)
+        self.pending = {num: entry for num, entry in self.pending.items() if num > self.completed}
+
+    def get(self, row_num: int, text: str) -> dict:
+        """前回の記録を返す（処理済みの位置より前で失敗していない行は state が "completed"）"""
+        entry = self.failed.get(row_num) or self.pending.get(row_num)
+        if entry is not None:
+            return entry if entry.get("text") == text else {}
+        return {"state": "completed"} if row_num <= self.completed else {}
+
+    def record(self, row_num: int, text: str, state: str, **values) -> None:
+        entry = {"row": row_num, "text": text, "state": state, **values}
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def complete(self, row_num: int) -> None:
+        """row_num 行目までの処理が全部終わったことを記録する（次の sync で書き出される）"""
+        if row_num > self.completed:
+            self.completed = row_num
+            self._file.write(json.dumps({"completed": row_num}) + "\n")
+
+    def sync(self) -> None:
+        """ここまでの記録をディスクに書き出す（登録をコミットした後に呼ぶ）"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self.sync()
+        self._file.close()
+
+
+@dataclass
+class ImportRow:
+    row_num: int
+    text: str
+    meaning: str
+    topic: str
+    video_url: str
+
+
+@dataclass
+class TransferResult:
+    row: ImportRow
+    video_key: str
+    bytes: int
+    connect_seconds: float
+    transfer_seconds: float
+
+
+class StageStats:
+    """ステージごとの処理件数・時間・バイト数"""
+
+    def __init__(self):
+        self.count: dict[str, int] = {}
+        self.seconds: dict[str, float] = {}
+        self.bytes = 0
+
+    def add(self, stage: str, seconds: float, count: int = 1) -> None:
+        self.count[stage] = self.count.get(stage, 0) + count
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def report(self, wall_seconds: float) -> None:
+        print("Stage throughput:")
+        for stage, seconds in self.seconds.items():
+            count = self.count[stage]
+            line = f"  {stage:<9} {count} rows, avg {seconds / count * 1000:.0f}ms"
+            if stage == "transfer" and seconds:
+                # 並列に動いているので、1本あたりの速度と全体の速度を分けて出す
+                line += (
+                    f", {self.bytes / seconds / (1024 * 1024):.2f} MB/s per stream"
+                    f", {self.bytes / wall_seconds / (1024 * 1024):.2f} MB/s total"
+                )
+            elif stage == "insert" and seconds:
+                line += f", {count / seconds:.0f} rows/s"
+            print(line)
+        print(f"  overall   {self.count.get('insert', 0) / wall_seconds:.2f} rows/s in {wall_seconds:.1f}s")
+
+
+def transfer_video(row: ImportRow) -> TransferResult:
+    """
+    動画をダウンロードしながらR2にアップロードする（スレッドプール上で呼ばれる）
 
-    Returns:
-        (BytesIOオブジェクト, ファイル名)
+    レスポンスのボディを直接 upload_to_r2 に渡すので、動画全体をメモリに載せない。
     """
-    print(f"  Downloading video from: {url}")
-    response = requests.get(url, stream=True, timeout=60)
-    response.raise_for_status()
+    started = time.perf_counter()
+    with get_session().get(row.video_url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        connected = time.perf_counter()
+        # gzipなどで圧縮されていれば展開しながら読む
+        response.raw.decode_content = True
+        reader = HashingReader(response.raw)
+        video_key = upload_to_r2(reader, "videos/upload.mp4", content_addressed=True)
+    finished = time.perf_counter()
+    return TransferResult(
+        row=row,
+        video_key=video_key,
+        bytes=reader.bytes_read,
+        connect_seconds=connected - started,
+        transfer_seconds=finished - connected,
+    )
 
-    # ファイル名を推測
-    filename = url.split("/")[-1].split("?")[0]
-    if not filename.endswith(('.mp4', '.mov', '.avi', '.webm')):
-        filename += '.mp4'
 
-    # BytesIOに保存
-    video_content = BytesIO()
-    total_size = 0
-    for chunk in response.iter_content(chunk_size=8192):
-        if chunk:
-            video_content.write(chunk)
-            total_size += len(chunk)
+def open_text(path: str):
+    """テキストファイルを開く（.gz なら展開しながら読む）"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
 
-    video_content.seek(0)
-    print(f"  Downloaded {total_size / (1024 * 1024):.2f} MB")
 
-    return video_content, filename
+def detect_format(path: str) -> str:
+    name = path[:-3] if path.endswith(".gz") else path
+    return "jsonl" if name.endswith((".jsonl", ".ndjson")) else "csv"
 
 
-def create_uploaded_file(content: BytesIO, filename: str) -> InMemoryUploadedFile:
-    """
-    BytesIOからDjangoのInMemoryUploadedFileを作成
+def check_columns(columns) -> None:
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in columns]
+    if missing_columns:
+        print(f"Error: CSV must have columns: {', '.join(REQUIRED_COLUMNS)}")
+        print(f"Missing columns: {', '.join(missing_columns)}")
+        print(f"Found columns: {', '.join(columns)}")
+        sys.exit(1)
 
-    Args:
-        content: ファイルの内容
-        filename: ファイル名
 
-    Returns:
-        InMemoryUploadedFile
-    """
-    content.seek(0)
-    size = len(content.getvalue())
-
-    return InMemoryUploadedFile(
-        content,
-        None,
-        filename,
-        'video/mp4',
-        size,
-        None
-    )
+def clean_values(record: dict) -> dict:
+    """必須カラムの値を文字列にして前後の空白を除く（欠損値は空文字列）"""
+    return {column: str(record.get(column) or '').strip() for column in REQUIRED_COLUMNS}
+
+
+def read_csv_rows(path: str):
+    """CSVを1行ずつ読み、(行番号, 各カラムの値) を順に返す"""
+    with open_text(path) as f:
+        reader = csv.DictReader(f)
+        check_columns(reader.fieldnames or [])
+        # CSVのヘッダーが1行目なので2から数える
+        for row_num, record in enumerate(reader, start=2):
+            yield row_num, clean_values(record)
+
+
+def read_jsonl_rows(path: str):
+    """JSONL（1行1オブジェクト）を1行ずつ読み、(行番号, 各カラムの値) を順に返す。壊れた行は値がNone"""
+    with open_text(path) as f:
+        for row_num, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                yield row_num, None
+                continue
+            yield row_num, clean_values(record) if isinstance(record, dict) else None
+
+
+def read_pandas_rows(path: str, chunk_size: int):
+    """pandasでCSVを chunk_size 行ずつ読み、(行番号, 各カラムの値) を順に返す"""
+    try:
+        import pandas as pd
+    except ImportError:
+        print("Error: pandas is not installed (use the default csv engine or `pip install pandas`)")
+        sys.exit(1)
 
+    chunks = pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False)
+    for chunk in chunks:
+        check_columns(list(chunk.columns))
+        for idx, record in zip(chunk.index, chunk.to_dict("records")):
+            yield idx + 2, clean_values(record)  # CSVのヘッダーが1行目なので+2
 
-def import_csv(csv_path: str, skip_existing: bool = True) -> None:
+
+def read_rows(path: str, file_format: str = "auto", engine: str = "csv", chunk_size: int = 10000):
+    """
+    インポートするファイルを先頭から順に読む（ファイル全体をメモリに載せない）
+
+    Args:
+        path: CSV / JSONL のパス（.gz 圧縮も可）
+        file_format: "csv" / "jsonl"（"auto" なら拡張子で判定）
+        engine: CSVの読み込みに使うもの（"csv": 標準ライブラリ / "pandas": chunk_size 行ずつ）
+    """
+    if file_format == "auto":
+        file_format = detect_format(path)
+    if file_format == "jsonl":
+        return read_jsonl_rows(path)
+    if engine == "pandas":
+        return read_pandas_rows(path, chunk_size)
+    return read_csv_rows(path)
+
+
+def import_csv(
+    csv_path: str,
+    skip_existing: bool = True,
+    workers: int = 8,
+    batch_size: int = 100,
+    resume: bool = False,
+    manifest_path: str | None = None,
+    file_format: str = "auto",
+    engine: str = "csv",
+) -> None:
     """
-    CSVファイルからPhraseデータをインポート
+    CSV（またはJSONL）ファイルからPhraseデータをインポート
+
+    ファイルは先頭から1行ずつ読んで検証し、既存チェックも batch_size 行ずつクエリで行うので、
+    数百万行でもメモリ使用量は一定（覚えておくのは処理中の行と、マニフェストの失敗した行だけ）。
 
     Args:
-        csv_path: CSVファイルのパス
+        csv_path: CSV / JSONL ファイルのパス（.gz 圧縮も可）
         skip_existing: 既存のテキストをスキップするかどうか
+        workers: 同時にダウンロード・アップロードする動画の数
+        batch_size: まとめて登録する行数
+        resume: マニフェストを読み込んで前回の続きから処理するかどうか
+        manifest_path: マニフェストのパス（省略時は <CSV>.manifest.jsonl）
+        file_format: "csv" / "jsonl"（"auto" なら拡張子で判定）
+        engine: CSVの読み込み方法（"csv": 標準ライブラリ / "pandas": チャンクごと。pandasが必要）
     """
     if not os.path.exists(csv_path):
         print(f"Error: File not found: {csv_path}")
         sys.exit(1)
 
-    print(f"Importing phrases from: {csv_path}")
+    print(f"Importing phrases from: {csv_path} ({workers} workers, batch size {batch_size})")
+    manifest = ImportManifest(manifest_path or f"{csv_path}.manifest.jsonl", resume=resume)
+    if resume:
+        print(
+            f"Resuming after row {manifest.completed} ({len(manifest.failed)} failed rows to retry) "
+            f"from {manifest.path}"
+        )
     print("-" * 60)
 
-    # pandasでCSVを読み込み
-    try:
-        df = pd.read_csv(csv_path)
-    except Exception as e:
-        print(f"Error reading CSV: {e}")
-        sys.exit(1)
-
-    # 必須カラムのチェック
-    required_columns = ['text', 'meaning', 'topic', 'video_url']
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    if missing_columns:
-        print(f"Error: CSV must have columns: {', '.join(required_columns)}")
-        print(f"Missing columns: {', '.join(missing_columns)}")
-        print(f"Found columns: {', '.join(df.columns)}")
-        sys.exit(1)
-
-    print(f"Loaded {len(df)} rows from CSV")
-    print()
-
     success_count = 0
     skip_count = 0
+    resumed_count = 0
+    reused_uploads = 0
     error_count = 0
 
-    # データフレームをループ処理
-    for idx, row in df.iterrows():
-        row_num = idx + 2  # CSVのヘッダーが1行目なので+2
-
-        # NaN値をチェックして空文字列に変換
-        text = str(row['text']).strip() if pd.notna(row['text']) else ''
-        meaning = str(row['meaning']).strip() if pd.notna(row['meaning']) else ''
-        topic = str(row['topic']).strip().lower() if pd.notna(row['topic']) else ''
-        video_url = str(row['video_url']).strip() if pd.notna(row['video_url']) else ''
-
-        print(f"Row {row_num}: {text[:50]}...")
-
-        # バリデーション
-        if not all([text, meaning, topic, video_url]):
-            print(f"  ❌ Skipped: Missing required fields")
-            error_count += 1
-            continue
-
-        # トピックのバリデーション
-        valid_topics = [choice[0] for choice in Phrase.TOPIC_CHOICES]
-        if topic not in valid_topics:
-            print(f"  ❌ Skipped: Invalid topic '{topic}'. Valid topics: {', '.join(valid_topics)}")
-            error_count += 1
-            continue
-
-        # 既存チェック
-        if skip_existing and Phrase.objects.filter(text=text).exists():
-            print(f"  ⏭️  Skipped: Already exists")
-            skip_count += 1
-            continue
-
-        try:
-            # 動画をダウンロード
-            video_content, filename = download_video(video_url)
-
-            # R2にアップロード用のキーを生成
-            video_key = f"videos/{uuid.uuid4()}.mp4"
-
-            # InMemoryUploadedFileを作成
-            uploaded_file = create_uploaded_file(video_content, filename)
-
-            # R2にアップロード
-            print(f"  Uploading to R2: {video_key}")
-            upload_to_r2(uploaded_file, video_key)
-
-            # Phraseオブジェクトを作成
-            phrase = Phrase.objects.create(
-                text=text,
-                meaning=meaning,
-                topic=topic,
-                video_key=video_key,
+    valid_topics = [choice[0] for choice in Phrase.TOPIC_CHOICES]
+    stats = StageStats()
+    # 既存チェック待ちの行（batch_size 行たまったら1回のクエリで照合する）と、前回アップロード済みならそのキー
+    candidates: list[tuple[ImportRow, str]] = []
+    pending_phrases: list[tuple[ImportRow, Phrase]] = []
+    # 既存チェックに回したが、まだ登録も失敗もしていない行の行番号とテキスト
+    # （同じファイル内の重複は、先に出てきた行だけを取り込む）
+    open_rows: set[int] = set()
+    open_texts: set[str] = set()
+    last_row = 0
+    started = time.perf_counter()
+
+    def finish(row: ImportRow) -> None:
+        open_rows.discard(row.row_num)
+        open_texts.discard(row.text)
+
+    def completed_offset() -> int:
+        """この行番号までは全部の行の処理が終わっている（それより前に処理中の行がない）"""
+        return min(open_rows) - 1 if open_rows else last_row
+
+    def flush() -> None:
+        """アップロード済みの行をまとめて登録し、処理済みの位置をマニフェストに書く"""
+        nonlocal success_count, error_count
+        if pending_phrases:
+            insert_started = time.perf_counter()
+            try:
+                created = Phrase.objects.bulk_create([phrase for _, phrase in pending_phrases])
+            except Exception as e:
+                print(f"  ❌ Error inserting {len(pending_phrases)} rows: {e}")
+                error_count += len(pending_phrases)
+                for row, phrase in pending_phrases:
+                    # 再開したときは転送し直さずにこのキーで登録をやり直す
+                    manifest.record(row.row_num, row.text, "failed", error=str(e), video_key=phrase.video_key)
+            else:
+                stats.add("insert", time.perf_counter() - insert_started, len(pending_phrases))
+                success_count += len(pending_phrases)
+                for (row, _), phrase in zip(pending_phrases, created):
+                    manifest.record(row.row_num, row.text, "inserted", id=phrase.pk)
+                # bulk_create では post_save が送られないので、カタログ件数のキャッシュはここで破棄する
+                get_cache().invalidate(CATALOG_PHRASE_COUNT_KEY)
+            for row, _ in pending_phrases:
+                finish(row)
+            pending_phrases.clear()
+        manifest.complete(completed_offset())
+        manifest.sync()
+
+    def add_phrase(row: ImportRow, video_key: str) -> None:
+        pending_phrases.append(
+            (row, Phrase(text=row.text, meaning=row.meaning, topic=row.topic, video_key=video_key))
+        )
+        if len(pending_phrases) >= batch_size:
+            flush()
+
+    def collect(done_futures) -> None:
+        nonlocal error_count
+        for future in done_futures:
+            row = in_flight.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Row {row.row_num}: ❌ Error: {e}")
+                manifest.record(row.row_num, row.text, "failed", error=str(e))
+                error_count += 1
+                finish(row)
+                continue
+            stats.add("connect", result.connect_seconds)
+            stats.add("transfer", result.transfer_seconds)
+            stats.bytes += result.bytes
+            print(
+                f"Row {row.row_num}: ⬆️  {result.video_key} "
+                f"({result.bytes / (1024 * 1024):.2f} MB in {result.transfer_seconds:.1f}s)"
             )
-
-            print(f"  ✅ Created: Phrase ID {phrase.id}")
-            success_count += 1
-
-        except Exception as e:
-            print(f"  ❌ Error: {str(e)}")
-            error_count += 1
-            continue
+            manifest.record(row.row_num, row.text, "uploaded", video_key=result.video_key, bytes=result.bytes)
+            add_phrase(row, result.video_key)
+
+    def submit_candidates() -> None:
+        """既存チェック待ちの行を1回のクエリで照合し、新しい行だけ転送（アップロード済みなら登録）に回す"""
+        nonlocal skip_count, reused_uploads
+        existing: set[str] = set()
+        if skip_existing:
+            texts = {row.text for row, _ in candidates}
+            existing = set(Phrase.objects.filter(text__in=texts).values_list("text", flat=True))
+        for row, video_key in candidates:
+            if skip_existing and (row.text in existing or row.text in open_texts):
+                print(f"Row {row.row_num}: ⏭️  Skipped: Already exists")
+                skip_count += 1
+                open_rows.discard(row.row_num)
+                continue
+            open_texts.add(row.text)
+            if video_key:
+                # アップロード済みで登録前に止まった行は、転送し直さずに登録だけ行う
+                reused_uploads += 1
+                add_phrase(row, video_key)
+                continue
+            in_flight[executor.submit(transfer_video, row)] = row
+
+            # ファイルを先読みしすぎないよう、処理中の行数を制限する
+            if len(in_flight) >= workers * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+        candidates.clear()
+
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="import") as executor:
+        for row_num, values in read_rows(csv_path, file_format, engine):
+            last_row = row_num
+            if values is None:
+                print(f"Row {row_num}: ❌ Skipped: Invalid JSON")
+                error_count += 1
+                continue
+            text = values['text']
+            topic = values['topic'].lower()
+
+            # バリデーション
+            if not all(values.values()):
+                print(f"Row {row_num}: ❌ Skipped: Missing required fields")
+                error_count += 1
+                continue
+
+            # トピックのバリデーション
+            if topic not in valid_topics:
+                print(f"Row {row_num}: ❌ Skipped: Invalid topic '{topic}'. Valid topics: {', '.join(valid_topics)}")
+                error_count += 1
+                continue
+
+            recorded = manifest.get(row_num, text)
+            if recorded.get("state") in ("completed", "inserted"):
+                # 前回処理済みの行は既存チェックのログも出さずに飛ばす
+                resumed_count += 1
+                continue
+
+            row = ImportRow(row_num, text, values['meaning'], topic, values['video_url'])
+            open_rows.add(row_num)
+            candidates.append((row, recorded.get("video_key", "")))
+            if len(candidates) >= batch_size:
+                submit_candidates()
+
+        submit_candidates()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(done)
+    flush()
+    manifest.close()
 
     print("\n" + "=" * 60)
     print("Import completed!")
     print(f"  ✅ Success: {success_count}")
     print(f"  ⏭️  Skipped: {skip_count}")
+    if resume:
+        print(f"  ♻️  Resumed: {resumed_count} already processed, {reused_uploads} inserted from earlier uploads")
     print(f"  ❌ Errors:  {error_count}")
-    print(f"  📊 Total:   {success_count + skip_count + error_count}")
+    print(f"  📊 Total:   {success_count + skip_count + resumed_count + error_count}")
+    print()
+    stats.report(time.perf_counter() - started)
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python import_phrases.py <csv_file>")
-        print("\nCSV format:")
-        print("text,meaning,topic,video_url")
-        print('"Hello, how are you?","こんにちは、お元気ですか？",daily,https://example.com/video1.mp4')
-        sys.exit(1)
-
-    csv_path = sys.argv[1]
-    import_csv(csv_path)
+    parser = argparse.ArgumentParser(
+        description="CSV / JSONL からフレーズを一括インポートする",
+        epilog=(
+            "CSV format:\n"
+            "text,meaning,topic,video_url\n"
+            '"Hello, how are you?","こんにちは、お元気ですか？",daily,https://example.com/video1.mp4\n'
+            "\n"
+            "JSONL format:\n"
+            '{"text": "Hello, how are you?", "meaning": "こんにちは、お元気ですか？", '
+            '"topic": "daily", "video_url": "https://example.com/video1.mp4"}'
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("csv_file")
+    parser.add_argument("--workers", type=int, default=8, help="同時にダウンロード・アップロードする動画の数")
+    parser.add_argument("--batch-size", type=int, default=100, help="まとめて登録する行数")
+    parser.add_argument("--resume", action="store_true", help="マニフェストを読み込んで前回の続きから処理する")
+    parser.add_argument("--manifest", default=None, help="マニフェストのパス（省略時は <CSV>.manifest.jsonl）")
+    parser.add_argument("--format", choices=["auto", "csv", "jsonl"], default="auto", help="入力の形式（autoは拡張子で判定）")
+    parser.add_argument(
+        "--engine", choices=["csv", "pandas"], default="csv", help="CSVの読み込み方法（pandasはインストールが必要）"
+    )
+    args = parser.parse_args()
+
+    import_csv(
+        args.csv_file,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        resume=args.resume,
+        manifest_path=args.manifest,
+        file_format=args.format,
+        engine=args.engine,
+    )
 
 
 if __name__ == "__main__":